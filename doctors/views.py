@@ -24,7 +24,7 @@ class IsAdminUser(permissions.BasePermission):
             return False
         
         # Check if user has admin role
-        return request.user.roles.filter(name='admin').exists()
+        return 'admin' in request.user.role_name_set
 
 class IsVerifiedUser(permissions.BasePermission):
     """
@@ -48,7 +48,7 @@ class IsAdminOrOwnerDoctor(permissions.BasePermission):
             return False
         
         # Allow admin users
-        if request.user.roles.filter(name='admin').exists():
+        if 'admin' in request.user.role_name_set:
             return True
         
         # Allow if user has a doctor profile
@@ -60,7 +60,7 @@ class IsAdminOrOwnerDoctor(permissions.BasePermission):
             return False
         
         # Allow admin users
-        if request.user.roles.filter(name='admin').exists():
+        if 'admin' in request.user.role_name_set:
             return True
         
         # Allow doctors to update their own profile
@@ -76,7 +76,7 @@ class IsPatientUser(permissions.BasePermission):
             return False
         
         # Check if user has patient role
-        return request.user.roles.filter(name='patient').exists() and hasattr(request.user, 'patient')
+        return 'patient' in request.user.role_name_set and hasattr(request.user, 'patient')
         
 class IsDoctorUser(permissions.BasePermission):
     """
@@ -88,7 +88,7 @@ class IsDoctorUser(permissions.BasePermission):
             return False
         
         # Check if user has doctor role
-        return request.user.roles.filter(name='doctor').exists()
+        return 'doctor' in request.user.role_name_set
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated, IsVerifiedUser])
@@ -98,7 +98,7 @@ def add_doctor_profile(request):
     This is separate from the admin pathway and specifically for doctors after registration and verification
     """
     # Check if user has a doctor role
-    if not request.user.roles.filter(name='doctor').exists():
+    if 'doctor' not in request.user.role_name_set:
         return Response(
             {"error": "Only users with doctor role can create a doctor profile"},
             status=status.HTTP_403_FORBIDDEN
@@ -325,12 +325,12 @@ class DoctorViewSet(viewsets.ModelViewSet):
         
     def create(self, request, *args, **kwargs):
         # For verified users creating their own doctor profile
-        if not request.user.roles.filter(name='admin').exists():
+        if 'admin' not in request.user.role_name_set:
             # If this is a regular user (not admin), we need to make some checks
             # and override the user_id with the current user's ID for security
             
             # Check if user has a doctor role
-            if not request.user.roles.filter(name='doctor').exists():
+            if 'doctor' not in request.user.role_name_set:
                 return Response(
                     {"error": "Only users with doctor role can create a doctor profile"},
                     status=status.HTTP_403_FORBIDDEN
@@ -698,7 +698,7 @@ class DoctorViewSet(viewsets.ModelViewSet):
         Endpoint for doctors to view their own profile
         """
         # Check if user has doctor role
-        if not request.user.roles.filter(name='doctor').exists():
+        if 'doctor' not in request.user.role_name_set:
             return Response({
                 'error': 'Only doctors can access this endpoint'
             }, status=status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,102 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.text import slugify
+from django.contrib.postgres.search import SearchQuery
+import django_filters
+
+from .models import Article
+
+
+class ArticleFilter(django_filters.FilterSet):
+    """
+    Query parameter filters for the article list endpoints.
+    Role and visibility rules stay in ArticleViewSet.get_queryset.
+    """
+    SORT_ORDERINGS = {
+        'popular': '-view_count',
+        'newest': '-publish_date',
+        'oldest': 'publish_date',
+    }
+
+    category = django_filters.CharFilter(field_name='category')
+    author_id = django_filters.UUIDFilter(field_name='author_id')
+    featured = django_filters.BooleanFilter(method='filter_featured')
+    visibility = django_filters.CharFilter(field_name='visibility')
+    condition = django_filters.CharFilter(method='filter_condition')
+    date_from = django_filters.DateFilter(field_name='publish_date', lookup_expr='date__gte')
+    date_to = django_filters.DateFilter(field_name='publish_date', lookup_expr='date__lte')
+    sort_by = django_filters.ChoiceFilter(
+        choices=[(value, value) for value in SORT_ORDERINGS],
+        method='filter_sort_by'
+    )
+    search = django_filters.CharFilter(method='filter_search')
+    deep = django_filters.BooleanFilter(method='filter_deep')
+    is_approved = django_filters.BooleanFilter(method='filter_is_approved')
+    is_published = django_filters.BooleanFilter(field_name='is_published')
+    reading_time = django_filters.NumberFilter(field_name='reading_time', lookup_expr='lte')
+
+    class Meta:
+        model = Article
+        fields = []
+
+    def filter_featured(self, queryset, name, value):
+        # featured=false means "don't filter", not "only non-featured"
+        if value:
+            return queryset.filter(is_featured=True)
+        return queryset
+
+    def filter_condition(self, queryset, name, value):
+        # Prefix match on the indexed condition slug, so 'diab' finds 'diabetes'.
+        # A subquery keeps one row per article even when several conditions match.
+        slug = slugify(value)
+        if not slug:
+            return queryset.none()
+        tagged_articles = Article.conditions.through.objects.filter(
+            condition__slug__startswith=slug
+        ).values('article_id')
+        return queryset.filter(pk__in=tagged_articles)
+
+    def filter_sort_by(self, queryset, name, value):
+        return queryset.order_by(self.SORT_ORDERINGS[value])
+
+    def filter_search(self, queryset, name, value):
+        if connection.vendor == 'postgresql':
+            # Single GIN index probe on the trigger-maintained search vector. Every word is
+            # a prefix match so partial words like 'diab' behave as the icontains fallback
+            terms = self.prefix_tsquery(value)
+            if not terms:
+                return queryset.none()
+            return queryset.filter(search_vector=SearchQuery(terms, config='english', search_type='raw'))
+        # Match the short columns first and only scan the large content column when
+        # they match nothing or the client asks for a deep search
+        short_fields_q = (
+            Q(title__icontains=value) |
+            Q(summary__icontains=value) |
+            Q(tags__icontains=value) |
+            Q(related_conditions__icontains=value)
+        )
+        short_fields_match = queryset.filter(short_fields_q)
+        if self.form.cleaned_data.get('deep') or not short_fields_match.exists():
+            return queryset.filter(short_fields_q | Q(content__icontains=value))
+        return short_fields_match
+
+    @staticmethod
+    def prefix_tsquery(value):
+        """
+        Raw tsquery matching every word of value as a prefix, e.g. 'diab care' -> 'diab:* & care:*'.
+        Only word characters are kept, so user input cannot inject tsquery operators.
+        """
+        return ' & '.join(f'{word}:*' for word in re.findall(r'\w+', value))
+
+    def filter_deep(self, queryset, name, value):
+        # Only changes how filter_search treats the content column
+        return queryset
+
+    def filter_is_approved(self, queryset, name, value):
+        # Only admins may filter by approval status
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated and 'admin' in user.role_name_set:
+            return queryset.filter(is_approved=value)
+        return queryset
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from healthcare.models import Article
+
+
+class Command(BaseCommand):
+    help = 'Write buffered article view counts from the cache to the database'
+
+    def handle(self, *args, **options):
+        flushed = Article.flush_pending_views()
+        self.stdout.write(
+            self.style.SUCCESS(f'Flushed {flushed} buffered article views')
+        )
@@ -2,7 +2,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import datetime, timedelta
 from healthcare.models import PatientSubscription, Payment
-from healthcare.pesapal_client import PesapalClient
+from healthcare.pesapal_client import get_pesapal_client
 import logging
 
 logger = logging.getLogger(__name__)
@@ -105,7 +105,7 @@ class Command(BaseCommand):
 
     def sync_payments(self):
         """Sync pending payments with Pesapal"""
-        pesapal_client = PesapalClient()
+        pesapal_client = get_pesapal_client()
         
         # Get payments that are processing or pending with gateway transaction IDs
         pending_payments = Payment.objects.filter(
@@ -130,25 +130,21 @@ class Command(BaseCommand):
                     
                     if payment_status == 'COMPLETED':
                         payment.status = 'completed'
-                        payment.save()
+                        payment.save(update_fields=['status', 'gateway_response', 'updated_at'])
                         
                         # Activate associated subscriptions
-                        subscriptions = payment.subscriptions.all()
-                        for subscription in subscriptions:
-                            if subscription.status == 'pending':
-                                subscription.status = 'active'
-                                subscription.save()
+                        activated = PatientSubscription.activate_for_payment(payment)
                                 
                         self.stdout.write(
                             self.style.SUCCESS(
-                                f'Payment {payment.reference} completed - activated {subscriptions.count()} subscriptions'
+                                f'Payment {payment.reference} completed - activated {activated} subscriptions'
                             )
                         )
                         synced_count += 1
                         
                     elif payment_status in ['FAILED', 'INVALID']:
                         payment.status = 'failed'
-                        payment.save()
+                        payment.save(update_fields=['status', 'gateway_response', 'updated_at'])
                         
                         self.stdout.write(
                             self.style.WARNING(
@@ -180,8 +176,7 @@ class Command(BaseCommand):
     def create_renewal_payment(self, subscription):
         """Create a renewal payment for a subscription"""
         try:
-            import secrets
-            payment_reference = f"REN_{secrets.token_hex(8).upper()}"
+            payment_reference = Payment.generate_reference('REN')
             
             payment = Payment.objects.create(
                 reference=payment_reference,
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:11
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+CREATE_SEARCH_VECTOR_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION healthcare_article_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.summary, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(NEW.tags, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(NEW.related_conditions, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(NEW.content, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER healthcare_article_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, summary, tags, related_conditions, content
+    ON healthcare_article
+    FOR EACH ROW EXECUTE PROCEDURE healthcare_article_search_vector_update();
+    """,
+    # Fire the trigger once for existing rows
+    "UPDATE healthcare_article SET title = title;",
+    "CREATE INDEX healthcare_article_search_vector_gin ON healthcare_article USING gin (search_vector);",
+]
+
+DROP_SEARCH_VECTOR_SQL = [
+    "DROP INDEX IF EXISTS healthcare_article_search_vector_gin;",
+    "DROP TRIGGER IF EXISTS healthcare_article_search_vector_trigger ON healthcare_article;",
+    "DROP FUNCTION IF EXISTS healthcare_article_search_vector_update();",
+]
+
+
+def create_search_vector_trigger(apps, schema_editor):
+    """
+    Keep Article.search_vector up to date and indexed (PostgreSQL only)
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for statement in CREATE_SEARCH_VECTOR_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_search_vector_trigger(apps, schema_editor):
+    """
+    Remove the search vector trigger and index (reverse migration)
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for statement in DROP_SEARCH_VECTOR_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthcare', '0016_referral'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_vector_trigger, drop_search_vector_trigger),
+    ]
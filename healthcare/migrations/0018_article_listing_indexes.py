@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0005_doctor_accepts_referrals_doctor_consultation_modes_and_more'),
+        ('healthcare', '0017_article_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['is_approved', 'is_published', 'visibility', '-publish_date'], name='healthcare__is_appr_f6d856_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['is_approved', 'is_published', '-view_count'], name='healthcare__is_appr_a12c05_idx'),
+        ),
+    ]
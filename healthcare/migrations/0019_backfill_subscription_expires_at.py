@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.db.models import Max
+
+
+def backfill_subscription_expires_at(apps, schema_editor):
+    """
+    Populate Patient.subscription_expires_at from existing active subscriptions
+    """
+    Patient = apps.get_model('users', 'Patient')
+    PatientSubscription = apps.get_model('healthcare', 'PatientSubscription')
+    latest_end_dates = (
+        PatientSubscription.objects.filter(status='active')
+        .values('patient_id')
+        .order_by()
+        .annotate(expires_at=Max('end_date'))
+    )
+    for row in latest_end_dates:
+        Patient.objects.filter(pk=row['patient_id']).update(subscription_expires_at=row['expires_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthcare', '0018_article_listing_indexes'),
+        ('users', '0016_patient_subscription_expires_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_subscription_expires_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:26
+
+import uuid
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def split_related_conditions(apps, schema_editor):
+    """
+    Link existing articles to Condition rows parsed from related_conditions
+    """
+    Article = apps.get_model('healthcare', 'Article')
+    Condition = apps.get_model('healthcare', 'Condition')
+    for article in Article.objects.exclude(related_conditions='').only('id', 'related_conditions'):
+        conditions = []
+        for name in article.related_conditions.split(','):
+            name = name.strip()
+            slug = slugify(name)[:100]
+            if slug:
+                condition, _ = Condition.objects.get_or_create(slug=slug, defaults={'name': name[:100]})
+                conditions.append(condition)
+        article.conditions.set(conditions)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthcare', '0019_backfill_subscription_expires_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Condition',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Condition',
+                'verbose_name_plural': 'Conditions',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='conditions',
+            field=models.ManyToManyField(blank=True, related_name='articles', to='healthcare.condition'),
+        ),
+        migrations.RunPython(split_related_conditions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0005_doctor_accepts_referrals_doctor_consultation_modes_and_more'),
+        ('healthcare', '0020_condition'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['is_featured', 'is_published'], name='healthcare__is_feat_12d127_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['author', 'is_published'], name='healthcare__author__fd94ef_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthcare', '0021_article_featured_author_indexes'),
+        ('users', '0016_patient_subscription_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patientsubscription',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['patient', 'status', 'end_date'], name='patsub_active_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthcare', '0022_patientsubscription_active_index'),
+        ('users', '0016_patient_subscription_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patientsubscription',
+            index=models.Index(fields=['status', 'end_date'], name='patsub_status_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['gateway_transaction_id'], name='payment_gateway_txn_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['-created_at'], name='payment_created_idx'),
+        ),
+    ]
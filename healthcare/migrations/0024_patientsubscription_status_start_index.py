@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healthcare', '0023_payment_subscription_indexes'),
+        ('users', '0016_patient_subscription_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patientsubscription',
+            index=models.Index(fields=['status', 'start_date'], name='patsub_status_start_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0005_doctor_accepts_referrals_doctor_consultation_modes_and_more'),
+        ('healthcare', '0024_patientsubscription_status_start_index'),
+        ('users', '0017_user_name_phone_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', '-appointment_date', '-start_time'], name='appt_patient_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('risk_level', ''), _negated=True), fields=['risk_level'], name='appt_risk_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientsubscription',
+            index=models.Index(fields=['-created_at'], name='patsub_created_idx'),
+        ),
+    ]
@@ -1,8 +1,14 @@
 from django.db import models
 import uuid
 from django.conf import settings
-from datetime import timedelta
+from datetime import date, timedelta
 from django.utils import timezone
+from django.utils.text import slugify
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.postgres.search import SearchVectorField
 
 class HealthCareCategory(models.TextChoices):
     """
@@ -378,6 +384,25 @@ class Appointment(models.Model):
        verbose_name = "Appointment"
        verbose_name_plural = "Appointments"
        ordering = ['-appointment_date', '-start_time']
+       indexes = [
+           # Latest appointment per patient (risk segmentation)
+           models.Index(fields=['patient', '-appointment_date', '-start_time'], name='appt_patient_latest_idx'),
+           # Appointments with a risk level recorded
+           models.Index(fields=['risk_level'], name='appt_risk_level_idx', condition=~models.Q(risk_level='')),
+       ]
+    
+    EXPORT_CACHE_TIMEOUT = 300
+    EXPORT_VERSION_CACHE_KEY = 'appointment_export_version'
+    
+    @classmethod
+    def export_cache_version(cls):
+       """Current version of the cached appointment/consultation report exports"""
+       return cache.get_or_set(cls.EXPORT_VERSION_CACHE_KEY, lambda: uuid.uuid4().hex, None)
+    
+    @classmethod
+    def invalidate_export_cache(cls):
+       """Retire every cached report export by moving to a new version"""
+       cache.set(cls.EXPORT_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
     
     def __str__(self):
        return f"{self.patient.user.get_full_name()} with Dr. {self.doctor.user.get_full_name()} on {self.appointment_date} at {self.start_time}"
@@ -501,6 +526,16 @@ class Consultation(models.Model):
        return f"Consultation for {self.appointment}"
 
 
+@receiver([post_save, post_delete], sender=Appointment)
+@receiver([post_save, post_delete], sender=Consultation)
+def clear_appointment_export_cache(sender, instance, **kwargs):
+    """
+    Drop cached report exports when an appointment or consultation changes.
+    """
+    _ = sender, instance, kwargs
+    Appointment.invalidate_export_cache()
+
+
 class ConsultationChat(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     consultation = models.ForeignKey(Consultation, on_delete=models.CASCADE, related_name='chat_messages')
@@ -635,10 +670,44 @@ class DoctorRating(models.Model):
        verbose_name = "Doctor Rating"
        verbose_name_plural = "Doctor Ratings"
        unique_together = ('doctor', 'patient')
+
+    # How long a doctor's cached average rating stays valid (in seconds)
+    AVERAGE_CACHE_TIMEOUT = 300
       
     def __str__(self):
        return f"{self.patient.user.get_full_name()} rated Dr. {self.doctor.user.get_full_name()} {self.rating} stars"
 
+    @staticmethod
+    def average_cache_key(doctor_id):
+       """Cache key for a doctor's average rating summary"""
+       return f"doctor_rating_average_{doctor_id}"
+
+
+@receiver([post_save, post_delete], sender=DoctorRating)
+def clear_doctor_rating_cache(sender, instance, **kwargs):
+    """
+    Drop the cached average rating whenever one of the doctor's ratings changes.
+    """
+    _ = sender, kwargs
+    cache.delete(DoctorRating.average_cache_key(instance.doctor_id))
+
+
+
+class Condition(models.Model):
+    """
+    Health condition that articles can be tagged with
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100, unique=True)
+
+    class Meta:
+        verbose_name = "Condition"
+        verbose_name_plural = "Conditions"
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
 
 
 class Article(models.Model):
@@ -688,7 +757,11 @@ class Article(models.Model):
     view_count = models.PositiveIntegerField(default=0)
     is_featured = models.BooleanField(default=False)
     related_conditions = models.CharField(max_length=255, blank=True)
+    # Normalized copy of related_conditions, synced on save and used for condition filtering
+    conditions = models.ManyToManyField(Condition, blank=True, related_name='articles')
     reading_time = models.PositiveSmallIntegerField(default=5)
+    # Full-text search document, maintained by a database trigger on PostgreSQL
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -696,10 +769,140 @@ class Article(models.Model):
         verbose_name = "Article"
         verbose_name_plural = "Articles"
         ordering = ['-created_at']
+        indexes = [
+            # Published-article listings filtered by visibility and sorted by date or views
+            models.Index(fields=['is_approved', 'is_published', 'visibility', '-publish_date']),
+            models.Index(fields=['is_approved', 'is_published', '-view_count']),
+            # Featured listings and a doctor's own articles filtered by publish status
+            models.Index(fields=['is_featured', 'is_published']),
+            models.Index(fields=['author', 'is_published']),
+        ]
         
+    # How long cached featured/popular/recent listings stay valid (in seconds)
+    LISTING_CACHE_TIMEOUT = 300
+    LISTING_VERSION_CACHE_KEY = 'article_listing_version'
+
     def __str__(self):
         return self.title
 
+    @classmethod
+    def listing_cache_version(cls):
+        """Current version of the cached article listings, part of every listing cache key"""
+        return cache.get_or_set(cls.LISTING_VERSION_CACHE_KEY, lambda: uuid.uuid4().hex, None)
+
+    @classmethod
+    def invalidate_listing_cache(cls):
+        """Retire every cached article listing by moving to a new version"""
+        cache.set(cls.LISTING_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+    # related_conditions as last synced to the conditions relation; new articles start empty
+    _synced_related_conditions = ''
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Missing when the field was deferred; save() then leaves it (and the relation) alone
+        instance._synced_related_conditions = instance.__dict__.get('related_conditions')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        related_conditions = self.__dict__.get('related_conditions')
+        # Approve/publish style saves don't touch the conditions, so skip the relation sync
+        if (
+            related_conditions is not None
+            and related_conditions != self._synced_related_conditions
+            and (update_fields is None or 'related_conditions' in update_fields)
+        ):
+            self.sync_conditions()
+            self._synced_related_conditions = related_conditions
+
+    def sync_conditions(self):
+        """Point the conditions relation at the entries of the related_conditions string"""
+        conditions = []
+        for name in self.related_conditions.split(','):
+            name = name.strip()
+            slug = slugify(name)[:100]
+            if slug:
+                condition, _ = Condition.objects.get_or_create(slug=slug, defaults={'name': name[:100]})
+                conditions.append(condition)
+        self.conditions.set(conditions)
+
+    @staticmethod
+    def view_count_cache_key(article_id):
+        """Cache key for an article's views not yet written to the database"""
+        return f"article_pending_views_{article_id}"
+
+    @classmethod
+    def record_view(cls, article_id):
+        """
+        Count one view of an article.
+
+        With ARTICLE_VIEW_FLUSH_THRESHOLD above 1, views are counted in the cache
+        and written to the database in batches of that size. Returns the number of
+        views not reflected in an instance loaded before this call.
+        """
+        threshold = settings.ARTICLE_VIEW_FLUSH_THRESHOLD
+        if threshold <= 1:
+            cls.objects.filter(pk=article_id).update(view_count=models.F('view_count') + 1)
+            return 1
+
+        cache_key = cls.view_count_cache_key(article_id)
+        cache.add(cache_key, 0, None)
+        pending = cache.incr(cache_key)
+        if pending >= threshold:
+            # Concurrent requests or a flush may go for the same views; each writes only what it claimed
+            claimed = cls._claim_pending_views(cache_key, pending)
+            if claimed:
+                cls.objects.filter(pk=article_id).update(view_count=models.F('view_count') + claimed)
+        return pending
+
+    @staticmethod
+    def _claim_pending_views(cache_key, count):
+        """
+        Take up to count buffered views off an article's counter and return how many
+        were taken. decr is atomic, so a claim that overdraws the counter (because
+        another request claimed the same views first) keeps only what was there and
+        gives the rest back; the counter never ends up below zero.
+        """
+        remaining = cache.decr(cache_key, count)
+        if remaining >= 0:
+            return count
+        claimed = max(0, count + remaining)
+        cache.incr(cache_key, count - claimed)
+        return claimed
+
+    @classmethod
+    def add_pending_views(cls, articles):
+        """
+        Add views still buffered in the cache to the view_count of loaded articles,
+        using a single cache round trip.
+        """
+        if settings.ARTICLE_VIEW_FLUSH_THRESHOLD <= 1:
+            return
+        keys = {cls.view_count_cache_key(article.pk): article for article in articles}
+        for cache_key, pending in cache.get_many(list(keys)).items():
+            keys[cache_key].view_count += pending
+
+    @classmethod
+    def flush_pending_views(cls):
+        """
+        Write every buffered article view to the database. Returns the number of views written.
+        """
+        keys = {
+            cls.view_count_cache_key(article_id): article_id
+            for article_id in cls.objects.values_list('pk', flat=True)
+        }
+        flushed = 0
+        for cache_key, pending in cache.get_many(list(keys)).items():
+            if pending > 0:
+                claimed = cls._claim_pending_views(cache_key, pending)
+                if claimed:
+                    cls.objects.filter(pk=keys[cache_key]).update(view_count=models.F('view_count') + claimed)
+                    flushed += claimed
+        return flushed
+
 
 class ArticleComment(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -726,6 +929,16 @@ class ArticleComment(models.Model):
         return f"Comment by {self.user.get_full_name()} on {self.article.title}"
 
 
+@receiver([post_save, post_delete], sender=Article)
+@receiver([post_save, post_delete], sender=ArticleComment)
+def clear_article_listing_cache(sender, instance, **kwargs):
+    """
+    Drop cached article listings when an article or its comment count changes.
+    """
+    _ = sender, instance, kwargs
+    Article.invalidate_listing_cache()
+
+
 class ArticleCommentLike(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     comment = models.ForeignKey(ArticleComment, on_delete=models.CASCADE, related_name='likes')
@@ -800,10 +1013,21 @@ class Payment(models.Model):
         verbose_name = "Payment"
         verbose_name_plural = "Payments"
         ordering = ['-created_at']
+        indexes = [
+            # IPN and callback lookups by Pesapal order tracking ID
+            models.Index(fields=['gateway_transaction_id'], name='payment_gateway_txn_idx'),
+            # Newest-first payment lists
+            models.Index(fields=['-created_at'], name='payment_created_idx'),
+        ]
     
     def __str__(self):
         return f"Payment {self.reference} - {self.amount} {self.currency}"
 
+    @staticmethod
+    def generate_reference(prefix):
+        """Unique payment reference such as PAY_3F2A9C1B7D4E6A0B"""
+        return f"{prefix}_{uuid.uuid4().hex[:16].upper()}"
+
 
 class PatientSubscription(models.Model):
     """
@@ -831,7 +1055,24 @@ class PatientSubscription(models.Model):
         verbose_name = "Patient Subscription"
         verbose_name_plural = "Patient Subscriptions"
         ordering = ['-created_at']
+        indexes = [
+            # Active-subscription lookups per patient
+            models.Index(
+                fields=['patient', 'status', 'end_date'],
+                name='patsub_active_idx',
+                condition=models.Q(status='active')
+            ),
+            # Expiry sweeps and dashboard counts by status and end date
+            models.Index(fields=['status', 'end_date'], name='patsub_status_end_idx'),
+            # Dashboard count of subscriptions started this month
+            models.Index(fields=['status', 'start_date'], name='patsub_status_start_idx'),
+            # Payment tracker list, newest first
+            models.Index(fields=['-created_at'], name='patsub_created_idx'),
+        ]
     
+    DASHBOARD_CACHE_TIMEOUT = 60
+    DASHBOARD_CACHE_KEY = 'subscription_dashboard:{day}'
+
     def __str__(self):
         return f"{self.patient.user.get_full_name()} - {self.package.name}"
     
@@ -845,6 +1086,54 @@ class PatientSubscription(models.Model):
     def consultations_remaining(self):
         return max(0, self.package.consultation_limit - self.consultations_used)
 
+    @classmethod
+    def dashboard_cache_key(cls, day):
+        """Cache key for the payment tracker dashboard metrics of a given day"""
+        return cls.DASHBOARD_CACHE_KEY.format(day=day.isoformat())
+
+    @classmethod
+    def invalidate_dashboard_cache(cls):
+        """Drop today's cached dashboard metrics"""
+        cache.delete(cls.dashboard_cache_key(date.today()))
+
+    @classmethod
+    def sync_expiry(cls, patients):
+        """
+        Copy the latest active end date onto subscription_expires_at for the given patients.
+        Bulk update() calls skip post_save, so they must call this themselves.
+        """
+        latest_end_date = cls.objects.filter(
+            patient_id=OuterRef('pk'),
+            status='active'
+        ).order_by('-end_date').values('end_date')[:1]
+        patients.update(subscription_expires_at=Subquery(latest_end_date))
+
+    @classmethod
+    def activate_for_payment(cls, payment):
+        """
+        Activate the pending subscriptions paid for by a payment in a single UPDATE.
+        """
+        from users.models import Patient
+        activated = cls.objects.filter(payment=payment, status='pending').update(
+            status='active',
+            updated_at=timezone.now()
+        )
+        if activated:
+            cls.sync_expiry(Patient.objects.filter(subscriptions__payment=payment))
+            cls.invalidate_dashboard_cache()
+        return activated
+
+
+@receiver([post_save, post_delete], sender=PatientSubscription)
+def sync_patient_subscription_expiry(sender, instance, **kwargs):
+    """
+    Keep Patient.subscription_expires_at in line with the patient's active subscriptions.
+    """
+    _ = sender, kwargs
+    from users.models import Patient
+    PatientSubscription.sync_expiry(Patient.objects.filter(pk=instance.patient_id))
+    PatientSubscription.invalidate_dashboard_cache()
+
 
 class DoctorAvailability(models.Model):
     """
@@ -1,6 +1,7 @@
 import requests
-import json
 from datetime import datetime, timedelta
+import threading
+from requests.adapters import HTTPAdapter
 from typing import Dict, Optional, Any
 from django.conf import settings
 from django.core.cache import cache
@@ -15,10 +16,16 @@ class PesapalClient:
     Supports both sandbox and production environments.
     """
     
+    # Tokens expire after 5 minutes; share them through the cache for 4 so every
+    # worker can reuse one instead of authenticating per payment call
+    TOKEN_CACHE_KEY = 'pesapal_access_token'
+    TOKEN_CACHE_TIMEOUT = 240
+    
     def __init__(self):
         self.consumer_key = settings.PESAPAL_CONSUMER_KEY
         self.consumer_secret = settings.PESAPAL_CONSUMER_SECRET
         self.sandbox = getattr(settings, 'PESAPAL_SANDBOX', True)
+        self.timeout = getattr(settings, 'PESAPAL_TIMEOUT', (3.05, 10))
         
         if self.sandbox:
             self.base_url = "https://cybqa.pesapal.com/pesapalv3"
@@ -27,6 +34,10 @@ class PesapalClient:
             
         self.access_token = None
         self.token_expiry = None
+        
+        # Keep connections to Pesapal alive between calls instead of a new TLS handshake each time
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=50))
     
     def _get_headers(self, include_auth: bool = True) -> Dict[str, str]:
         """Get request headers with optional authentication."""
@@ -40,20 +51,29 @@ class PesapalClient:
             
         return headers
     
+    def _has_valid_token(self) -> bool:
+        """Whether a usable token is held by this client or cached by another worker."""
+        if self.access_token and self.token_expiry and datetime.now() < self.token_expiry:
+            return True
+        cached_token = cache.get(self.TOKEN_CACHE_KEY)
+        if cached_token:
+            self.access_token, self.token_expiry = cached_token
+            return True
+        return False
+    
     def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None, 
                      include_auth: bool = True) -> Dict[str, Any]:
         """Make HTTP request to Pesapal API with error handling."""
         url = f"{self.base_url}{endpoint}"
         headers = self._get_headers(include_auth)
 
-        print("This is pesapal auth url:", url)
+        logger.debug("Pesapal %s %s", method.upper(), endpoint)
         
         try:
             if method.upper() == "GET":
-                response = requests.get(url, headers=headers, params=data)
+                response = self.session.get(url, headers=headers, params=data, timeout=self.timeout)
             else:
-                print("THis is the data: ", data)
-                response = requests.post(url, headers=headers, json=data)
+                response = self.session.post(url, headers=headers, json=data, timeout=self.timeout)
             
             response.raise_for_status()
             return response.json()
@@ -71,33 +91,25 @@ class PesapalClient:
     def authenticate(self) -> bool:
         """
         Authenticate with Pesapal API and get access token.
-        Tokens are cached for 4 minutes to avoid frequent re-authentication.
+        Always requests a fresh token, replacing the cached one; callers use
+        _has_valid_token() first and only come here when it is missing or rejected.
         """
-        # Check cached token first
-        # cached_token = cache.get('pesapal_access_token')
-        # if cached_token:
-        #     self.access_token = cached_token
-        #     return True
-        
         auth_data = {
             "consumer_key": self.consumer_key,
             "consumer_secret": self.consumer_secret
         }
-
-        print("This is the Auth data: ", auth_data)
         
         response = self._make_request("POST", "/api/Auth/RequestToken", auth_data, include_auth=False)
-
-        print("THis is the response: ", response)
         
         if response.get("error"):
             logger.error(f"Pesapal authentication failed: {response['error']}")
             return False
         
         if "token" in response:
-            print("We have got the response token.....")
             self.access_token = response["token"]
+            self.token_expiry = datetime.now() + timedelta(seconds=self.TOKEN_CACHE_TIMEOUT)
             # Cache token for 4 minutes (tokens expire after 5 minutes)
+            cache.set(self.TOKEN_CACHE_KEY, (self.access_token, self.token_expiry), self.TOKEN_CACHE_TIMEOUT)
             logger.info("Pesapal authentication successful")
             return True
         
@@ -120,22 +132,18 @@ class PesapalClient:
                 - account_number: Optional account number for subscriptions
                 - subscription_details: Optional subscription configuration
         """
-        if not self.access_token:
+        if not self._has_valid_token():
             if not self.authenticate():
                 return {"error": {"message": "Authentication failed"}}
         
-        print("🔸 Sending order data to Pesapal:")
-        print(json.dumps(order_data, indent=2))
-
+        logger.debug("Submitting Pesapal order %s", order_data.get("id"))
         response = self._make_request("POST", "/api/Transactions/SubmitOrderRequest", order_data)
+        logger.debug("Pesapal order %s tracking ID: %s", order_data.get("id"), response.get("order_tracking_id"))
         
-        print("🔹 Pesapal response:")
-        print(json.dumps(response, indent=2))
-        
-        # # If authentication expired, retry once
-        # if "error" in response and "unauthorized" in str(response["error"]).lower():
-        #     if self.authenticate():
-        #         response = self._make_request("POST", "/api/Transactions/SubmitOrderRequest", order_data)
+        # If authentication expired, retry once
+        if "error" in response and "unauthorized" in str(response["error"]).lower():
+            if self.authenticate():
+                response = self._make_request("POST", "/api/Transactions/SubmitOrderRequest", order_data)
         
         return response
 
@@ -147,7 +155,7 @@ class PesapalClient:
         Args:
             order_tracking_id: Pesapal order tracking ID
         """
-        if not self.access_token and not self.authenticate():
+        if not self._has_valid_token() and not self.authenticate():
             return {"error": {"message": "Authentication failed"}}
         
         params = {"orderTrackingId": order_tracking_id}
@@ -168,7 +176,7 @@ class PesapalClient:
             ipn_url: Your IPN endpoint URL
             notification_type: "GET" or "POST"
         """
-        if not self.access_token and not self.authenticate():
+        if not self._has_valid_token() and not self.authenticate():
             return {"error": {"message": "Authentication failed"}}
         
         ipn_data = {
@@ -187,7 +195,7 @@ class PesapalClient:
     
     def get_ipn_list(self) -> Dict[str, Any]:
         """Get list of registered IPN URLs."""
-        if not self.access_token and not self.authenticate():
+        if not self._has_valid_token() and not self.authenticate():
             return {"error": {"message": "Authentication failed"}}
         
         response = self._make_request("GET", "/api/URLSetup/GetIpnList")
@@ -251,4 +259,20 @@ class PesapalClient:
             
             order_data["subscription_details"] = subscription_details
         
-        return self.submit_order_request(order_data)
\ No newline at end of file
+        return self.submit_order_request(order_data)
+
+
+_local = threading.local()
+
+
+def get_pesapal_client() -> PesapalClient:
+    """
+    Pesapal client reused across requests served by the same thread, so its connection
+    pool is kept warm. requests.Session and the client's token fields are not safe to
+    share between gunicorn threads, so each thread gets its own client; the access
+    token is still shared through the cache.
+    """
+    client = getattr(_local, 'client', None)
+    if client is None:
+        client = _local.client = PesapalClient()
+    return client
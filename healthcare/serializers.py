@@ -380,7 +380,7 @@ class ConsultationChatSerializer(serializers.ModelSerializer):
     
     def get_sender_role(self, obj):
         # Get user role based on roles many-to-many field
-        roles = obj.sender.roles.all().values_list('name', flat=True)
+        roles = obj.sender.role_name_set
         if 'doctor' in roles:
             return 'doctor'
         elif 'patient' in roles:
@@ -392,7 +392,7 @@ class ConsultationChatSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         # Set is_doctor flag based on user role
         sender = validated_data.get('sender')
-        is_doctor = sender.roles.filter(name='doctor').exists()
+        is_doctor = 'doctor' in sender.role_name_set
         
         # Create message with proper is_doctor flag
         message = ConsultationChat.objects.create(
@@ -544,7 +544,8 @@ class ArticleCommentSerializer(serializers.ModelSerializer):
      
      def get_user_role(self, obj):
          # Get user role based on roles many-to-many field
-         roles = obj.user.roles.all().values_list('name', flat=True)
+         # Iterate roles.all() so prefetched roles are used
+         roles = {role.name for role in obj.user.roles.all()}
          if 'doctor' in roles:
              return 'doctor'
          elif 'patient' in roles:
@@ -563,7 +564,7 @@ class ArticleCommentSerializer(serializers.ModelSerializer):
      def create(self, validated_data):
          # Set is_doctor flag based on user role
          user = validated_data.get('user')
-         is_doctor = user.roles.filter(name='doctor').exists()
+         is_doctor = 'doctor' in user.role_name_set
          
          # Create comment with proper is_doctor flag
          comment = ArticleComment.objects.create(
@@ -593,7 +594,8 @@ class ArticleCommentReplySerializer(serializers.ModelSerializer):
      
      def get_user_role(self, obj):
          # Get user role based on roles many-to-many field
-         roles = obj.user.roles.all().values_list('name', flat=True)
+         # Iterate roles.all() so prefetched roles are used
+         roles = {role.name for role in obj.user.roles.all()}
          if 'doctor' in roles:
              return 'doctor'
          elif 'patient' in roles:
@@ -622,6 +624,9 @@ class ArticleSerializer(serializers.ModelSerializer):
      comments_count = serializers.SerializerMethodField(read_only=True)
      category_display = serializers.SerializerMethodField(read_only=True)
      
+     # Built once rather than on every serialized article
+     CATEGORY_LABELS = dict(Article._meta.get_field('category').choices)
+     
      class Meta:
          model = Article
          fields = [
@@ -655,10 +660,21 @@ class ArticleSerializer(serializers.ModelSerializer):
          return None
      
      def get_comments_count(self, obj):
+         # Use the count annotated by ArticleViewSet.get_queryset when available
+         if hasattr(obj, 'comments_total'):
+             return obj.comments_total
          return obj.comments.count()  # This returns an integer that will be converted to a string in the JSON response
      
      def get_category_display(self, obj):
-         return dict(obj._meta.get_field('category').choices).get(obj.category, obj.category)
+         return self.CATEGORY_LABELS.get(obj.category, obj.category)
+
+
+class ArticleListSerializer(ArticleSerializer):
+     """
+     Article serializer for list endpoints; leaves out the full article content
+     """
+     class Meta(ArticleSerializer.Meta):
+         fields = [field for field in ArticleSerializer.Meta.fields if field != 'content']
 
 
 class PackageSerializer(serializers.ModelSerializer):
@@ -689,6 +705,14 @@ class PaymentSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at', 'gateway_response']
 
 
+class PaymentListSerializer(PaymentSerializer):
+    """
+    Payment serializer for list endpoints; leaves out the raw gateway response
+    """
+    class Meta(PaymentSerializer.Meta):
+        fields = [field for field in PaymentSerializer.Meta.fields if field != 'gateway_response']
+
+
 class PatientSubscriptionSerializer(serializers.ModelSerializer):
     """
     Serializer for PatientSubscription model
@@ -717,6 +741,22 @@ class PatientSubscriptionSerializer(serializers.ModelSerializer):
         return obj.package.name
 
 
+class PatientSubscriptionTrackerSerializer(PatientSubscriptionSerializer):
+    """
+    Subscription serializer for the payment tracker list; only the columns the table shows
+    """
+    # Annotated on the queryset by the payment tracker
+    patient_name = serializers.CharField(source='full_name', read_only=True)
+    status_display = serializers.CharField(read_only=True)
+    phone_number = serializers.CharField(source='patient.user.phone_number', read_only=True)
+    
+    class Meta(PatientSubscriptionSerializer.Meta):
+        fields = [
+            'id', 'patient_name', 'package_name', 'phone_number', 'status', 'status_display',
+            'start_date', 'end_date', 'consultations_used', 'consultations_remaining'
+        ]
+
+
 class DoctorAvailabilitySerializer(serializers.ModelSerializer):
     """
     Serializer for DoctorAvailability model
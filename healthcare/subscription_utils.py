@@ -3,8 +3,7 @@ from decimal import Decimal
 from django.utils import timezone
 from django.db import transaction
 from .models import PatientSubscription, Package, Payment
-from .pesapal_client import PesapalClient
-import secrets
+from .pesapal_client import get_pesapal_client
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,7 +15,7 @@ class SubscriptionManager:
     """
     
     def __init__(self):
-        self.pesapal_client = PesapalClient()
+        self.pesapal_client = get_pesapal_client()
     
     def calculate_prorated_amount(self, current_subscription, new_package):
         """
@@ -107,7 +106,7 @@ class SubscriptionManager:
                 }
             
             # Create payment for upgrade
-            payment_reference = f"UPG_{secrets.token_hex(8).upper()}"
+            payment_reference = Payment.generate_reference('UPG')
             
             with transaction.atomic():
                 payment = Payment.objects.create(
@@ -244,7 +243,7 @@ class SubscriptionManager:
         """
         try:
             # Create payment for renewal
-            payment_reference = f"REN_{secrets.token_hex(8).upper()}"
+            payment_reference = Payment.generate_reference('REN')
             
             with transaction.atomic():
                 payment = Payment.objects.create(
@@ -1,2 +1,1326 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from rest_framework.test import APIClient
+from rest_framework import status
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from unittest import skipUnless
+from unittest.mock import patch
+from users.models import Role, Patient
+from doctors.models import Doctor, Education
+from healthcare.models import (
+    DoctorRating, Article, ArticleComment, Package, PatientSubscription, Payment, Appointment,
+    Consultation, HealthCare
+)
+from healthcare.filters import ArticleFilter
+from healthcare.pesapal_client import PesapalClient, get_pesapal_client
+from datetime import date, timedelta
+import threading
 
+User = get_user_model()
+
+
+class DoctorRatingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.doctor_role, _ = Role.objects.get_or_create(name='doctor')
+        self.patient_role, _ = Role.objects.get_or_create(name='patient')
+
+        # Create doctor
+        self.doctor_user = User.objects.create_user(
+            username='doctor',
+            email='doctor@example.com',
+            password='password123'
+        )
+        self.doctor_user.roles.add(self.doctor_role)
+        education = Education.objects.create(
+            level_of_education='MD',
+            field='Medicine',
+            institution='Test University'
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.doctor_user,
+            specialty='General',
+            license_number='LIC123456',
+            education=education
+        )
+
+        # Create two patients (the patient role signal creates their profiles)
+        self.patients = []
+        for index in range(2):
+            user = User.objects.create_user(
+                username=f'patient{index}',
+                email=f'patient{index}@example.com',
+                password='password123'
+            )
+            user.roles.add(self.patient_role)
+            self.patients.append(Patient.objects.get(user=user))
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.doctor_user)
+        self.url = reverse('doctor-rating-doctor-average-rating')
+
+    def test_doctor_average_rating(self):
+        """
+        Test the average rating summary and that it refreshes when ratings change
+        """
+        DoctorRating.objects.create(doctor=self.doctor, patient=self.patients[0], rating=4)
+
+        response = self.client.get(self.url, {'doctor_id': str(self.doctor.id)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['average_rating'], 4)
+        self.assertEqual(response.data['total_ratings'], 1)
+
+        # A new rating invalidates the cached summary
+        DoctorRating.objects.create(doctor=self.doctor, patient=self.patients[1], rating=2)
+        response = self.client.get(self.url, {'doctor_id': str(self.doctor.id)})
+        self.assertEqual(response.data['average_rating'], 3)
+        self.assertEqual(response.data['total_ratings'], 2)
+
+    def test_doctor_average_rating_invalid_id(self):
+        """
+        Test that a malformed doctor_id is rejected
+        """
+        response = self.client.get(self.url, {'doctor_id': 'not-a-uuid'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ArticleTests(TestCase):
+    def setUp(self):
+        self.doctor_role, _ = Role.objects.get_or_create(name='doctor')
+        self.patient_role, _ = Role.objects.get_or_create(name='patient')
+
+        # Create doctor
+        self.doctor_user = User.objects.create_user(
+            username='doctor',
+            email='doctor@example.com',
+            password='password123'
+        )
+        self.doctor_user.roles.add(self.doctor_role)
+        education = Education.objects.create(
+            level_of_education='MD',
+            field='Medicine',
+            institution='Test University'
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.doctor_user,
+            specialty='General',
+            license_number='LIC123456',
+            education=education
+        )
+
+        # Create patient (the patient role signal creates the profile)
+        self.patient_user = User.objects.create_user(
+            username='patient',
+            email='patient@example.com',
+            password='password123'
+        )
+        self.patient_user.roles.add(self.patient_role)
+        self.patient = Patient.objects.get(user=self.patient_user)
+
+        # Create one published article per visibility level plus a draft
+        self.articles = {}
+        for visibility in ['public', 'subscribers', 'private']:
+            self.articles[visibility] = Article.objects.create(
+                title=f'{visibility.title()} article',
+                content='Article content',
+                summary='Article summary',
+                author=self.doctor,
+                category='general',
+                visibility=visibility,
+                is_approved=True,
+                is_published=True
+            )
+        self.articles['draft'] = Article.objects.create(
+            title='Draft article',
+            content='Draft content',
+            author=self.doctor,
+            category='general'
+        )
+
+        self.client = APIClient()
+
+    def subscribe_patient(self):
+        package = Package.objects.create(
+            name='Basic',
+            description='Basic package',
+            price=100,
+            duration_days=30,
+            consultation_limit=2
+        )
+        PatientSubscription.objects.create(
+            patient=self.patient,
+            package=package,
+            status='active',
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=30)
+        )
+        # Each real request loads a fresh user; drop the cached patient profile
+        self.patient_user.refresh_from_db()
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.subscription_expires_at, date.today() + timedelta(days=30))
+
+    def test_patient_list_visibility(self):
+        """
+        Test that patients only see subscriber articles with an active subscription
+        """
+        self.client.force_authenticate(user=self.patient_user)
+        url = reverse('article-list')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({article['title'] for article in response.data}, {'Public article'})
+
+        self.subscribe_patient()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {article['title'] for article in response.data},
+            {'Public article', 'Subscribers article'}
+        )
+
+    def test_patient_retrieve_visibility(self):
+        """
+        Test detail access rules for patients
+        """
+        self.client.force_authenticate(user=self.patient_user)
+
+        url = reverse('article-detail', kwargs={'pk': self.articles['subscribers'].id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        url = reverse('article-detail', kwargs={'pk': self.articles['private'].id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        url = reverse('article-detail', kwargs={'pk': self.articles['draft'].id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.subscribe_patient()
+        url = reverse('article-detail', kwargs={'pk': self.articles['subscribers'].id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_not_modified(self):
+        """
+        Test that article detail answers 304 until the article changes
+        """
+        self.client.force_authenticate(user=self.patient_user)
+        article = self.articles['public']
+        url = reverse('article-detail', kwargs={'pk': article.id})
+
+        response = self.client.get(url)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # Revalidated views are still counted
+        article.refresh_from_db()
+        self.assertEqual(article.view_count, 2)
+
+        article.title = 'Updated article'
+        article.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['title'], 'Updated article')
+
+    def test_retrieve_increments_view_count(self):
+        """
+        Test that viewing an article increments its view count
+        """
+        self.client.force_authenticate(user=self.patient_user)
+        article = self.articles['public']
+        url = reverse('article-detail', kwargs={'pk': article.id})
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['view_count'], 1)
+
+        self.client.get(url)
+        article.refresh_from_db()
+        self.assertEqual(article.view_count, 2)
+
+    @override_settings(ARTICLE_VIEW_FLUSH_THRESHOLD=3)
+    def test_buffered_view_count(self):
+        """
+        Test that buffered views are written to the database in batches
+        """
+        cache.clear()
+        article = self.articles['public']
+
+        for _ in range(4):
+            Article.record_view(article.pk)
+        article.refresh_from_db()
+        self.assertEqual(article.view_count, 3)
+
+        # Lists include the view that is still buffered
+        self.client.force_authenticate(user=self.patient_user)
+        response = self.client.get(reverse('article-list'))
+        self.assertEqual(response.data[0]['view_count'], 4)
+
+        self.assertEqual(Article.flush_pending_views(), 1)
+        article.refresh_from_db()
+        self.assertEqual(article.view_count, 4)
+
+    def test_claim_pending_views_never_overdraws(self):
+        """
+        Test that claiming more buffered views than remain takes only what is left
+        """
+        cache_key = Article.view_count_cache_key(self.articles['public'].pk)
+        cache.set(cache_key, 2, None)
+        # A second claimer for views another request already took gets nothing
+        self.assertEqual(Article._claim_pending_views(cache_key, 5), 2)
+        self.assertEqual(Article._claim_pending_views(cache_key, 2), 0)
+        self.assertEqual(cache.get(cache_key), 0)
+
+    def test_featured_listing_cache(self):
+        """
+        Test that featured listings are cached until an article changes
+        """
+        self.client.force_authenticate(user=self.patient_user)
+        url = reverse('article-featured')
+        article = self.articles['public']
+        article.is_featured = True
+        article.save()
+
+        response = self.client.get(url)
+        self.assertEqual([item['title'] for item in response.data], ['Public article'])
+        self.assertNotIn('content', response.data[0])
+
+        # Writes that bypass save() are not seen until the cache is invalidated
+        Article.objects.filter(pk=article.pk).update(title='Renamed article')
+        response = self.client.get(url)
+        self.assertEqual([item['title'] for item in response.data], ['Public article'])
+
+        article.refresh_from_db()
+        article.save()
+        response = self.client.get(url)
+        self.assertEqual([item['title'] for item in response.data], ['Renamed article'])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Out-of-range limits are clamped rather than failing
+        response = self.client.get(url, {'limit': -1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+
+    def test_listing_etag_follows_data(self):
+        """
+        Test that a listing rebuilt after its cache entry expires gets a new ETag when its data changed
+        """
+        self.client.force_authenticate(user=self.patient_user)
+        url = reverse('article-popular')
+        article = self.articles['public']
+
+        # A zero timeout makes every request rebuild, as after the cache entry expires
+        with patch.object(Article, 'LISTING_CACHE_TIMEOUT', 0):
+            etag = self.client.get(url)['ETag']
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+            # View counts are written without save(), so the listing version stays the same
+            Article.objects.filter(pk=article.pk).update(view_count=10)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_query_filters(self):
+        """
+        Test the article list query parameter filters
+        """
+        self.client.force_authenticate(user=self.doctor_user)
+        url = reverse('article-list')
+        self.articles['public'].is_featured = True
+        self.articles['public'].reading_time = 3
+        self.articles['public'].related_conditions = 'diabetes, hypertension'
+        self.articles['public'].save()
+
+        response = self.client.get(url, {'featured': 'true'})
+        self.assertEqual([article['title'] for article in response.data], ['Public article'])
+
+        response = self.client.get(url, {'featured': 'false'})
+        self.assertEqual(len(response.data), 4)
+
+        response = self.client.get(url, {'condition': 'Diabetes'})
+        self.assertEqual([article['title'] for article in response.data], ['Public article'])
+        response = self.client.get(reverse('article-by-condition'), {'condition': 'Hypertension'})
+        self.assertEqual([article['title'] for article in response.data], ['Public article'])
+        response = self.client.get(reverse('article-by-condition'), {'condition': 'hyper'})
+        self.assertEqual([article['title'] for article in response.data], ['Public article'])
+        self.assertEqual(
+            set(self.articles['public'].conditions.values_list('slug', flat=True)),
+            {'diabetes', 'hypertension'}
+        )
+
+        response = self.client.get(url, {'reading_time': 4})
+        self.assertEqual([article['title'] for article in response.data], ['Public article'])
+
+        response = self.client.get(url, {'is_published': 'false'})
+        self.assertEqual([article['title'] for article in response.data], ['Draft article'])
+
+        response = self.client.get(url, {'search': 'draft'})
+        self.assertEqual([article['title'] for article in response.data], ['Draft article'])
+
+        # Content is searched when no title/summary/tag matches exist, or on request
+        response = self.client.get(url, {'search': 'content'})
+        self.assertEqual(len(response.data), 4)
+        self.articles['private'].content = 'Living with diabetes'
+        self.articles['private'].save()
+        response = self.client.get(url, {'search': 'diabetes'})
+        self.assertEqual([article['title'] for article in response.data], ['Public article'])
+        response = self.client.get(url, {'search': 'diabetes', 'deep': 'true'})
+        self.assertEqual(
+            {article['title'] for article in response.data},
+            {'Public article', 'Private article'}
+        )
+
+        response = self.client.get(url, {'reading_time': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_save_syncs_conditions_only_when_changed(self):
+        """
+        Test that saving an article only rewrites its conditions when related_conditions changed
+        """
+        article = Article.objects.get(pk=self.articles['public'].pk)
+        article.related_conditions = 'diabetes'
+        article.save()
+        self.assertEqual(list(article.conditions.values_list('slug', flat=True)), ['diabetes'])
+
+        # Publish-style saves of a loaded article only run the UPDATE
+        article = Article.objects.get(pk=article.pk)
+        article.is_featured = True
+        with self.assertNumQueries(1):
+            article.save()
+
+        article.related_conditions = ''
+        article.save()
+        self.assertFalse(article.conditions.exists())
+
+    def test_search_prefix_tsquery(self):
+        """
+        Test that PostgreSQL search terms become prefix matches with operators stripped
+        """
+        self.assertEqual(ArticleFilter.prefix_tsquery("diab  care!"), 'diab:* & care:*')
+        self.assertEqual(ArticleFilter.prefix_tsquery("a|b & !c"), 'a:* & b:* & c:*')
+        self.assertEqual(ArticleFilter.prefix_tsquery("'&|"), '')
+
+    @skipUnless(connection.vendor == 'postgresql', 'Full-text search needs PostgreSQL')
+    def test_search_matches_partial_words_on_postgresql(self):
+        """
+        Test that full-text search matches partial words like the icontains fallback does
+        """
+        self.articles['public'].title = 'Living with diabetes'
+        self.articles['public'].save()
+        self.client.force_authenticate(user=self.doctor_user)
+        response = self.client.get(reverse('article-list'), {'search': 'diab'})
+        self.assertEqual([article['title'] for article in response.data], ['Living with diabetes'])
+
+    def test_doctor_sees_own_drafts(self):
+        """
+        Test that doctors see published articles plus their own drafts
+        """
+        self.client.force_authenticate(user=self.doctor_user)
+        response = self.client.get(reverse('article-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 4)
+        # List responses leave out the article body; the detail view includes it
+        self.assertNotIn('content', response.data[0])
+
+        response = self.client.get(reverse('article-detail', kwargs={'pk': self.articles['draft'].id}))
+        self.assertEqual(response.data['content'], 'Draft content')
+
+    def test_retrieve_ignores_list_filters(self):
+        """
+        Test that list query parameters do not hide an article from the detail view
+        """
+        self.client.force_authenticate(user=self.patient_user)
+        url = reverse('article-detail', kwargs={'pk': self.articles['public'].id})
+        response = self.client.get(url, {'category': 'nutrition', 'featured': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_author_edit_resets_approval(self):
+        """
+        Test that an author editing an approved article sends it back for approval
+        """
+        self.client.force_authenticate(user=self.doctor_user)
+        article = self.articles['public']
+        url = reverse('article-detail', kwargs={'pk': article.id})
+
+        response = self.client.patch(url, {'title': 'Updated article'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        article.refresh_from_db()
+        self.assertEqual(article.title, 'Updated article')
+        self.assertFalse(article.is_approved)
+
+    def test_admin_approve(self):
+        """
+        Test approving an article once and that only admins can approve
+        """
+        url = reverse('article-approve', kwargs={'pk': self.articles['draft'].id})
+
+        self.client.force_authenticate(user=self.patient_user)
+        response = self.client.post(url, {'publish': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        admin_user = User.objects.create_user(
+            username='admin',
+            email='admin@example.com',
+            password='password123'
+        )
+        admin_user.roles.add(Role.objects.get_or_create(name='admin')[0])
+        self.client.force_authenticate(user=admin_user)
+
+        response = self.client.post(url, {'publish': 'true', 'visibility': 'subscribers'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['is_approved'])
+        self.assertTrue(response.data['is_published'])
+        self.assertEqual(response.data['visibility'], 'subscribers')
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_admin_retrieve(self):
+        """
+        Test that admins can retrieve any article, including drafts, with its comment count
+        """
+        admin_user = User.objects.create_user(
+            username='admin',
+            email='admin@example.com',
+            password='password123'
+        )
+        admin_user.roles.add(Role.objects.get_or_create(name='admin')[0])
+        self.client.force_authenticate(user=admin_user)
+
+        article = self.articles['draft']
+        ArticleComment.objects.create(article=article, user=self.patient_user, content='Comment')
+        response = self.client.get(reverse('article-detail', kwargs={'pk': article.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['comments_count'], 1)
+        self.assertIn('ETag', response)
+
+    def test_list_query_count_does_not_grow_with_articles(self):
+        """
+        Test that listing articles does not issue per-article queries
+        """
+        url = reverse('article-list')
+
+        def list_articles():
+            # Each real request loads a fresh user, so role lookups are counted every time
+            self.client.force_authenticate(user=User.objects.get(pk=self.doctor_user.pk))
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(queries), len(response.data)
+
+        list_articles()
+        base_queries, base_count = list_articles()
+
+        for index in range(3):
+            Article.objects.create(
+                title=f'Extra article {index}',
+                content='Article content',
+                author=self.doctor,
+                category='general',
+                related_conditions='diabetes',
+                is_approved=True,
+                is_published=True
+            )
+        self.assertEqual(list_articles(), (base_queries, base_count + 3))
+
+    def test_comment_list_query_count(self):
+        """
+        Test that listing comments does not issue per-comment queries
+        """
+        article = self.articles['public']
+        for index in range(3):
+            comment = ArticleComment.objects.create(
+                article=article, user=self.patient_user, content=f'Comment {index}'
+            )
+            ArticleComment.objects.create(
+                article=article, user=self.doctor_user, content='Reply', parent_comment=comment
+            )
+
+        self.client.force_authenticate(user=self.patient_user)
+        url = reverse('article-comment-list')
+        with self.assertNumQueries(4):
+            # Comments, their users' roles, replies and the reply users' roles
+            response = self.client.get(url, {'article_id': str(article.id), 'top_level_only': 'true'})
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(response.data[0]['user_role'], 'patient')
+        self.assertEqual(response.data[0]['replies'][0]['user_role'], 'doctor')
+
+    def test_comment_like_and_unlike(self):
+        """
+        Test that liking and unliking a comment keeps its like count in step
+        """
+        comment = ArticleComment.objects.create(
+            article=self.articles['public'], user=self.doctor_user, content='Comment'
+        )
+        self.client.force_authenticate(user=self.patient_user)
+        like_url = reverse('article-comment-like', kwargs={'pk': comment.id})
+        unlike_url = reverse('article-comment-unlike', kwargs={'pk': comment.id})
+
+        response = self.client.post(like_url)
+        self.assertEqual(response.data['like_count'], 1)
+        response = self.client.post(like_url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(unlike_url)
+        self.assertEqual(response.data['like_count'], 0)
+        response = self.client.post(unlike_url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_word(self):
+        """
+        Test that an article is exported as a Word document attachment
+        """
+        self.client.force_authenticate(user=self.patient_user)
+        url = reverse('article-export-word', kwargs={'pk': self.articles['public'].id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response['Content-Type'],
+            'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        )
+        self.assertIn('filename="article_Public_article.docx"', response['Content-Disposition'])
+        # .docx files are zip archives
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'PK'))
+
+        # Drafts can be exported by their author only
+        url = reverse('article-export-word', kwargs={'pk': self.articles['draft'].id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=self.doctor_user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_comment_reply(self):
+        """
+        Test replying to a comment flags doctor replies and refuses nested replies
+        """
+        comment = ArticleComment.objects.create(
+            article=self.articles['public'], user=self.patient_user, content='Comment'
+        )
+        self.client.force_authenticate(user=self.doctor_user)
+        response = self.client.post(
+            reverse('article-comment-reply', kwargs={'pk': comment.id}), {'content': 'Reply'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['is_doctor'])
+        reply = ArticleComment.objects.get(id=response.data['id'])
+        self.assertEqual(reply.article_id, comment.article_id)
+
+        response = self.client.post(
+            reverse('article-comment-reply', kwargs={'pk': reply.id}), {'content': 'Nested'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PatientSubscriptionTests(TestCase):
+    def setUp(self):
+        self.patient_role, _ = Role.objects.get_or_create(name='patient')
+
+        # Create patient (the patient role signal creates the profile)
+        self.patient_user = User.objects.create_user(
+            username='patient',
+            email='patient@example.com',
+            password='password123'
+        )
+        self.patient_user.roles.add(self.patient_role)
+        self.patient = Patient.objects.get(user=self.patient_user)
+
+        self.package = Package.objects.create(
+            name='Basic',
+            description='Basic package',
+            price=100,
+            duration_days=30,
+            consultation_limit=2
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient_user)
+
+    def test_active_subscription(self):
+        """
+        Test the active subscription lookup with and without a subscription
+        """
+        url = reverse('subscription-active')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        # Without a subscription the expiry date answers without a subscription query
+        self.assertFalse(any('healthcare_patientsubscription' in query['sql'] for query in queries))
+
+        subscription = PatientSubscription.objects.create(
+            patient=self.patient,
+            package=self.package,
+            status='active',
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=30)
+        )
+        self.patient_user.refresh_from_db()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['subscription']['id'], str(subscription.id))
+
+        response = self.client.post(reverse('subscription-subscribe'), {'package_id': str(self.package.id)})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['active_subscription']['id'], str(subscription.id))
+
+    def test_subscribe_creates_pending_subscription(self):
+        """
+        Test that subscribing creates a pending subscription and its payment
+        """
+        response = self.client.post(reverse('subscription-subscribe'), {'package_id': str(self.package.id)})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        subscription = PatientSubscription.objects.get(id=response.data['subscription']['id'])
+        self.assertEqual(subscription.status, 'pending')
+        self.assertEqual(subscription.payment.reference, response.data['payment_reference'])
+        self.assertEqual(subscription.end_date, date.today() + timedelta(days=30))
+
+
+    def test_cancel_subscription(self):
+        """
+        Test that an active subscription can be cancelled once and the patient's expiry is cleared
+        """
+        subscription = PatientSubscription.objects.create(
+            patient=self.patient,
+            package=self.package,
+            status='active',
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=30)
+        )
+        url = reverse('subscription-cancel-subscription', args=[subscription.id])
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        subscription.refresh_from_db()
+        self.patient.refresh_from_db()
+        self.assertEqual(subscription.status, 'cancelled')
+        self.assertIsNone(self.patient.subscription_expires_at)
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def authenticate_admin(self):
+        admin_role, _ = Role.objects.get_or_create(name='admin')
+        admin_user = User.objects.create_user(
+            username='admin',
+            email='admin@example.com',
+            password='password123'
+        )
+        admin_user.roles.add(admin_role)
+        self.client.force_authenticate(user=admin_user)
+
+    def test_dashboard_metrics_cache_cleared_on_subscription_change(self):
+        """
+        Test that cached dashboard metrics are refreshed when a subscription changes
+        """
+        cache.clear()
+        self.authenticate_admin()
+        url = reverse('package-payment-tracker-get-dashboard-metrics')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.data['total_active_subscribers'], 0)
+        # The four counters come from a single aggregate query
+        self.assertEqual(sum('healthcare_patientsubscription' in query['sql'] for query in queries), 1)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        PatientSubscription.objects.create(
+            patient=self.patient,
+            package=self.package,
+            status='active',
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=30)
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.data['total_active_subscribers'], 1)
+
+
+    def test_tracker_subscription_list_query_count(self):
+        """
+        Test that the payment tracker list includes phone numbers without a query per row
+        """
+        self.patient_user.phone_number = '254700000000'
+        self.patient_user.save()
+        for _ in range(3):
+            PatientSubscription.objects.create(
+                patient=self.patient,
+                package=self.package,
+                status='active',
+                start_date=date.today(),
+                end_date=date.today() + timedelta(days=30)
+            )
+        self.authenticate_admin()
+        url = reverse('package-payment-tracker-get-subscriptions')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['phone'], '254700000000')
+        self.assertEqual(response.data['results'][0]['patient_name'], 'patient')
+        # Role lookup, count and page
+        self.assertEqual(len(queries), 3)
+
+        # Cursor pagination pages through the same rows without the count
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'pagination': 'cursor', 'page_size': 2})
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertTrue(response.data['has_next'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+
+
+    def test_tracker_subscription_status_labels(self):
+        """
+        Test that the payment tracker labels subscriptions expiring within a week
+        """
+        for status_value, days_left in [('active', 3), ('active', 30), ('expired', -5), ('scheduled', 30)]:
+            PatientSubscription.objects.create(
+                patient=self.patient,
+                package=self.package,
+                status=status_value,
+                start_date=date.today() - timedelta(days=10),
+                end_date=date.today() + timedelta(days=days_left)
+            )
+        self.authenticate_admin()
+        response = self.client.get(reverse('package-payment-tracker-get-subscriptions'))
+        self.assertEqual(
+            sorted(row['status'] for row in response.data['results']),
+            ['Active', 'Expired', 'Expiring Soon', 'Scheduled']
+        )
+
+    def test_tracker_search_ignores_short_queries(self):
+        """
+        Test that payment tracker searches shorter than three characters do not filter the list
+        """
+        self.patient_user.phone_number = '254700000000'
+        self.patient_user.save()
+        PatientSubscription.objects.create(
+            patient=self.patient,
+            package=self.package,
+            status='active',
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=30)
+        )
+        self.authenticate_admin()
+        url = reverse('package-payment-tracker-get-subscriptions')
+        self.assertEqual(self.client.get(url, {'search': 'zz'}).data['count'], 1)
+        self.assertEqual(self.client.get(url, {'search': 'zzz'}).data['count'], 0)
+        self.assertEqual(self.client.get(url, {'search': '2547'}).data['count'], 1)
+
+
+    def test_tracker_export_csv_streams_rows(self):
+        """
+        Test that the payment tracker CSV export streams a header and one row per subscription
+        """
+        PatientSubscription.objects.create(
+            patient=self.patient,
+            package=self.package,
+            status='active',
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=30)
+        )
+        self.authenticate_admin()
+        response = self.client.get(reverse('package-payment-tracker-export-csv'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[0], 'Patient Name')
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Basic', lines[1])
+
+
+class PaymentTests(TestCase):
+    def setUp(self):
+        self.patient_role, _ = Role.objects.get_or_create(name='patient')
+
+        self.patient_user = User.objects.create_user(
+            username='patient',
+            email='patient@example.com',
+            password='password123'
+        )
+        self.patient_user.roles.add(self.patient_role)
+        self.patient = Patient.objects.get(user=self.patient_user)
+
+        self.package = Package.objects.create(
+            name='Basic',
+            description='Basic package',
+            price=100,
+            duration_days=30,
+            consultation_limit=2
+        )
+        self.payment = Payment.objects.create(
+            reference='PAY_TEST',
+            amount=100,
+            status='processing',
+            gateway_transaction_id='TRACK123'
+        )
+        self.subscription = PatientSubscription.objects.create(
+            patient=self.patient,
+            package=self.package,
+            payment=self.payment,
+            status='pending',
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=30)
+        )
+        self.client = APIClient()
+
+    @patch('healthcare.pesapal_client.PesapalClient.get_transaction_status')
+    def test_ipn_is_idempotent(self, mock_get_status):
+        """
+        Test that a retried IPN does not complete a payment or apply a recurring charge twice
+        """
+        mock_get_status.return_value = {
+            'payment_status_description': 'Completed',
+            'confirmation_code': 'CONF1'
+        }
+        url = reverse('payment-ipn')
+        data = {'OrderTrackingId': 'TRACK123', 'OrderNotificationType': 'RECURRING'}
+
+        for _ in range(2):
+            response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.payment.refresh_from_db()
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(self.subscription.status, 'active')
+        self.assertEqual(Payment.objects.filter(reference='REC_CONF1').count(), 1)
+        self.assertEqual(self.subscription.payment.reference, 'REC_CONF1')
+        self.assertEqual(self.subscription.end_date, date.today() + timedelta(days=61))
+
+        # The next charge is still found through the original tracking ID, and its retry is ignored
+        mock_get_status.return_value['confirmation_code'] = 'CONF2'
+        for _ in range(2):
+            response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.subscription.refresh_from_db()
+        self.assertEqual(Payment.objects.filter(reference='REC_CONF2').count(), 1)
+        self.assertEqual(self.subscription.payment.reference, 'REC_CONF2')
+        self.assertEqual(self.subscription.end_date, date.today() + timedelta(days=92))
+
+    @patch('healthcare.pesapal_client.PesapalClient.get_transaction_status')
+    def test_ipn_applies_each_recurring_charge(self, mock_get_status):
+        """
+        Test that every distinct recurring charge records a payment and extends the subscription
+        """
+        url = reverse('payment-ipn')
+        data = {'OrderTrackingId': 'TRACK123', 'OrderNotificationType': 'RECURRING'}
+
+        for code in ['C1', 'C2']:
+            mock_get_status.return_value = {
+                'payment_status_description': 'Completed',
+                'confirmation_code': code
+            }
+            response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.subscription.refresh_from_db()
+        self.assertTrue(Payment.objects.filter(reference='REC_C1').exists())
+        self.assertEqual(self.subscription.payment.reference, 'REC_C2')
+        self.assertEqual(self.subscription.end_date, date.today() + timedelta(days=92))
+
+    @patch('healthcare.pesapal_client.PesapalClient.get_transaction_status')
+    def test_callback_activates_subscriptions(self, mock_get_status):
+        """
+        Test that a completed callback activates the subscription and records its expiry
+        """
+        mock_get_status.return_value = {'payment_status_description': 'Completed'}
+        url = reverse('payment-callback', args=[self.payment.id])
+        response = self.client.post(url, {'OrderTrackingId': 'TRACK123'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.subscription.refresh_from_db()
+        self.patient.refresh_from_db()
+        self.assertEqual(self.subscription.status, 'active')
+        self.assertEqual(self.patient.subscription_expires_at, self.subscription.end_date)
+
+    @patch('healthcare.pesapal_client.PesapalClient.submit_order_request')
+    def test_process_claims_pending_payment_once(self, mock_submit):
+        """
+        Test that only a pending payment is sent to Pesapal, and only once
+        """
+        mock_submit.return_value = {'order_tracking_id': 'TRACK456', 'redirect_url': 'https://pay.example.com'}
+        Payment.objects.filter(id=self.payment.id).update(status='pending')
+        self.client.force_authenticate(user=self.patient_user)
+        url = reverse('payment-process', args=[self.payment.id])
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(mock_submit.call_count, 1)
+
+    def test_list_leaves_out_gateway_response(self):
+        """
+        Test that the payment list omits the raw gateway response that the detail view returns
+        """
+        self.client.force_authenticate(user=self.patient_user)
+        response = self.client.get(reverse('payment-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual(results[0]['id'], str(self.payment.id))
+        self.assertNotIn('gateway_response', results[0])
+
+        response = self.client.get(reverse('payment-detail', args=[self.payment.id]))
+        self.assertIn('gateway_response', response.data)
+
+    @patch('healthcare.pesapal_client.PesapalClient.get_transaction_status')
+    def test_status_polls_share_pesapal_sync(self, mock_get_status):
+        """
+        Test that repeated status polls share one Pesapal call and settled payments skip it
+        """
+        cache.clear()
+        mock_get_status.return_value = {'payment_status_description': 'Pending'}
+        self.client.force_authenticate(user=self.patient_user)
+        url = reverse('payment-status', args=[self.payment.id])
+
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(mock_get_status.call_count, 1)
+
+        cache.clear()
+        Payment.objects.filter(id=self.payment.id).update(status='failed')
+        response = self.client.get(url)
+        self.assertEqual(response.data['status'], 'failed')
+        self.assertEqual(mock_get_status.call_count, 1)
+
+    def test_status_hides_other_patients_payments(self):
+        """
+        Test that a patient cannot read the status of a payment for someone else's subscription
+        """
+        other_user = User.objects.create_user(
+            username='other',
+            email='other@example.com',
+            password='password123'
+        )
+        other_user.roles.add(self.patient_role)
+        self.client.force_authenticate(user=other_user)
+        response = self.client.get(reverse('payment-status', args=[self.payment.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RiskSegmentationTests(TestCase):
+    def setUp(self):
+        doctor_role, _ = Role.objects.get_or_create(name='doctor')
+        patient_role, _ = Role.objects.get_or_create(name='patient')
+
+        self.doctor_user = User.objects.create_user(
+            username='doctor',
+            email='doctor@example.com',
+            password='password123'
+        )
+        self.doctor_user.roles.add(doctor_role)
+        education = Education.objects.create(
+            level_of_education='MD',
+            field='Medicine',
+            institution='Test University'
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.doctor_user,
+            specialty='General',
+            license_number='LIC123456',
+            education=education
+        )
+
+        # Each patient's latest appointment decides their risk level
+        self.patients = []
+        for index, risk_levels in enumerate([['low', 'critical'], ['critical', 'high'], ['medium']]):
+            user = User.objects.create_user(
+                username=f'patient{index}',
+                email=f'patient{index}@example.com',
+                password='password123'
+            )
+            user.roles.add(patient_role)
+            patient = Patient.objects.get(user=user)
+            self.patients.append(patient)
+            for days_ago, risk_level in zip(range(len(risk_levels), 0, -1), risk_levels):
+                Appointment.objects.create(
+                    patient=patient,
+                    doctor=self.doctor,
+                    appointment_date=date.today() - timedelta(days=days_ago),
+                    start_time='09:00',
+                    end_time='09:30',
+                    risk_level=risk_level
+                )
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.doctor_user)
+
+    def test_summary_counts_latest_risk_per_patient(self):
+        """
+        Test that the summary buckets each patient once, by their latest appointment
+        """
+        response = self.client.get(reverse('risk-segmentation-summary'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_patients'], 3)
+        counts = {item['risk_level']: item['patient_count'] for item in response.data['distribution']}
+        self.assertEqual(counts, {'severe': 1, 'high': 1, 'moderate': 1})
+
+    def test_patients_lists_latest_matching_appointment(self):
+        """
+        Test that the patient list returns one latest appointment per patient at the risk level
+        """
+        response = self.client.get(reverse('risk-segmentation-patients'), {'risk_level': 'severe'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(
+            {item['appointment_date'] for item in response.data},
+            {str(date.today() - timedelta(days=1)), str(date.today() - timedelta(days=2))}
+        )
+
+
+    def test_export_csv_lists_each_patient_once_by_risk_level(self):
+        """
+        Test that the CSV export lists every patient once, grouped severe, high, moderate
+        """
+        response = self.client.get(reverse('risk-segmentation-export-csv'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = response.content.decode().splitlines()[1:]
+        self.assertEqual([row.split(',')[0] for row in rows], ['patient0', 'patient1', 'patient2'])
+        self.assertEqual([row.split(',')[4] for row in rows], ['Critical', 'High', 'Medium'])
+
+
+class FollowUpComplianceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        doctor_role, _ = Role.objects.get_or_create(name='doctor')
+        patient_role, _ = Role.objects.get_or_create(name='patient')
+
+        self.doctor_user = User.objects.create_user(
+            username='doctor',
+            email='doctor@example.com',
+            password='password123'
+        )
+        self.doctor_user.roles.add(doctor_role)
+        education = Education.objects.create(
+            level_of_education='MD',
+            field='Medicine',
+            institution='Test University'
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.doctor_user,
+            specialty='General',
+            license_number='LIC123456',
+            education=education
+        )
+
+        # patient0 missed an earlier follow-up, patient1 kept every appointment
+        visits = [
+            [('noshow', 'follow-up', 'high'), ('fulfilled', 'follow-up', 'high')],
+            [('fulfilled', 'consultation', 'low')],
+        ]
+        for index, appointments in enumerate(visits):
+            user = User.objects.create_user(
+                username=f'patient{index}',
+                email=f'patient{index}@example.com',
+                first_name='Patient',
+                last_name=str(index),
+                password='password123'
+            )
+            user.roles.add(patient_role)
+            patient = Patient.objects.get(user=user)
+            for days_ago, (appointment_status, appointment_type, risk_level) in zip(
+                range(len(appointments), 0, -1), appointments
+            ):
+                Appointment.objects.create(
+                    patient=patient,
+                    doctor=self.doctor,
+                    appointment_date=date.today() - timedelta(days=days_ago),
+                    start_time='09:00',
+                    end_time='09:30',
+                    status=appointment_status,
+                    appointment_type=appointment_type,
+                    risk_level=risk_level
+                )
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.doctor_user)
+
+    def test_export_csv_streams_one_row_per_patient(self):
+        """
+        Test that the compliance CSV export streams a row per patient with their missed count
+        """
+        response = self.client.get(reverse('follow-up-compliance-export-csv'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[0], 'Patient Name')
+        rows = sorted(line.split(',') for line in lines[1:])
+        self.assertEqual([row[0] for row in rows], ['Patient 0', 'Patient 1'])
+        self.assertEqual([row[3] for row in rows], ['1', '0'])
+
+    def test_patients_aggregates_in_one_query(self):
+        """
+        Test that the compliance patient list groups appointments per patient in a single query
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('follow-up-compliance-patients'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Role lookup and the grouped appointments
+        self.assertEqual(len(queries), 2)
+        rows = {row['patient_name']: row for row in response.data}
+        self.assertEqual(rows['Patient 0']['missed_count'], 1)
+        self.assertEqual(rows['Patient 0']['risk_level'], 'high')
+        self.assertEqual(rows['Patient 0']['follow_up_type'], 'Appointment')
+        self.assertEqual(rows['Patient 0']['status'], 'Missed')
+        self.assertEqual(rows['Patient 1']['follow_up_type'], 'Medication')
+        self.assertEqual(rows['Patient 1']['status'], 'Compliant')
+
+    def test_statistics_in_one_query(self):
+        """
+        Test that the compliance statistics are counted in a single aggregate query
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('follow-up-compliance-statistics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Role lookup and the aggregate
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(response.data['total_patients_tracked'], 2)
+        self.assertEqual(response.data['missed_appointments'], 1)
+        self.assertEqual(response.data['critical_non_compliant'], 1)
+        self.assertEqual(response.data['compliance_rate'], 66.7)
+
+    def test_list_summary_reuses_total_for_pagination(self):
+        """
+        Test that the summary list pages through appointments without a second count query
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('follow-up-compliance-list'), {'summary': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(response.data['summary']['total_appointments'], 3)
+        # No QuerySet.count() from the paginator
+        self.assertFalse(any('"__count"' in query['sql'] for query in queries))
+
+    @patch('healthcare.views.FollowUpComplianceViewSet._build_pdf', return_value=b'%PDF-report')
+    def test_export_pdf_is_cached_until_appointments_change(self, mock_build):
+        """
+        Test that repeated PDF exports reuse the rendered report until an appointment is saved
+        """
+        url = reverse('follow-up-compliance-export-pdf')
+        self.assertEqual(self.client.get(url).content, b'%PDF-report')
+        self.client.get(url)
+        self.assertEqual(mock_build.call_count, 1)
+
+        appointment = Appointment.objects.first()
+        appointment.notes = 'Rescheduled'
+        appointment.save()
+        self.client.get(url)
+        self.assertEqual(mock_build.call_count, 2)
+
+
+class TeleconsultationLogTests(TestCase):
+    def setUp(self):
+        doctor_role, _ = Role.objects.get_or_create(name='doctor')
+        patient_role, _ = Role.objects.get_or_create(name='patient')
+
+        self.doctor_user = User.objects.create_user(
+            username='doctor',
+            email='doctor@example.com',
+            password='password123'
+        )
+        self.doctor_user.roles.add(doctor_role)
+        education = Education.objects.create(
+            level_of_education='MD',
+            field='Medicine',
+            institution='Test University'
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.doctor_user,
+            specialty='General',
+            license_number='LIC123456',
+            education=education
+        )
+        clinic = HealthCare.objects.create(name='Test Clinic', description='Test clinic')
+
+        # One consultation at the clinic, one without a facility
+        for index, facility in enumerate([clinic, None]):
+            user = User.objects.create_user(
+                username=f'patient{index}',
+                email=f'patient{index}@example.com',
+                password='password123'
+            )
+            user.roles.add(patient_role)
+            appointment = Appointment.objects.create(
+                patient=Patient.objects.get(user=user),
+                doctor=self.doctor,
+                appointment_date=date.today() - timedelta(days=index + 1),
+                start_time='09:00',
+                end_time='09:30',
+                healthcare_facility=facility
+            )
+            Consultation.objects.create(appointment=appointment, status='completed')
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.doctor_user)
+
+    def test_export_csv_lists_clinic_without_extra_queries(self):
+        """
+        Test that the CSV export writes each consultation's clinic from the joined facility
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('teleconsultation-log-export-csv'))
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        # Role lookup and the consultations
+        self.assertEqual(len(queries), 2)
+        self.assertEqual([line.split(',')[4] for line in lines[1:]], ['Test Clinic', 'N/A'])
+
+    def test_clinic_filter(self):
+        """
+        Test that the clinic filter matches the appointment's healthcare facility
+        """
+        response = self.client.get(reverse('teleconsultation-log-list'), {'clinic': 'test'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+
+    def test_date_filters(self):
+        """
+        Test that date filters bound the appointment date and malformed dates are ignored
+        """
+        url = reverse('teleconsultation-log-list')
+        yesterday = (date.today() - timedelta(days=1)).isoformat()
+        self.assertEqual(self.client.get(url, {'date_from': yesterday}).data['count'], 1)
+        self.assertEqual(self.client.get(url, {'date_to': yesterday}).data['count'], 2)
+        self.assertEqual(self.client.get(url, {'date_from': 'not-a-date'}).data['count'], 2)
+
+
+class PesapalClientTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @patch('healthcare.pesapal_client.PesapalClient._make_request')
+    def test_token_is_shared_through_cache(self, mock_request):
+        """
+        Test that a token fetched by one client is reused by another instead of authenticating again
+        """
+        mock_request.side_effect = lambda method, endpoint, *args, **kwargs: (
+            {'token': 'TOKEN'} if endpoint == '/api/Auth/RequestToken' else {'status': '200'}
+        )
+        PesapalClient().get_transaction_status('TRACK123')
+        PesapalClient().get_transaction_status('TRACK123')
+
+        endpoints = [call.args[1] for call in mock_request.call_args_list]
+        self.assertEqual(endpoints.count('/api/Auth/RequestToken'), 1)
+        self.assertEqual(endpoints.count('/api/Transactions/GetTransactionStatus'), 2)
+
+    def test_client_is_reused_per_thread(self):
+        """
+        Test that each thread reuses its own Pesapal client rather than sharing one session
+        """
+        other_thread_clients = []
+        thread = threading.Thread(target=lambda: other_thread_clients.append(get_pesapal_client()))
+        thread.start()
+        thread.join()
+
+        self.assertIs(get_pesapal_client(), get_pesapal_client())
+        self.assertIsNot(get_pesapal_client(), other_thread_clients[0])
@@ -353,3 +353,26 @@ class ConsultationTests(TestCase):
         self.assertEqual(response.data['messages_marked_read'], 2)
         self.assertEqual(ConsultationChat.objects.filter(is_doctor=False, is_read=True).count(), 2)
         self.assertEqual(ConsultationChat.objects.filter(is_doctor=True, is_read=True).count(), 2) # Doctor's messages should remain read
+
+    def test_chat_messages_not_modified(self):
+        """
+        Test that polling chat messages with a current ETag returns 304
+        """
+        self.consultation.status = 'in-progress'
+        self.consultation.save()
+        ConsultationChat.objects.create(consultation=self.consultation, sender=self.doctor_user, message='Doc message 1', is_doctor=True)
+
+        self.client.force_authenticate(user=self.patient_user)
+        url = reverse('consultation-chat-messages', kwargs={'pk': self.consultation.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # A new message changes the ETag
+        ConsultationChat.objects.create(consultation=self.consultation, sender=self.doctor_user, message='Doc message 2', is_doctor=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
@@ -2,12 +2,18 @@ from rest_framework import viewsets, permissions, status, serializers
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.utils import timezone
-from django.db.models import Q, Avg
-from datetime import datetime, timedelta
+from django.db import connection, transaction
+from django.db.models import Q, F, Avg, Max, Count, Case, When, Value, BooleanField, CharField, Prefetch, Window, OuterRef, Subquery
+from django.db.models.functions import Greatest, RowNumber, Coalesce, Concat, NullIf, Trim, Upper, Left, Substr
+from datetime import date, datetime, timedelta
 from django.conf import settings
-from .pesapal_client import PesapalClient
+from django.core.paginator import Paginator
+from django.core.cache import cache
+from django_filters.rest_framework import DjangoFilterBackend
+from .filters import ArticleFilter
+from .pesapal_client import get_pesapal_client
 from .subscription_utils import SubscriptionManager
-from panacare.pagination import CustomPageNumberPagination
+from panacare.pagination import CustomPageNumberPagination, CreatedAtCursorPagination
 from .models import (
     HealthCare, Appointment, Consultation, ConsultationChat, DoctorRating,
     Article, ArticleComment, ArticleCommentLike, PatientDoctorAssignment,
@@ -17,9 +23,10 @@ from .models import (
 from .serializers import (
     HealthCareSerializer, AppointmentSerializer,
     ConsultationSerializer, ConsultationChatSerializer,
-    DoctorRatingSerializer, ArticleSerializer, ArticleCommentSerializer, 
+    DoctorRatingSerializer, ArticleSerializer, ArticleListSerializer, ArticleCommentSerializer, 
     ArticleCommentLikeSerializer, ArticleCommentReplySerializer,
     PackageSerializer, PatientSubscriptionSerializer, DoctorAvailabilitySerializer, PaymentSerializer,
+    PaymentListSerializer, PatientSubscriptionTrackerSerializer,
     PatientDoctorAssignmentSerializer, RiskSegmentationSummarySerializer, 
     RiskSegmentationSerializer, PatientRiskListSerializer, PatientJournalSerializer,
   #  AppointmentDocumentSerializer, ResourceSerializer,
@@ -28,14 +35,138 @@ from doctors.views import IsAdminUser, IsVerifiedUser, IsPatientUser, IsDoctorUs
 from users.models import User, Role, Patient
 from doctors.models import Doctor
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404, FileResponse, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
 from docx import Document
 from docx.shared import Inches
+import csv
 import io
+import re
+import uuid
+import tempfile
+import hashlib
+import json
+import logging
+from types import MappingProxyType
+from urllib.parse import urlencode
+from functools import lru_cache
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
+logger = logging.getLogger(__name__)
+
+# Characters stripped from article titles when building export filenames
+# (anything other than letters, digits, spaces, hyphens and underscores)
+EXPORT_FILENAME_UNSAFE_RE = re.compile(r'[^\w \-]+')
+
+# Billing address fields sent with every Pesapal order; the customer's own details are added per order
+PESAPAL_BILLING_DEFAULTS = MappingProxyType({
+    "phone_number": '254795941990',
+    "country_code": "KE",
+    "line_1": "Moi Avenue",
+    "line_2": "Suite 12",
+    "city": "Nairobi",
+    "state": "Nairobi County",
+    "postal_code": "00100",
+    "zip_code": "00100",
+})
+
+
+class Echo:
+    """
+    File-like object whose write() hands the value back, so csv.writer
+    output can be yielded to a streaming response line by line.
+    """
+    def write(self, value):
+        return value
+
+
+def streaming_csv_response(filename, header, rows):
+    """
+    Stream a CSV download as rows are produced instead of building the whole file in memory.
+    """
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def pdf_table_chunks(header, rows, style, chunk_size=500):
+    """
+    Lay out report rows as a series of LongTables of at most chunk_size rows, each
+    repeating the header, so ReportLab never has to split one table holding every row.
+    """
+    from reportlab.platypus import LongTable
+
+    chunk = [header]
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) > chunk_size:
+            yield LongTable(chunk, style=style, repeatRows=1)
+            chunk = [header]
+    if len(chunk) > 1:
+        yield LongTable(chunk, style=style, repeatRows=1)
+
+
+def cached_pdf_response(request, name, filename, build_pdf):
+    """
+    Serve a PDF report from the cache when a user with the same visibility asked for
+    the same filters recently, building and caching it on a miss. Entries are retired
+    by Appointment.invalidate_export_cache().
+    """
+    user = request.user
+    scope = 'admin' if 'admin' in user.role_name_set else f'user_{user.pk}'
+    query = hashlib.md5(urlencode(sorted(request.query_params.lists()), doseq=True).encode()).hexdigest()
+    cache_key = f"appointment_export_{Appointment.export_cache_version()}_{name}_{scope}_{query}"
+    
+    pdf = cache.get(cache_key)
+    if pdf is None:
+        pdf = build_pdf()
+        cache.set(cache_key, pdf, Appointment.EXPORT_CACHE_TIMEOUT)
+    
+    response = HttpResponse(pdf, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def parse_limit(request, default, cap=100):
+    """
+    Read the 'limit' query parameter, falling back to default when it is missing
+    or not a number and clamping it to between 1 and cap.
+    """
+    try:
+        limit = int(request.query_params.get('limit', default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, cap))
+
+
+@lru_cache(maxsize=256)
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_date_param(request, name):
+    """
+    Read a YYYY-MM-DD query parameter, returning None when it is missing or malformed.
+    Report filters repeat the same few dates, so parsed values are memoized.
+    """
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return _parse_date(value)
+    except ValueError:
+        return None
+
+
 # Define the format parameter for Swagger documentation
 format_parameter = openapi.Parameter(
     'format', 
@@ -301,7 +432,7 @@ class IsPatientUser(permissions.BasePermission):
             return False
         
         # Check if user has patient role
-        return request.user.roles.filter(name='patient').exists()
+        return 'patient' in request.user.role_name_set
 
 
 
@@ -316,7 +447,7 @@ class IsPatientOrDoctorOrAdmin(permissions.BasePermission):
             return False
         
         # Check if user has patient, doctor or admin role
-        return request.user.roles.filter(name__in=['patient', 'doctor', 'admin']).exists()
+        return not request.user.role_name_set.isdisjoint({'patient', 'doctor', 'admin'})
 
 
 # class DoctorAvailabilityViewSet(viewsets.ModelViewSet):
@@ -417,24 +548,24 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         queryset = Appointment.objects.all()
         
         # Filter by role
-        if self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists():
+        if self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set:
             # Admin can see all appointments
             pass
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='doctor').exists():
+        elif self.request.user.is_authenticated and 'doctor' in self.request.user.role_name_set:
             # Doctors can only see their own appointments
             try:
                 doctor = self.request.user.doctor
                 queryset = queryset.filter(doctor=doctor)
             except Doctor.DoesNotExist:
                 return Appointment.objects.none()
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='patient').exists():
+        elif self.request.user.is_authenticated and 'patient' in self.request.user.role_name_set:
             # Patients can only see their own appointments
             try:
                 patient = self.request.user.patient
                 queryset = queryset.filter(patient=patient)
             except Patient.DoesNotExist:
                 return Appointment.objects.none()
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='community_health_provider').exists():
+        elif self.request.user.is_authenticated and 'community_health_provider' in self.request.user.role_name_set:
             # CHPs can only see appointments they created
             try:
                 from users.models import CommunityHealthProvider
@@ -458,21 +589,13 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         if status_param:
             queryset = queryset.filter(status=status_param)
             
-        date_from = self.request.query_params.get('date_from')
+        date_from = parse_date_param(self.request, 'date_from')
         if date_from:
-            try:
-                date_from = datetime.strptime(date_from, '%Y-%m-%d').date()
-                queryset = queryset.filter(appointment_date__gte=date_from)
-            except ValueError:
-                pass
+            queryset = queryset.filter(appointment_date__gte=date_from)
                 
-        date_to = self.request.query_params.get('date_to')
+        date_to = parse_date_param(self.request, 'date_to')
         if date_to:
-            try:
-                date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
-                queryset = queryset.filter(appointment_date__lte=date_to)
-            except ValueError:
-                pass
+            queryset = queryset.filter(appointment_date__lte=date_to)
                 
         appointment_type = self.request.query_params.get('type')
         if appointment_type:
@@ -842,7 +965,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         appointment = self.get_object()
         
         # Check permissions - users can only export their own appointments or admin can export any
-        if not (self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists()):
+        if not (self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set):
             if hasattr(self.request.user, 'patient') and appointment.patient.user != self.request.user:
                 return Response({
                     'error': 'You can only export your own appointments'
@@ -1306,17 +1429,17 @@ class ConsultationViewSet(viewsets.ModelViewSet):
         queryset = Consultation.objects.all()
         
         # Filter by role
-        if self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists():
+        if self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set:
             # Admin can see all consultations
             pass
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='doctor').exists():
+        elif self.request.user.is_authenticated and 'doctor' in self.request.user.role_name_set:
             # Doctors can only see their own consultations
             try:
                 doctor = self.request.user.doctor
                 queryset = queryset.filter(appointment__doctor=doctor)
             except Doctor.DoesNotExist:
                 return Consultation.objects.none()
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='patient').exists():
+        elif self.request.user.is_authenticated and 'patient' in self.request.user.role_name_set:
             # Patients can only see their own consultations
             try:
                 patient = self.request.user.patient
@@ -1511,9 +1634,9 @@ class ConsultationViewSet(viewsets.ModelViewSet):
         consultation = self.get_object()
         
         # Check if the user is either the patient or doctor for this consultation
-        is_doctor = request.user.roles.filter(name='doctor').exists() and hasattr(request.user, 'doctor') and request.user.doctor == consultation.appointment.doctor
-        is_patient = request.user.roles.filter(name='patient').exists() and hasattr(request.user, 'patient') and request.user.patient == consultation.appointment.patient
-        is_admin = request.user.roles.filter(name='admin').exists()
+        is_doctor = 'doctor' in request.user.role_name_set and hasattr(request.user, 'doctor') and request.user.doctor == consultation.appointment.doctor
+        is_patient = 'patient' in request.user.role_name_set and hasattr(request.user, 'patient') and request.user.patient == consultation.appointment.patient
+        is_admin = 'admin' in request.user.role_name_set
         
         if not (is_doctor or is_patient or is_admin):
             return Response({
@@ -1615,8 +1738,8 @@ class ConsultationViewSet(viewsets.ModelViewSet):
         consultation = self.get_object()
         
         # Check if the user is the patient or doctor for this consultation
-        is_patient = request.user.roles.filter(name='patient').exists() and hasattr(request.user, 'patient') and request.user.patient == consultation.appointment.patient
-        is_doctor = request.user.roles.filter(name='doctor').exists() and hasattr(request.user, 'doctor') and request.user.doctor == consultation.appointment.doctor
+        is_patient = 'patient' in request.user.role_name_set and hasattr(request.user, 'patient') and request.user.patient == consultation.appointment.patient
+        is_doctor = 'doctor' in request.user.role_name_set and hasattr(request.user, 'doctor') and request.user.doctor == consultation.appointment.doctor
         
         if not (is_patient or is_doctor):
             return Response({
@@ -1672,9 +1795,9 @@ class ConsultationViewSet(viewsets.ModelViewSet):
         consultation = self.get_object()
         
         # Check if the user is a participant in this consultation
-        is_patient = request.user.roles.filter(name='patient').exists() and hasattr(request.user, 'patient') and request.user.patient == consultation.appointment.patient
-        is_doctor = request.user.roles.filter(name='doctor').exists() and hasattr(request.user, 'doctor') and request.user.doctor == consultation.appointment.doctor
-        is_admin = request.user.roles.filter(name='admin').exists()
+        is_patient = 'patient' in request.user.role_name_set and hasattr(request.user, 'patient') and request.user.patient == consultation.appointment.patient
+        is_doctor = 'doctor' in request.user.role_name_set and hasattr(request.user, 'doctor') and request.user.doctor == consultation.appointment.doctor
+        is_admin = 'admin' in request.user.role_name_set
         
         if not (is_patient or is_doctor or is_admin):
             return Response({
@@ -1688,11 +1811,32 @@ class ConsultationViewSet(viewsets.ModelViewSet):
         except ValueError:
             limit = 50
             
+        # Clients poll this endpoint, so answer 304 when nothing has changed
+        # since their last fetch instead of re-serializing the same messages
+        chat_messages = ConsultationChat.objects.filter(consultation=consultation)
+        chat_state = chat_messages.aggregate(
+            last_created=Max('created_at'),
+            last_read=Max('read_at'),
+            total=Count('id')
+        )
+        etag = quote_etag('-'.join([
+            str(int(chat_state['last_created'].timestamp() * 1000000)) if chat_state['last_created'] else '0',
+            str(int(chat_state['last_read'].timestamp() * 1000000)) if chat_state['last_read'] else '0',
+            str(chat_state['total']),
+            str(limit)
+        ]))
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+            
         # Get messages
-        messages = ConsultationChat.objects.filter(consultation=consultation).order_by('-created_at')[:limit]
+        messages = chat_messages.order_by('-created_at')[:limit]
         serializer = ConsultationChatSerializer(messages, many=True)
         
-        return Response(serializer.data)
+        response = Response(serializer.data)
+        response['ETag'] = etag
+        return response
     
     @swagger_auto_schema(
         operation_description="Send a chat message in a consultation",
@@ -1727,8 +1871,8 @@ class ConsultationViewSet(viewsets.ModelViewSet):
         consultation = self.get_object()
         
         # Check if the user is a participant in this consultation
-        is_patient = request.user.roles.filter(name='patient').exists() and hasattr(request.user, 'patient') and request.user.patient == consultation.appointment.patient
-        is_doctor = request.user.roles.filter(name='doctor').exists() and hasattr(request.user, 'doctor') and request.user.doctor == consultation.appointment.doctor
+        is_patient = 'patient' in request.user.role_name_set and hasattr(request.user, 'patient') and request.user.patient == consultation.appointment.patient
+        is_doctor = 'doctor' in request.user.role_name_set and hasattr(request.user, 'doctor') and request.user.doctor == consultation.appointment.doctor
         
         if not (is_patient or is_doctor):
             return Response({
@@ -1749,7 +1893,7 @@ class ConsultationViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_400_BAD_REQUEST)
             
         # Create the message
-        is_doctor = request.user.roles.filter(name='doctor').exists()
+        is_doctor = 'doctor' in request.user.role_name_set
         
         chat_message = ConsultationChat.objects.create(
             consultation=consultation,
@@ -1769,8 +1913,8 @@ class ConsultationViewSet(viewsets.ModelViewSet):
         consultation = self.get_object()
         
         # Check if the user is a participant in this consultation
-        is_patient = request.user.roles.filter(name='patient').exists() and hasattr(request.user, 'patient') and request.user.patient == consultation.appointment.patient
-        is_doctor = request.user.roles.filter(name='doctor').exists() and hasattr(request.user, 'doctor') and request.user.doctor == consultation.appointment.doctor
+        is_patient = 'patient' in request.user.role_name_set and hasattr(request.user, 'patient') and request.user.patient == consultation.appointment.patient
+        is_doctor = 'doctor' in request.user.role_name_set and hasattr(request.user, 'doctor') and request.user.doctor == consultation.appointment.doctor
         
         if not (is_patient or is_doctor):
             return Response({
@@ -2073,20 +2217,19 @@ class DoctorRatingViewSet(viewsets.ModelViewSet):
             # Set patient to current user's patient
             patient = self.request.user.patient
             
-            # Check if patient has already rated this doctor
+            # Update the patient's existing rating for this doctor or create a new one
+            # in one atomic step; (doctor, patient) is unique so there is at most one row
             doctor_id = serializer.validated_data.get('doctor').id
-            existing_rating = DoctorRating.objects.filter(doctor_id=doctor_id, patient=patient).exists()
-            
-            if existing_rating:
-                # Update the existing rating
-                existing_rating = DoctorRating.objects.get(doctor_id=doctor_id, patient=patient)
-                existing_rating.rating = serializer.validated_data.get('rating')
-                existing_rating.review = serializer.validated_data.get('review', '')
-                existing_rating.is_anonymous = serializer.validated_data.get('is_anonymous', False)
-                existing_rating.save()
-            else:
-                # Create new rating
-                serializer.save(patient=patient)
+            rating, _ = DoctorRating.objects.update_or_create(
+                doctor_id=doctor_id,
+                patient=patient,
+                defaults={
+                    'rating': serializer.validated_data.get('rating'),
+                    'review': serializer.validated_data.get('review', ''),
+                    'is_anonymous': serializer.validated_data.get('is_anonymous', False),
+                }
+            )
+            serializer.instance = rating
         except Patient.DoesNotExist:
             raise serializers.ValidationError("Patient profile not found")
     
@@ -2100,22 +2243,42 @@ class DoctorRatingViewSet(viewsets.ModelViewSet):
             return Response({
                 'error': 'doctor_id parameter is required'
             }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            doctor_id = uuid.UUID(str(doctor_id))
+        except ValueError:
+            return Response({
+                'error': 'doctor_id must be a valid UUID'
+            }, status=status.HTTP_400_BAD_REQUEST)
             
-        # Get average rating
-        average_rating = DoctorRating.objects.filter(doctor_id=doctor_id).aggregate(Avg('rating'))
-        total_ratings = DoctorRating.objects.filter(doctor_id=doctor_id).count()
+        # Serve from cache; ratings signals clear the entry on every change
+        cache_key = DoctorRating.average_cache_key(doctor_id)
+        data = cache.get(cache_key)
         
-        return Response({
-            'doctor_id': doctor_id,
-            'average_rating': average_rating['rating__avg'] or 0,
-            'total_ratings': total_ratings
-        })
+        if data is None:
+            # Get average rating and count in a single query
+            stats = DoctorRating.objects.filter(doctor_id=doctor_id).aggregate(
+                average_rating=Avg('rating'),
+                total_ratings=Count('id')
+            )
+            data = {
+                'doctor_id': str(doctor_id),
+                'average_rating': stats['average_rating'] or 0,
+                'total_ratings': stats['total_ratings']
+            }
+            cache.set(cache_key, data, DoctorRating.AVERAGE_CACHE_TIMEOUT)
+        
+        return Response(data)
 
 
 class ArticleViewSet(viewsets.ModelViewSet):
-    queryset = Article.objects.all()
+    # Related rows the serializer reads are joined in up front to avoid N+1 queries
+    # The search document is only used for filtering, so it is never loaded
+    queryset = Article.objects.select_related('author__user', 'approved_by', 'rejected_by').defer('search_vector')
     serializer_class = ArticleSerializer
     permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ArticleFilter
     
     @swagger_auto_schema(
         operation_description="""
@@ -2145,13 +2308,14 @@ class ArticleViewSet(viewsets.ModelViewSet):
             openapi.Parameter('date_to', openapi.IN_QUERY, type=openapi.TYPE_STRING, format="date", description="Filter by publish date (to)"),
             openapi.Parameter('sort_by', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=["popular", "newest", "oldest"], description="Sort by view count (popular), newest publish date (newest), or oldest publish date (oldest)"),
             openapi.Parameter('search', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Search across title, content, summary, tags, and related_conditions"),
+            openapi.Parameter('deep', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN, description="Also search article content when title, summary, tags or related_conditions already match"),
             openapi.Parameter('is_approved', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN, description="Filter by approval status (admin only)"),
             openapi.Parameter('is_published', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN, description="Filter by publication status"),
             openapi.Parameter('reading_time', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description="Filter by reading time in minutes (returns articles with reading time <= specified value)"),
             openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description="Limit number of results returned")
         ],
         responses={
-            200: ArticleSerializer(many=True)
+            200: ArticleListSerializer(many=True)
         }
     )
     def list(self, request, *args, **kwargs):
@@ -2159,66 +2323,40 @@ class ArticleViewSet(viewsets.ModelViewSet):
     
     def retrieve(self, request, *args, **kwargs):
         """
-        Custom retrieve method to handle article access permissions
+        Custom retrieve method to handle article access permissions.
+        Role and visibility rules are applied by get_queryset, so get_object
+        already 404s for articles the user may not see.
         """
         instance = self.get_object()
         
-        # Check if user has permission to view this article
-        if self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists():
-            # Admin can view any article
-            pass
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='doctor').exists():
-            # Doctors can view all published articles or their own articles
-            try:
-                doctor = self.request.user.doctor
-                if not (instance.is_approved and instance.is_published) and instance.author != doctor:
-                    # Article is not published and doctor is not the author
-                    return Response({
-                        'error': 'Article not found or access denied'
-                    }, status=status.HTTP_404_NOT_FOUND)
-            except Doctor.DoesNotExist:
-                # If doctor profile doesn't exist, only allow published articles
-                if not (instance.is_approved and instance.is_published):
-                    return Response({
-                        'error': 'Article not found or access denied'
-                    }, status=status.HTTP_404_NOT_FOUND)
-        else:
-            # Patients and other users
-            if not (instance.is_approved and instance.is_published):
-                return Response({
-                    'error': 'Article not found or access denied'
-                }, status=status.HTTP_404_NOT_FOUND)
-            
-            # Check visibility permissions for patients
-            if instance.visibility == 'private':
-                return Response({
-                    'error': 'Article not found or access denied'
-                }, status=status.HTTP_404_NOT_FOUND)
-            elif instance.visibility == 'subscribers':
-                # Check if patient has active subscription
-                has_active_subscription = False
-                if hasattr(self.request.user, 'patient'):
-                    try:
-                        patient = self.request.user.patient
-                        has_active_subscription = PatientSubscription.objects.filter(
-                            patient=patient,
-                            status='active',
-                            end_date__gte=timezone.now().date()
-                        ).exists()
-                    except Exception:
-                        has_active_subscription = False
-                
-                if not has_active_subscription:
-                    return Response({
-                        'error': 'This article is only available to subscribers'
-                    }, status=status.HTTP_403_FORBIDDEN)
+        # Subscriber-only articles are let through get_queryset for non-subscribers
+        # so they can be refused with a clearer error than a 404
+        if getattr(instance, 'requires_subscription', False):
+            return Response({
+                'error': 'This article is only available to subscribers'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        # Count the view (buffered in the cache when configured) and mirror it locally
+        instance.view_count += Article.record_view(instance.pk)
+        
+        # Admins and authors get the article without the get_queryset annotation
+        if getattr(instance, 'comments_total', None) is None:
+            instance.comments_total = instance.comments.count()
         
-        # Update view count
-        instance.view_count += 1
-        instance.save(update_fields=['view_count'])
+        # The view count changes on every request, so the ETag is weak and covers
+        # everything else: answer 304 when the article and its comments are unchanged
+        etag = 'W/' + quote_etag(
+            f"{instance.pk}-{int(instance.updated_at.timestamp() * 1000000)}-{instance.comments_total}"
+        )
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
         
         serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        response = Response(serializer.data)
+        response['ETag'] = etag
+        return response
     
     @swagger_auto_schema(
         operation_description="Create a new article (doctors only). Note: featured_image should be sent as a file upload in a multipart form request.",
@@ -2250,148 +2388,163 @@ class ArticleViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
     
+    # Permission classes hold no state, so one shared instance per action is enough
+    ACTION_PERMISSIONS = {
+        'create': (IsDoctorUser(),),
+        'update': (IsDoctorUser(),),  # Only author can edit, enforced in perform_update
+        'partial_update': (IsDoctorUser(),),
+        'destroy': (IsDoctorUser(),),  # Allow doctors to delete their own articles
+        # Moderation actions, matching the permission_classes declared on each @action
+        'approve': (IsAdminUser(),),
+        'reject': (IsAdminUser(),),
+        'publish': ((IsDoctorUser | IsAdminUser)(),),
+        'unpublish': ((IsDoctorUser | IsAdminUser)(),),
+    }
+    DEFAULT_PERMISSIONS = (permissions.IsAuthenticated(),)
+
+    # Static filter pieces shared by every get_queryset call
+    PUBLISHED_Q = Q(is_approved=True, is_published=True)
+    SUBSCRIBER_VISIBILITY = ('public', 'subscribers')
+    # Word exports larger than this (in bytes) are buffered on disk instead of in memory
+    EXPORT_SPOOL_MAX_SIZE = 1024 * 1024
+    # Actions that return many articles, served without the article body
+    LIST_ACTIONS = frozenset(['list', 'featured', 'popular', 'recent', 'by_condition', 'my_articles'])
+
     def get_permissions(self):
-        if self.action in ['create']:
-            permission_classes = [IsDoctorUser]
-        elif self.action in ['update', 'partial_update']:
-            permission_classes = [IsDoctorUser]  # Only author can edit, enforced in perform_update
-        elif self.action in ['destroy']:
-            permission_classes = [IsDoctorUser]  # Allow doctors to delete their own articles
-        else:
-            permission_classes = [permissions.IsAuthenticated]
-        return [permission() for permission in permission_classes]
+        return self.ACTION_PERMISSIONS.get(self.action, self.DEFAULT_PERMISSIONS)
+    
+    def _today(self):
+        """
+        Today's date, taken once per request so every check in it agrees on the day.
+        """
+        if not hasattr(self.request, '_today'):
+            self.request._today = timezone.now().date()
+        return self.request._today
+
+    def _has_active_subscription(self):
+        """
+        Whether the requesting user is a patient with an active subscription.
+        Reads the denormalized Patient.subscription_expires_at, memoized on the request.
+        """
+        if not hasattr(self.request, '_has_active_subscription'):
+            has_active_subscription = False
+            if hasattr(self.request.user, 'patient'):
+                expires_at = self.request.user.patient.subscription_expires_at
+                has_active_subscription = expires_at is not None and expires_at >= self._today()
+            self.request._has_active_subscription = has_active_subscription
+        return self.request._has_active_subscription
     
     def get_queryset(self):
         # Basic queryset filtering
-        if self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists():
+        if self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set:
             # Admins can see all articles including unapproved ones
-            queryset = Article.objects.all()
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='doctor').exists():
+            queryset = self.queryset.all()
+        elif self.request.user.is_authenticated and 'doctor' in self.request.user.role_name_set:
             # Doctors can see all approved/published articles plus their own drafts
             try:
                 doctor = self.request.user.doctor
-                queryset = Article.objects.filter(
-                    Q(is_approved=True, is_published=True) |  # All published articles
+                queryset = self.queryset.filter(
+                    self.PUBLISHED_Q |  # All published articles
                     Q(author=doctor)  # Their own articles regardless of approval/publish status
                 )
             except Doctor.DoesNotExist:
                 # If doctor profile doesn't exist, fall back to published articles only
-                queryset = Article.objects.filter(is_approved=True, is_published=True)
+                queryset = self.queryset.filter(self.PUBLISHED_Q)
         else:
             # Patients and other users can only see approved and published articles
-            queryset = Article.objects.filter(is_approved=True, is_published=True)
+            queryset = self.queryset.filter(self.PUBLISHED_Q)
             
             # Apply visibility filtering for patients
             # If patient has an active subscription, they can see 'subscribers' articles
             # Otherwise, they can only see 'public' articles
-            has_active_subscription = False
-            has_patient_profile = hasattr(self.request.user, 'patient')
-            
-            if has_patient_profile:
-                # Case 1: User has a patient profile, check for active subscription
-                try:
-                    patient = self.request.user.patient
-                    has_active_subscription = PatientSubscription.objects.filter(
-                        patient=patient,
-                        status='active',
-                        end_date__gte=timezone.now().date()
-                    ).exists()
-                except Exception:
-                    # Case 2: Error getting subscription info, default to no subscription
-                    has_active_subscription = False
-            
-            # Case 3: Normal subscriber with active subscription can see subscriber content
             # Users without patient profile or without active subscription see only public articles
-            if has_active_subscription:
+            if self._has_active_subscription():
                 # Subscribers can see both public and subscriber-only content
-                queryset = queryset.filter(visibility__in=['public', 'subscribers'])
+                queryset = queryset.filter(visibility__in=self.SUBSCRIBER_VISIBILITY)
+            elif self.action == 'retrieve':
+                # Flag subscriber-only articles so retrieve can answer 403 instead of 404
+                queryset = queryset.filter(visibility__in=self.SUBSCRIBER_VISIBILITY).annotate(
+                    requires_subscription=Case(
+                        When(visibility='subscribers', then=Value(True)),
+                        default=Value(False),
+                        output_field=BooleanField()
+                    )
+                )
             else:
                 # Filter to only show public articles to non-subscribers
                 queryset = queryset.filter(visibility='public')
             
-        # Additional filtering
-        category = self.request.query_params.get('category')
-        if category:
-            queryset = queryset.filter(category=category)
-            
-        author_id = self.request.query_params.get('author_id')
-        if author_id:
-            queryset = queryset.filter(author_id=author_id)
-            
-        # Filter by featured status
-        featured = self.request.query_params.get('featured')
-        if featured and featured.lower() == 'true':
-            queryset = queryset.filter(is_featured=True)
-            
-        # Filter by visibility
-        visibility = self.request.query_params.get('visibility')
-        if visibility:
-            queryset = queryset.filter(visibility=visibility)
-            
-        # Filter by related health condition
-        condition = self.request.query_params.get('condition')
-        if condition:
-            queryset = queryset.filter(related_conditions__icontains=condition)
-            
-        # Date range filtering
-        date_from = self.request.query_params.get('date_from')
-        if date_from:
-            try:
-                date_from = datetime.strptime(date_from, '%Y-%m-%d').date()
-                queryset = queryset.filter(publish_date__date__gte=date_from)
-            except ValueError:
-                pass
-                
-        date_to = self.request.query_params.get('date_to')
-        if date_to:
-            try:
-                date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
-                queryset = queryset.filter(publish_date__date__lte=date_to)
-            except ValueError:
-                pass
-            
-        # Sort by options
-        sort_by = self.request.query_params.get('sort_by')
-        if sort_by:
-            if sort_by == 'popular':
-                queryset = queryset.order_by('-view_count')
-            elif sort_by == 'newest':
-                queryset = queryset.order_by('-publish_date')
-            elif sort_by == 'oldest':
-                queryset = queryset.order_by('publish_date')
-                
-        # Free text search across multiple fields
-        search = self.request.query_params.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | 
-                Q(content__icontains=search) |
-                Q(summary__icontains=search) |
-                Q(tags__icontains=search) |
-                Q(related_conditions__icontains=search)
-            )
-            
-        # Filter by approval status (admin only)
-        if self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists():
-            is_approved = self.request.query_params.get('is_approved')
-            if is_approved:
-                queryset = queryset.filter(is_approved=is_approved.lower() == 'true')
-                
-        # Filter by publication status
-        is_published = self.request.query_params.get('is_published')
-        if is_published:
-            queryset = queryset.filter(is_published=is_published.lower() == 'true')
-            
-        # Reading time filter
-        reading_time = self.request.query_params.get('reading_time')
-        if reading_time:
-            try:
-                reading_time = int(reading_time)
-                queryset = queryset.filter(reading_time__lte=reading_time)
-            except ValueError:
-                pass
-            
-        return queryset
+        # Query parameter filters are applied by ArticleFilter (see filter_backends)
+        
+        # List responses don't include the article body, so don't load it
+        if self.action in self.LIST_ACTIONS:
+            queryset = queryset.defer('content')
+        
+        # Count comments in the same query instead of once per serialized article
+        return queryset.annotate(comments_total=Count('comments'))
+    
+    def _listing_scope(self):
+        """
+        Name for the set of articles the requesting user may see, used in listing cache keys.
+        """
+        user = self.request.user
+        if 'admin' in user.role_name_set:
+            return 'admin'
+        if 'doctor' in user.role_name_set:
+            doctor = getattr(user, 'doctor', None)
+            return f'doctor_{doctor.pk}' if doctor else 'published'
+        return 'subscribers' if self._has_active_subscription() else 'public'
+    
+    def _cached_listing_response(self, build_queryset):
+        """
+        Serve a featured/popular/recent listing from the cache, building and caching
+        it on a miss. Entries are shared by users with the same visibility scope and
+        are retired by Article.invalidate_listing_cache().
+        """
+        query = hashlib.md5(self.request.query_params.urlencode().encode()).hexdigest()
+        cache_key = (
+            f"article_listing_{Article.listing_cache_version()}_{self.action}_"
+            f"{self._listing_scope()}_{query}"
+        )
+        # Cache the payload with an ETag derived from it, so the ETag changes whenever a
+        # rebuilt listing differs (e.g. popular order after view counts move) and
+        # repeat polls of a cached listing cost no query
+        cached = cache.get(cache_key)
+        if cached is None:
+            serializer = self.get_serializer(build_queryset(), many=True)
+            data = serializer.data
+            payload = json.dumps(data, sort_keys=True, default=str)
+            cached = ('W/' + quote_etag(hashlib.md5(payload.encode()).hexdigest()), data)
+            cache.set(cache_key, cached, Article.LISTING_CACHE_TIMEOUT)
+        etag, data = cached
+        
+        if etag in parse_etags(self.request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        return response
+    
+    def get_serializer(self, *args, **kwargs):
+        # Article lists report views still buffered in the cache, like retrieve does
+        if kwargs.get('many') and args:
+            articles = list(args[0])
+            Article.add_pending_views(articles)
+            args = (articles,) + args[1:]
+        return super().get_serializer(*args, **kwargs)
+    
+    def get_serializer_class(self):
+        if self.action in self.LIST_ACTIONS:
+            return ArticleListSerializer
+        return super().get_serializer_class()
+    
+    def filter_queryset(self, queryset):
+        """
+        Apply ArticleFilter to listings only; detail actions ignore list query parameters
+        """
+        if self.action not in self.LIST_ACTIONS:
+            return queryset
+        return super().filter_queryset(queryset)
     
     def get_object(self):
         """
@@ -2401,7 +2554,7 @@ class ArticleViewSet(viewsets.ModelViewSet):
         # allow admins and authors to access any article (bypass filtering)
         if self.action in ['retrieve', 'update', 'partial_update', 'destroy', 'approve', 'publish', 'unpublish', 'view']:
             # Check if user is admin
-            if self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists():
+            if self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set:
                 # Admins can access any article
                 return get_object_or_404(Article, pk=self.kwargs.get('pk'))
             
@@ -2437,13 +2590,13 @@ class ArticleViewSet(viewsets.ModelViewSet):
             raise serializers.ValidationError("Doctor profile not found")
     
     def perform_update(self, serializer):
-        # Get the article instance
-        instance = self.get_object()
+        # update() already loaded the article through get_object()
+        instance = serializer.instance
         
         # Check if user is the author
         try:
             doctor = self.request.user.doctor
-            if instance.author != doctor and not (self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists()):
+            if instance.author != doctor and not (self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set):
                 raise serializers.ValidationError("You can only edit your own articles")
                 
             # If this is an already approved article being edited by its author, 
@@ -2455,7 +2608,7 @@ class ArticleViewSet(viewsets.ModelViewSet):
                 
         except Doctor.DoesNotExist:
             # If user is admin, they can edit regardless
-            if self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists():
+            if self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set:
                 serializer.save()
             else:
                 raise serializers.ValidationError("Doctor profile not found")
@@ -2464,12 +2617,12 @@ class ArticleViewSet(viewsets.ModelViewSet):
         # Check if user is the author or admin
         try:
             doctor = self.request.user.doctor
-            if instance.author != doctor and not (self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists()):
+            if instance.author != doctor and not (self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set):
                 raise serializers.ValidationError("You can only delete your own articles")
             instance.delete()
         except Doctor.DoesNotExist:
             # If user is admin, they can delete regardless
-            if self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists():
+            if self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set:
                 instance.delete()
             else:
                 raise serializers.ValidationError("Doctor profile not found")
@@ -2501,41 +2654,52 @@ class ArticleViewSet(viewsets.ModelViewSet):
         """
         Endpoint for admins to approve an article
         """
-        article = self.get_object()
+        try:
+            article_id = uuid.UUID(str(pk))
+        except ValueError:
+            raise Http404
         
-        # Check if article is already approved
-        if article.is_approved:
-            return Response({
-                'error': 'Article is already approved'
-            }, status=status.HTTP_400_BAD_REQUEST)
-            
-        # Approve the article
-        article.is_approved = True
-        article.approved_by = request.user
-        article.approval_date = timezone.now()
+        now = timezone.now()
+        updates = {
+            'is_approved': True,
+            'approved_by': request.user,
+            'approval_date': now,
+            'updated_at': now,
+        }
         
         # Add approval notes if provided
         approval_notes = request.data.get('approval_notes')
         if approval_notes:
-            article.approval_notes = approval_notes
+            updates['approval_notes'] = approval_notes
             
         # Set publish status if provided
         publish = request.data.get('publish')
         if publish and publish.lower() == 'true':
-            article.is_published = True
-            article.publish_date = timezone.now()
+            updates['is_published'] = True
+            updates['publish_date'] = now
             
         # Set visibility if provided
         visibility = request.data.get('visibility')
         if visibility in ['public', 'subscribers', 'private']:
-            article.visibility = visibility
+            updates['visibility'] = visibility
             
         # Set featured status if provided
         featured = request.data.get('featured')
         if featured is not None:
-            article.is_featured = featured.lower() == 'true'
-            
-        article.save()
+            updates['is_featured'] = featured.lower() == 'true'
+        
+        # Approve in one conditional UPDATE, which also settles concurrent approvals
+        approved = Article.objects.filter(pk=article_id, is_approved=False).update(**updates)
+        if approved:
+            # update() skips the post_save receiver that normally does this
+            Article.invalidate_listing_cache()
+        
+        article = self.get_object()
+        if not approved:
+            # The article exists (get_object would have raised 404) but was already approved
+            return Response({
+                'error': 'Article is already approved'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         serializer = self.get_serializer(article)
         return Response(serializer.data)
@@ -2617,7 +2781,7 @@ class ArticleViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_400_BAD_REQUEST)
             
         # Check if user is the author or admin
-        is_admin = request.user.roles.filter(name='admin').exists()
+        is_admin = 'admin' in request.user.role_name_set
         try:
             doctor = request.user.doctor
             is_author = (article.author == doctor)
@@ -2700,7 +2864,7 @@ class ArticleViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_400_BAD_REQUEST)
             
         # Check if user is the author or admin
-        is_admin = request.user.roles.filter(name='admin').exists()
+        is_admin = 'admin' in request.user.role_name_set
         try:
             doctor = request.user.doctor
             is_author = (article.author == doctor)
@@ -2749,8 +2913,8 @@ class ArticleViewSet(viewsets.ModelViewSet):
         Endpoint to increment view count for an article
         """
         article = self.get_object()
-        article.view_count += 1
-        article.save()
+        # Atomic increment (see Article.record_view) instead of rewriting the whole row
+        article.view_count += Article.record_view(article.pk)
         
         return Response({'status': 'view counted', 'view_count': article.view_count})
     
@@ -2766,7 +2930,7 @@ class ArticleViewSet(viewsets.ModelViewSet):
                             description="Sort by view count (popular), newest first (newest), or oldest first (oldest)")
         ],
         responses={
-            200: ArticleSerializer(many=True)
+            200: ArticleListSerializer(many=True)
         }
     )
     @action(detail=False, methods=['get'])
@@ -2776,7 +2940,8 @@ class ArticleViewSet(viewsets.ModelViewSet):
         """
         try:
             doctor = request.user.doctor
-            articles = Article.objects.filter(author=doctor)
+            # Same joins and comment count annotation as the main article queryset
+            articles = self.queryset.filter(author=doctor).defer('content').annotate(comments_total=Count('comments'))
             
             # Optional filtering
             status_param = request.query_params.get('status')
@@ -2819,7 +2984,7 @@ class ArticleViewSet(viewsets.ModelViewSet):
                             description="Maximum number of featured articles to return (default: 5)")
         ],
         responses={
-            200: ArticleSerializer(many=True)
+            200: ArticleListSerializer(many=True)
         }
     )
     @action(detail=False, methods=['get'])
@@ -2827,23 +2992,17 @@ class ArticleViewSet(viewsets.ModelViewSet):
         """
         Endpoint to get featured articles
         """
-        # Get the base queryset with proper permissions applied
-        queryset = self.get_queryset()
+        def build_queryset():
+            # Get the base queryset with proper permissions applied
+            queryset = self.filter_queryset(self.get_queryset())
         
-        # Further filter to only featured articles
-        queryset = queryset.filter(is_featured=True)
+            # Further filter to only featured articles
+            queryset = queryset.filter(is_featured=True)
         
-        # Limit to a reasonable number
-        limit = request.query_params.get('limit', 5)
-        try:
-            limit = int(limit)
-        except ValueError:
-            limit = 5
-            
-        queryset = queryset[:limit]
+            # Limit to a reasonable number
+            return queryset[:parse_limit(request, default=5)]
         
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self._cached_listing_response(build_queryset)
         
     @swagger_auto_schema(
         method='get',
@@ -2853,7 +3012,7 @@ class ArticleViewSet(viewsets.ModelViewSet):
                             description="Maximum number of popular articles to return (default: 10)")
         ],
         responses={
-            200: ArticleSerializer(many=True)
+            200: ArticleListSerializer(many=True)
         }
     )
     @action(detail=False, methods=['get'])
@@ -2861,23 +3020,17 @@ class ArticleViewSet(viewsets.ModelViewSet):
         """
         Endpoint to get popular articles based on view count
         """
-        # Get the base queryset with proper permissions applied
-        queryset = self.get_queryset()
+        def build_queryset():
+            # Get the base queryset with proper permissions applied
+            queryset = self.filter_queryset(self.get_queryset())
         
-        # Order by view count (most viewed first)
-        queryset = queryset.order_by('-view_count')
+            # Order by view count (most viewed first)
+            queryset = queryset.order_by('-view_count')
         
-        # Limit to a reasonable number
-        limit = request.query_params.get('limit', 10)
-        try:
-            limit = int(limit)
-        except ValueError:
-            limit = 10
-            
-        queryset = queryset[:limit]
+            # Limit to a reasonable number
+            return queryset[:parse_limit(request, default=10)]
         
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self._cached_listing_response(build_queryset)
         
     @swagger_auto_schema(
         method='get',
@@ -2887,7 +3040,7 @@ class ArticleViewSet(viewsets.ModelViewSet):
                             description="Maximum number of recent articles to return (default: 10)")
         ],
         responses={
-            200: ArticleSerializer(many=True)
+            200: ArticleListSerializer(many=True)
         }
     )
     @action(detail=False, methods=['get'])
@@ -2895,23 +3048,17 @@ class ArticleViewSet(viewsets.ModelViewSet):
         """
         Endpoint to get recently published articles
         """
-        # Get the base queryset with proper permissions applied
-        queryset = self.get_queryset()
+        def build_queryset():
+            # Get the base queryset with proper permissions applied
+            queryset = self.filter_queryset(self.get_queryset())
         
-        # Order by publish date (most recent first)
-        queryset = queryset.filter(publish_date__isnull=False).order_by('-publish_date')
+            # Order by publish date (most recent first)
+            queryset = queryset.filter(publish_date__isnull=False).order_by('-publish_date')
         
-        # Limit to a reasonable number
-        limit = request.query_params.get('limit', 10)
-        try:
-            limit = int(limit)
-        except ValueError:
-            limit = 10
-            
-        queryset = queryset[:limit]
+            # Limit to a reasonable number
+            return queryset[:parse_limit(request, default=10)]
         
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self._cached_listing_response(build_queryset)
         
     @swagger_auto_schema(
         method='get',
@@ -2923,7 +3070,7 @@ class ArticleViewSet(viewsets.ModelViewSet):
                             description="Sort by popularity, newest, or oldest")
         ],
         responses={
-            200: ArticleSerializer(many=True),
+            200: ArticleListSerializer(many=True),
             400: openapi.Response("Bad Request", openapi.Schema(
                 type=openapi.TYPE_OBJECT,
                 properties={
@@ -2943,11 +3090,9 @@ class ArticleViewSet(viewsets.ModelViewSet):
                 'error': 'condition parameter is required'
             }, status=status.HTTP_400_BAD_REQUEST)
             
-        # Get the base queryset with proper permissions applied
-        queryset = self.get_queryset()
-        
-        # Filter by related conditions
-        queryset = queryset.filter(related_conditions__icontains=condition)
+        # Get the base queryset with proper permissions applied; ArticleFilter
+        # narrows it to the condition's slug
+        queryset = self.filter_queryset(self.get_queryset())
         
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
@@ -2959,13 +3104,15 @@ class ArticleViewSet(viewsets.ModelViewSet):
         """
         article = self.get_object()
         
-        # Check if user can view this article (same logic as get_queryset)
-        if not article.is_published and not request.user.is_staff:
-            # If not published, only author and admin can export
-            if hasattr(request.user, 'doctor') and article.author.user != request.user:
-                return Response({
-                    'error': 'You do not have permission to export this article'
-                }, status=status.HTTP_403_FORBIDDEN)
+        # Check if user can view this article (same logic as get_queryset):
+        # unpublished articles can only be exported by their author or an admin
+        doctor = getattr(request.user, 'doctor', None)
+        is_author = doctor is not None and article.author_id == doctor.pk
+        is_admin = request.user.is_staff or 'admin' in request.user.role_name_set
+        if not article.is_published and not (is_author or is_admin):
+            return Response({
+                'error': 'You do not have permission to export this article'
+            }, status=status.HTTP_403_FORBIDDEN)
         
         # Create Word document
         doc = Document()
@@ -2996,11 +3143,9 @@ class ArticleViewSet(viewsets.ModelViewSet):
         # Add main content
         doc.add_heading("Content", level=2)
         
-        # Split content into paragraphs and add them
-        content_paragraphs = article.content.split('\n')
-        for paragraph_text in content_paragraphs:
-            if paragraph_text.strip():
-                doc.add_paragraph(paragraph_text.strip())
+        # Add each non-blank line of the content as a paragraph
+        for paragraph_text in filter(None, map(str.strip, article.content.splitlines())):
+            doc.add_paragraph(paragraph_text)
         
         # Add footer with export info
         doc.add_paragraph("")
@@ -3008,25 +3153,23 @@ class ArticleViewSet(viewsets.ModelViewSet):
         doc.add_paragraph(f"Exported on: {timezone.now().strftime('%B %d, %Y at %I:%M %p')}")
         doc.add_paragraph(f"Exported by: {request.user.get_full_name()}")
         
-        # Save document to memory
-        doc_io = io.BytesIO()
-        doc.save(doc_io)
-        doc_io.seek(0)
-        
-        # Create response
-        response = HttpResponse(
-            doc_io.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        )
+        # Save the document to memory, spilling large documents to disk
+        doc_file = tempfile.SpooledTemporaryFile(max_size=self.EXPORT_SPOOL_MAX_SIZE)
+        doc.save(doc_file)
+        doc_file.seek(0)
         
         # Set filename - sanitize title for filename
-        safe_title = "".join(c for c in article.title if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        safe_title = EXPORT_FILENAME_UNSAFE_RE.sub('', article.title).rstrip()
         safe_title = safe_title.replace(' ', '_')[:50]  # Limit length
         filename = f"article_{safe_title}.docx"
         
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        return response
+        # Stream the file in chunks rather than copying it into the response body
+        return FileResponse(
+            doc_file,
+            as_attachment=True,
+            filename=filename,
+            content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        )
  
  
 class ArticleCommentViewSet(viewsets.ModelViewSet):
@@ -3052,7 +3195,15 @@ class ArticleCommentViewSet(viewsets.ModelViewSet):
         return super().list(request, *args, **kwargs)
     
     def get_queryset(self):
-        queryset = ArticleComment.objects.all()
+        queryset = ArticleComment.objects.select_related('user', 'parent_comment')
+        if self.action in ['list', 'retrieve']:
+            # Load each comment's author roles and the replies the serializer nests
+            # in a fixed number of queries instead of several per comment; the
+            # like/unlike/reply actions don't serialize these, so skip them there
+            queryset = queryset.prefetch_related(
+                'user__roles',
+                Prefetch('replies', queryset=ArticleComment.objects.select_related('user').prefetch_related('user__roles'))
+            )
         
         # Only show top-level comments by default
         top_level_only = self.request.query_params.get('top_level_only')
@@ -3077,7 +3228,7 @@ class ArticleCommentViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         # Ensure users can only edit their own comments
         comment = self.get_object()
-        if comment.user != self.request.user and not (self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists()):
+        if comment.user != self.request.user and not (self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set):
             raise serializers.ValidationError("You can only edit your own comments")
         serializer.save()
     
@@ -3108,21 +3259,19 @@ class ArticleCommentViewSet(viewsets.ModelViewSet):
         comment = self.get_object()
         user = request.user
         
-        # Check if user already liked this comment
-        existing_like = ArticleCommentLike.objects.filter(comment=comment, user=user).exists()
-        if existing_like:
-            return Response({
-                'error': 'You have already liked this comment'
-            }, status=status.HTTP_400_BAD_REQUEST)
-            
-        # Create a new like
-        ArticleCommentLike.objects.create(comment=comment, user=user)
-        
-        # Update the comment's like count
-        comment.like_count += 1
-        comment.save()
+        # Create the like and bump the count together, incrementing in SQL so
+        # concurrent likes don't overwrite each other. The (comment, user) unique
+        # constraint makes get_or_create the already-liked check as well.
+        with transaction.atomic():
+            _, created = ArticleCommentLike.objects.get_or_create(comment=comment, user=user)
+            if not created:
+                return Response({
+                    'error': 'You have already liked this comment'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            ArticleComment.objects.filter(pk=comment.pk).update(like_count=F('like_count') + 1)
+        like_count = ArticleComment.objects.values_list('like_count', flat=True).get(pk=comment.pk)
         
-        return Response({'status': 'comment liked', 'like_count': comment.like_count})
+        return Response({'status': 'comment liked', 'like_count': like_count})
     
     @swagger_auto_schema(
         method='post',
@@ -3152,19 +3301,18 @@ class ArticleCommentViewSet(viewsets.ModelViewSet):
         user = request.user
         
         # Check if user has liked this comment
-        try:
-            like = ArticleCommentLike.objects.get(comment=comment, user=user)
-            like.delete()
-            
-            # Update the comment's like count
-            comment.like_count = max(0, comment.like_count - 1)
-            comment.save()
+        with transaction.atomic():
+            deleted, _ = ArticleCommentLike.objects.filter(comment=comment, user=user).delete()
+            if not deleted:
+                return Response({
+                    'error': 'You have not liked this comment'
+                }, status=status.HTTP_400_BAD_REQUEST)
             
-            return Response({'status': 'comment unliked', 'like_count': comment.like_count})
-        except ArticleCommentLike.DoesNotExist:
-            return Response({
-                'error': 'You have not liked this comment'
-            }, status=status.HTTP_400_BAD_REQUEST)
+            # Update the comment's like count without going below zero
+            ArticleComment.objects.filter(pk=comment.pk).update(like_count=Greatest(F('like_count') - 1, 0))
+        like_count = ArticleComment.objects.values_list('like_count', flat=True).get(pk=comment.pk)
+        
+        return Response({'status': 'comment unliked', 'like_count': like_count})
     
     @swagger_auto_schema(
         method='post',
@@ -3206,12 +3354,12 @@ class ArticleCommentViewSet(viewsets.ModelViewSet):
                 'error': 'Content is required for a reply'
             }, status=status.HTTP_400_BAD_REQUEST)
             
-        # Create the reply
+        # Create the reply; the doctor flag comes from the cached role names
         user = request.user
-        is_doctor = user.roles.filter(name='doctor').exists()
+        is_doctor = 'doctor' in user.role_name_set
         
         reply = ArticleComment.objects.create(
-            article=parent_comment.article,
+            article_id=parent_comment.article_id,
             content=content,
             user=user,
             is_doctor=is_doctor,
@@ -3248,7 +3396,7 @@ class PackageViewSet(viewsets.ModelViewSet):
         queryset = Package.objects.all()
         
         # Non-admin users only see active packages
-        if not (self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists()):
+        if not (self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set):
             queryset = queryset.filter(is_active=True)
         
         return queryset.order_by('price')
@@ -3277,12 +3425,13 @@ class PatientSubscriptionViewSet(viewsets.ModelViewSet):
         """
         Filter subscriptions by user role
         """
-        queryset = PatientSubscription.objects.all()
+        # The serializer nests each subscription's patient name, package and payment
+        queryset = PatientSubscription.objects.select_related('patient__user', 'package', 'payment')
         
-        if self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists():
+        if self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set:
             # Admin can see all subscriptions
             pass
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='patient').exists():
+        elif self.request.user.is_authenticated and 'patient' in self.request.user.role_name_set:
             # Patients can only see their own subscriptions
             try:
                 patient = self.request.user.patient
@@ -3317,12 +3466,18 @@ class PatientSubscriptionViewSet(viewsets.ModelViewSet):
                     'error': 'Package not found or inactive'
                 }, status=status.HTTP_404_NOT_FOUND)
             
-            # Check if patient has an active subscription
-            active_subscription = PatientSubscription.objects.filter(
-                patient=patient,
-                status='active',
-                end_date__gte=timezone.now().date()
-            ).first()
+            # Check if patient has an active subscription; the denormalized expiry
+            # date rules it out without a query, the row is only loaded for the error
+            today = timezone.now().date()
+            active_subscription = None
+            if patient.subscription_expires_at and patient.subscription_expires_at >= today:
+                active_subscription = PatientSubscription.objects.select_related(
+                    'patient__user', 'package'
+                ).filter(
+                    patient=patient,
+                    status='active',
+                    end_date__gte=today
+                ).first()
             
             if active_subscription:
                 return Response({
@@ -3331,30 +3486,33 @@ class PatientSubscriptionViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_400_BAD_REQUEST)
             
             # Create payment record
-            import secrets
-            payment_reference = f"PAY_{secrets.token_hex(8).upper()}"
-            
-            payment = Payment.objects.create(
-                reference=payment_reference,
-                amount=package.price,
-                payment_method=payment_method,
-                status='pending'
-            )
+            payment_reference = Payment.generate_reference('PAY')
             
-            # Create subscription
-            start_date = timezone.now().date()
+            start_date = today
             end_date = start_date + timedelta(days=package.duration_days)
             
-            subscription = PatientSubscription.objects.create(
-                patient=patient,
-                package=package,
-                payment=payment,
-                start_date=start_date,
-                end_date=end_date,
-                status='pending'
-            )
+            # Payment and subscription are written in one transaction so a failure
+            # can't leave an orphaned pending payment
+            with transaction.atomic():
+                payment = Payment.objects.create(
+                    reference=payment_reference,
+                    amount=package.price,
+                    payment_method=payment_method,
+                    status='pending'
+                )
+                
+                # Create subscription
+                subscription = PatientSubscription.objects.create(
+                    patient=patient,
+                    package=package,
+                    payment=payment,
+                    start_date=start_date,
+                    end_date=end_date,
+                    status='pending'
+                )
             
-            # Return subscription details with payment info
+            # Return subscription details with payment info, serialized from the
+            # in-memory instances (patient, user and package are already loaded)
             serializer = PatientSubscriptionSerializer(subscription)
             return Response({
                 'subscription': serializer.data,
@@ -3415,11 +3573,17 @@ class PatientSubscriptionViewSet(viewsets.ModelViewSet):
         try:
             patient = request.user.patient
             
-            active_subscription = PatientSubscription.objects.filter(
-                patient=patient,
-                status='active',
-                end_date__gte=timezone.now().date()
-            ).first()
+            # The denormalized expiry date answers "none" without a query
+            today = timezone.now().date()
+            active_subscription = None
+            if patient.subscription_expires_at and patient.subscription_expires_at >= today:
+                active_subscription = PatientSubscription.objects.select_related(
+                    'patient__user', 'package'
+                ).filter(
+                    patient=patient,
+                    status='active',
+                    end_date__gte=today
+                ).first()
             
             if not active_subscription:
                 return Response({
@@ -3591,13 +3755,20 @@ class PatientSubscriptionViewSet(viewsets.ModelViewSet):
                     'error': 'You can only cancel your own subscriptions'
                 }, status=status.HTTP_403_FORBIDDEN)
             
-            if subscription.status != 'active':
+            # Only an active subscription can be cancelled; the conditional UPDATE makes
+            # the check and the write one statement so a concurrent change cannot slip between them
+            cancelled = PatientSubscription.objects.filter(
+                pk=subscription.pk,
+                status='active'
+            ).update(status='cancelled', updated_at=timezone.now())
+            if not cancelled:
                 return Response({
                     'error': 'Only active subscriptions can be cancelled'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            subscription.status = 'cancelled'
-            subscription.save()
+            # update() skips post_save, so refresh what the signal would have
+            PatientSubscription.sync_expiry(Patient.objects.filter(pk=patient.pk))
+            PatientSubscription.invalidate_dashboard_cache()
             
             return Response({
                 'message': 'Subscription cancelled successfully'
@@ -3617,9 +3788,27 @@ class PaymentViewSet(viewsets.ModelViewSet):
     serializer_class = PaymentSerializer
     permission_classes = [permissions.IsAuthenticated]
     
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.pesapal_client = PesapalClient()
+    # Statuses a gateway response is still allowed to move a payment out of
+    OPEN_STATUSES = ['pending', 'processing']
+    
+    STATUS_SYNC_CACHE_KEY = 'pesapal_status:{}'
+    STATUS_SYNC_CACHE_TIMEOUT = 10
+    
+    def _transition(self, payment, new_status, from_statuses=None, **fields):
+        """
+        Move a payment to new_status with a conditional UPDATE so concurrent requests
+        cannot both act on the same transition. Returns False if another request got there first.
+        """
+        fields['updated_at'] = timezone.now()
+        claimed = Payment.objects.filter(
+            id=payment.id,
+            status__in=from_statuses or self.OPEN_STATUSES
+        ).update(status=new_status, **fields)
+        if claimed:
+            payment.status = new_status
+            for name, value in fields.items():
+                setattr(payment, name, value)
+        return bool(claimed)
     
     def get_permissions(self):
         """
@@ -3639,21 +3828,32 @@ class PaymentViewSet(viewsets.ModelViewSet):
         """
         queryset = Payment.objects.all()
         
-        if self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists():
+        if self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set:
             # Admin can see all payments
             pass
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='patient').exists():
+        elif self.request.user.is_authenticated and 'patient' in self.request.user.role_name_set:
             # Patients can only see payments for their subscriptions
             try:
                 patient = self.request.user.patient
-                queryset = queryset.filter(subscriptions__patient=patient)
+                # The join through subscriptions repeats a payment once per matching
+                # subscription, so collapse duplicates
+                queryset = queryset.filter(subscriptions__patient=patient).distinct()
             except Patient.DoesNotExist:
                 return Payment.objects.none()
         else:
             return Payment.objects.none()
         
+        if self.action == 'list':
+            # The list serializer leaves out gateway_response, so don't load it
+            queryset = queryset.defer('gateway_response')
+        
         return queryset.order_by('-created_at')
     
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return PaymentListSerializer
+        return super().get_serializer_class()
+    
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def process(self, request, pk=None):
         """
@@ -3662,11 +3862,14 @@ class PaymentViewSet(viewsets.ModelViewSet):
         try:
             payment = self.get_object()
             
+            # Get subscription details, with everything the order needs
+            subscriptions = payment.subscriptions.select_related('package', 'patient__user')
+            
             # Check if payment belongs to current user (if not admin)
-            if not request.user.roles.filter(name='admin').exists():
+            if 'admin' not in request.user.role_name_set:
                 try:
-                    patient = request.user.patient
-                    if not payment.subscriptions.filter(patient=patient).exists():
+                    subscription = subscriptions.filter(patient=request.user.patient).first()
+                    if subscription is None:
                         return Response({
                             'error': 'Payment not found'
                         }, status=status.HTTP_404_NOT_FOUND)
@@ -3674,14 +3877,14 @@ class PaymentViewSet(viewsets.ModelViewSet):
                     return Response({
                         'error': 'Patient profile not found'
                     }, status=status.HTTP_404_NOT_FOUND)
+            else:
+                subscription = subscriptions.first()
                             
             if payment.status != 'pending':
                 return Response({
                     'error': 'Payment already processed or failed'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Get subscription details
-            subscription = payment.subscriptions.first()
             if not subscription:
                 return Response({
                     'error': 'No subscription associated with this payment'
@@ -3689,9 +3892,11 @@ class PaymentViewSet(viewsets.ModelViewSet):
             
 
             
-            # Update payment status to processing
-            payment.status = 'processing'
-            payment.save()
+            # Claim the payment so a double submit cannot send two orders to Pesapal
+            if not self._transition(payment, 'processing', from_statuses=['pending']):
+                return Response({
+                    'error': 'Payment already processed or failed'
+                }, status=status.HTTP_400_BAD_REQUEST)
             
             # Prepare billing address from patient and user data
             patient = subscription.patient
@@ -3707,26 +3912,19 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 "notification_id": getattr(settings, 'PESAPAL_IPN_ID', ''),
                 "account_number": f"PAT_{patient.id}",
                 "billing_address": {
+                    **PESAPAL_BILLING_DEFAULTS,
                     "email_address": user.email,
-                    "phone_number": '254795941990',
-                    "country_code": "KE",
                     "first_name": user.first_name,
                     "last_name": user.last_name,
-                    "line_1": "Moi Avenue",      
-                    "line_2": "Suite 12",          
-                    "city": "Nairobi",           
-                    "state": "Nairobi County",    
-                    "postal_code": "00100",
-                    "zip_code": "00100" 
                 }
-            }            
+            }
 
-            pesapal_response = self.pesapal_client.submit_order_request(order_data)
+            pesapal_response = get_pesapal_client().submit_order_request(order_data)
             
             if pesapal_response.get("error"):
                 payment.status = 'failed'
                 payment.gateway_response = pesapal_response
-                payment.save()
+                payment.save(update_fields=['status', 'gateway_response', 'updated_at'])
 
                 
                 return Response({
@@ -3737,7 +3935,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
             # Update payment with Pesapal response
             payment.gateway_transaction_id = pesapal_response.get('order_tracking_id')
             payment.gateway_response = pesapal_response
-            payment.save()
+            payment.save(update_fields=['gateway_transaction_id', 'gateway_response', 'updated_at'])
             
             return Response({
                 'payment_id': payment.id,
@@ -3778,7 +3976,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_400_BAD_REQUEST)
             
             # Verify payment status with Pesapal
-            status_response = self.pesapal_client.get_transaction_status(order_tracking_id)
+            status_response = get_pesapal_client().get_transaction_status(order_tracking_id)
             
             if "error" in status_response:
                 return Response({
@@ -3787,20 +3985,18 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_400_BAD_REQUEST)
             
             # Update payment record
-            payment.gateway_transaction_id = order_tracking_id
-            payment.gateway_response = status_response
+            gateway_fields = {
+                'gateway_transaction_id': order_tracking_id,
+                'gateway_response': status_response,
+            }
             
             payment_status = status_response.get('payment_status_description', '').upper()
             
             if payment_status == 'COMPLETED':
-                payment.status = 'completed'
-                payment.save()
-                
-                # Activate associated subscriptions
-                subscriptions = payment.subscriptions.all()
-                for subscription in subscriptions:
-                    subscription.status = 'active'
-                    subscription.save()
+                with transaction.atomic():
+                    if self._transition(payment, 'completed', **gateway_fields):
+                        # Activate associated subscriptions
+                        PatientSubscription.activate_for_payment(payment)
                 
                 return Response({
                     'message': 'Payment completed successfully',
@@ -3809,8 +4005,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_200_OK)
             
             elif payment_status in ['FAILED', 'INVALID']:
-                payment.status = 'failed'
-                payment.save()
+                self._transition(payment, 'failed', **gateway_fields)
                 
                 return Response({
                     'message': 'Payment failed',
@@ -3819,8 +4014,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_200_OK)
             
             else:
-                payment.status = 'pending'
-                payment.save()
+                self._transition(payment, 'pending', **gateway_fields)
                 
                 return Response({
                     'message': 'Payment status pending',
@@ -3854,16 +4048,18 @@ class PaymentViewSet(viewsets.ModelViewSet):
                     'error': 'Order tracking ID is required'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Find payment by order tracking ID
-            try:
-                payment = Payment.objects.get(gateway_transaction_id=order_tracking_id)
-            except Payment.DoesNotExist:
+            # Find payment by order tracking ID. Recurring charges are recorded against
+            # the same tracking ID, so the original payment is the earliest one
+            payment = Payment.objects.filter(
+                gateway_transaction_id=order_tracking_id
+            ).order_by('created_at').first()
+            if payment is None:
                 return Response({
                     'error': 'Payment not found'
                 }, status=status.HTTP_404_NOT_FOUND)
             
             # Verify payment status with Pesapal
-            status_response = self.pesapal_client.get_transaction_status(order_tracking_id)
+            status_response = get_pesapal_client().get_transaction_status(order_tracking_id)
             
             if "error" in status_response:
                 return Response({
@@ -3875,66 +4071,69 @@ class PaymentViewSet(viewsets.ModelViewSet):
             upgrade_cancel_subscription_id = existing_response.get('upgrade_cancel_subscription_id')
             
             # Merge with new status response
-            payment.gateway_response = {**existing_response, **status_response}
+            gateway_response = {**existing_response, **status_response}
             payment_status = status_response.get('payment_status_description', '').upper()
             
+            # Pesapal retries IPNs, so the same notification can arrive on several
+            # workers at once. Only the worker that wins the status claim applies
+            # its side effects.
             if payment_status == 'COMPLETED':
-                payment.status = 'completed'
-                payment.save()
-                
-                # Check if this is an upgrade payment and handle old subscription cancellation
-                if upgrade_cancel_subscription_id:
-                    try:
-                        old_subscription = PatientSubscription.objects.get(id=upgrade_cancel_subscription_id)
-                        old_subscription.status = 'cancelled'
-                        old_subscription.save()
-                        
-                        # Log the cancellation for tracking
-                        import logging
-                        logger = logging.getLogger(__name__)
-                        logger.info(f"Cancelled old subscription {upgrade_cancel_subscription_id} after upgrade payment completion")
-                    except PatientSubscription.DoesNotExist:
-                        # Log error but don't fail the IPN processing
-                        import logging
-                        logger = logging.getLogger(__name__)
-                        logger.error(f"Old subscription {upgrade_cancel_subscription_id} not found for cancellation after upgrade")
-                
-                # Activate associated subscriptions
-                subscriptions = payment.subscriptions.all()
-                for subscription in subscriptions:
-                    subscription.status = 'active'
-                    subscription.save()
-                
-                # Handle recurring payments
-                if notification_type == 'RECURRING':
-                    # Create new payment record for recurring payment
-                    original_subscription = subscriptions.first()
-                    if original_subscription:
-                        # Calculate next payment date based on subscription frequency
-                        next_payment_date = original_subscription.end_date + timedelta(days=1)
-                        
-                        # Create new payment record
-                        import secrets
-                        new_payment = Payment.objects.create(
-                            reference=f"REC_{secrets.token_hex(8).upper()}",
-                            amount=payment.amount,
-                            currency=payment.currency,
-                            payment_method=payment.payment_method,
-                            status='completed',
-                            gateway_transaction_id=order_tracking_id,
-                            gateway_response=status_response
-                        )
-                        
-                        # Extend subscription
-                        original_subscription.end_date = next_payment_date + timedelta(days=original_subscription.package.duration_days)
-                        original_subscription.save()
-                        
-                        # Link payment to subscription
-                        new_payment.subscriptions.add(original_subscription)
+                with transaction.atomic():
+                    claimed = self._transition(payment, 'completed', gateway_response=gateway_response)
+                    
+                    # Check if this is an upgrade payment and handle old subscription cancellation
+                    if claimed and upgrade_cancel_subscription_id:
+                        try:
+                            old_subscription = PatientSubscription.objects.get(id=upgrade_cancel_subscription_id)
+                            old_subscription.status = 'cancelled'
+                            old_subscription.save(update_fields=['status', 'updated_at'])
+                            
+                            # Log the cancellation for tracking
+                            logger.info(f"Cancelled old subscription {upgrade_cancel_subscription_id} after upgrade payment completion")
+                        except PatientSubscription.DoesNotExist:
+                            # Log error but don't fail the IPN processing
+                            logger.error(f"Old subscription {upgrade_cancel_subscription_id} not found for cancellation after upgrade")
+                    
+                    # Activate associated subscriptions
+                    if claimed:
+                        PatientSubscription.activate_for_payment(payment)
+                    
+                    # Handle recurring payments
+                    if notification_type == 'RECURRING':
+                        # Create new payment record for recurring payment
+                        # Renewals move the subscription onto their REC_ payment, so find it through
+                        # any payment carrying this tracking ID rather than the original one
+                        original_subscription = PatientSubscription.objects.select_for_update().filter(
+                            payment__gateway_transaction_id=order_tracking_id
+                        ).select_related('package').first()
+                        if original_subscription:
+                            # Calculate next payment date based on subscription frequency
+                            next_payment_date = original_subscription.end_date + timedelta(days=1)
+                            
+                            # Key the recurring payment on Pesapal's confirmation code so a
+                            # retried notification finds the row instead of charging twice
+                            confirmation_code = status_response.get('confirmation_code')
+                            reference = f"REC_{confirmation_code}" if confirmation_code else Payment.generate_reference('REC')
+                            new_payment, created = Payment.objects.get_or_create(
+                                reference=reference,
+                                defaults={
+                                    'amount': payment.amount,
+                                    'currency': payment.currency,
+                                    'payment_method': payment.payment_method,
+                                    'status': 'completed',
+                                    'gateway_transaction_id': order_tracking_id,
+                                    'gateway_response': status_response,
+                                }
+                            )
+                            
+                            if created:
+                                # Extend subscription and link the payment to it in one UPDATE
+                                original_subscription.end_date = next_payment_date + timedelta(days=original_subscription.package.duration_days)
+                                original_subscription.payment = new_payment
+                                original_subscription.save(update_fields=['end_date', 'payment', 'updated_at'])
                 
             elif payment_status in ['FAILED', 'INVALID']:
-                payment.status = 'failed'
-                payment.save()
+                self._transition(payment, 'failed', gateway_response=gateway_response)
             
             return Response({
                 'message': 'IPN processed successfully',
@@ -3953,43 +4152,32 @@ class PaymentViewSet(viewsets.ModelViewSet):
         Check payment status and sync with Pesapal
         """
         try:
+            # get_queryset already limits patients to payments for their own subscriptions
             payment = self.get_object()
             
-            # Check if payment belongs to current user (if not admin)
-            if not request.user.roles.filter(name='admin').exists():
-                try:
-                    patient = request.user.patient
-                    if not payment.subscriptions.filter(patient=patient).exists():
-                        return Response({
-                            'error': 'Payment not found'
-                        }, status=status.HTTP_404_NOT_FOUND)
-                except Patient.DoesNotExist:
-                    return Response({
-                        'error': 'Patient profile not found'
-                    }, status=status.HTTP_404_NOT_FOUND)
-            
-            # If payment is not completed and has a gateway transaction ID, sync with Pesapal
-            if payment.status != 'completed' and payment.gateway_transaction_id:
+            # Settled payments cannot change any more, so only open ones with a
+            # gateway transaction ID are synced with Pesapal
+            if payment.status in self.OPEN_STATUSES and payment.gateway_transaction_id:
                 try:
-                    status_response = self.pesapal_client.get_transaction_status(payment.gateway_transaction_id)
+                    # Clients poll this endpoint; polls close together share one Pesapal call
+                    sync_cache_key = self.STATUS_SYNC_CACHE_KEY.format(payment.gateway_transaction_id)
+                    status_response = cache.get(sync_cache_key)
+                    if status_response is None:
+                        status_response = get_pesapal_client().get_transaction_status(payment.gateway_transaction_id)
+                        if "error" not in status_response:
+                            cache.set(sync_cache_key, status_response, self.STATUS_SYNC_CACHE_TIMEOUT)
                     
                     if "error" not in status_response:
-                        payment.gateway_response = status_response
                         payment_status = status_response.get('payment_status_description', '').upper()
                         
                         if payment_status == 'COMPLETED':
-                            payment.status = 'completed'
-                            payment.save()
-                            
-                            # Activate associated subscriptions
-                            subscriptions = payment.subscriptions.all()
-                            for subscription in subscriptions:
-                                subscription.status = 'active'
-                                subscription.save()
+                            with transaction.atomic():
+                                if self._transition(payment, 'completed', gateway_response=status_response):
+                                    # Activate associated subscriptions
+                                    PatientSubscription.activate_for_payment(payment)
                                 
                         elif payment_status in ['FAILED', 'INVALID']:
-                            payment.status = 'failed'
-                            payment.save()
+                            self._transition(payment, 'failed', gateway_response=status_response)
                 except Exception as e:
                     pass  # Continue with existing status if sync fails
             
@@ -4012,8 +4200,7 @@ class IsDoctorOrAdminUser(permissions.BasePermission):
             return False
         
         # Check if user has doctor role OR admin role
-        return (request.user.roles.filter(name='doctor').exists() or 
-                request.user.roles.filter(name='admin').exists())
+        return not request.user.role_name_set.isdisjoint({'doctor', 'admin'})
 
 class DoctorAvailabilityViewSet(viewsets.ModelViewSet):
     """
@@ -4039,12 +4226,11 @@ class DoctorAvailabilityViewSet(viewsets.ModelViewSet):
         """
         Filter availability by doctor
         """
-        queryset = DoctorAvailability.objects.all()
+        # The serializer shows each slot's doctor name, so join the doctor's user
+        queryset = DoctorAvailability.objects.select_related('doctor__user')
         
         # Filter by doctor_id if provided
         doctor_id = self.kwargs.get('doctor_id')
-
-        print("This is the doctor id:", doctor_id)
         if doctor_id:
             queryset = queryset.filter(doctor=doctor_id, is_available=True)
         
@@ -4054,7 +4240,7 @@ class DoctorAvailabilityViewSet(viewsets.ModelViewSet):
         """
         Ensure doctors can only create their own availability
         """
-        if self.request.user.roles.filter(name='doctor').exists():
+        if 'doctor' in self.request.user.role_name_set:
             try:
                 doctor = self.request.user.doctor
                 serializer.save(doctor=doctor)
@@ -4068,7 +4254,7 @@ class DoctorAvailabilityViewSet(viewsets.ModelViewSet):
         """
         Ensure doctors can only update their own availability
         """
-        if self.request.user.roles.filter(name='doctor').exists():
+        if 'doctor' in self.request.user.role_name_set:
             try:
                 doctor = self.request.user.doctor
                 if serializer.instance.doctor != doctor:
@@ -4084,7 +4270,7 @@ class DoctorAvailabilityViewSet(viewsets.ModelViewSet):
         """
         Ensure doctors can only delete their own availability
         """
-        if self.request.user.roles.filter(name='doctor').exists():
+        if 'doctor' in self.request.user.role_name_set:
             try:
                 doctor = self.request.user.doctor
                 if instance.doctor != doctor:
@@ -4101,14 +4287,14 @@ class DoctorAvailabilityViewSet(viewsets.ModelViewSet):
         """
         Get the current doctor's availability
         """
-        if not request.user.roles.filter(name='doctor').exists():
+        if 'doctor' not in request.user.role_name_set:
             return Response({
                 'error': 'Only doctors can access this endpoint'
             }, status=status.HTTP_403_FORBIDDEN)
         
         try:
             doctor = request.user.doctor
-            availability = DoctorAvailability.objects.filter(doctor=doctor)
+            availability = DoctorAvailability.objects.filter(doctor=doctor).select_related('doctor__user')
             serializer = self.get_serializer(availability, many=True)
             return Response(serializer.data)
         except Doctor.DoesNotExist:
@@ -4123,6 +4309,39 @@ class PackagePaymentTrackerViewSet(viewsets.ViewSet):
     """
     permission_classes = [IsAdminUser]
     
+    # Shorter searches match nearly every patient, so they are ignored rather than scanned for
+    MIN_SEARCH_LENGTH = 3
+    
+    # SQL version of User.get_full_name() falling back to the username
+    PATIENT_FULL_NAME = Coalesce(
+        NullIf(
+            Trim(Concat('patient__user__first_name', Value(' '), 'patient__user__last_name')),
+            Value('')
+        ),
+        'patient__user__username',
+        output_field=CharField()
+    )
+    
+    def _filter_subscriptions(self, queryset, request):
+        """
+        Apply the package_type, status and search query parameters shared by the list and exports
+        """
+        package_type = request.query_params.get('package_type')
+        status_filter = request.query_params.get('status')
+        search_query = (request.query_params.get('search') or '').strip()
+        
+        if package_type:
+            queryset = queryset.filter(package__name__icontains=package_type)
+        if status_filter:
+            queryset = queryset.filter(status=status_filter)
+        if len(search_query) >= self.MIN_SEARCH_LENGTH:
+            queryset = queryset.filter(
+                Q(patient__user__first_name__icontains=search_query) |
+                Q(patient__user__last_name__icontains=search_query) |
+                Q(patient__user__phone_number__icontains=search_query)
+            )
+        return queryset
+    
     @swagger_auto_schema(
         operation_description="Get package payment tracker dashboard metrics",
         responses={
@@ -4142,45 +4361,35 @@ class PackagePaymentTrackerViewSet(viewsets.ViewSet):
         """
         Get dashboard metrics for package payment tracker
         """
-        from django.db.models import Count, Q
-        from datetime import date, timedelta
-        
         today = date.today()
+        cache_key = PatientSubscription.dashboard_cache_key(today)
+        metrics = cache.get(cache_key)
+        if metrics is not None:
+            return Response(metrics)
+        
         week_end = today + timedelta(days=7)
         month_start = today.replace(day=1)
         
-        # Total Active Subscribers
-        total_active = PatientSubscription.objects.filter(
-            status='active',
-            start_date__lte=today,
-            end_date__gte=today
-        ).count()
-        
-        # Expiring This Week
-        expiring_week = PatientSubscription.objects.filter(
-            status='active',
-            end_date__range=[today, week_end]
-        ).count()
-        
-        # Renewed This Month (new subscriptions this month)
-        renewed_month = PatientSubscription.objects.filter(
-            status='active',
-            start_date__gte=month_start,
-            start_date__lte=today
-        ).count()
-        
-        # Overdue (expired but not renewed)
-        overdue = PatientSubscription.objects.filter(
-            status='expired',
-            end_date__lt=today
-        ).count()
+        # All four counters in one pass over the subscriptions table
+        counts = PatientSubscription.objects.filter(status__in=['active', 'expired']).aggregate(
+            # Total Active Subscribers
+            total_active=Count('id', filter=Q(status='active', start_date__lte=today, end_date__gte=today)),
+            # Expiring This Week
+            expiring_week=Count('id', filter=Q(status='active', end_date__range=[today, week_end])),
+            # Renewed This Month (new subscriptions this month)
+            renewed_month=Count('id', filter=Q(status='active', start_date__gte=month_start, start_date__lte=today)),
+            # Overdue (expired but not renewed)
+            overdue=Count('id', filter=Q(status='expired', end_date__lt=today)),
+        )
         
-        return Response({
-            'total_active_subscribers': total_active,
-            'expiring_this_week': expiring_week,
-            'renewed_this_month': renewed_month,
-            'overdue_not_renewed': overdue,
-        })
+        metrics = {
+            'total_active_subscribers': counts['total_active'],
+            'expiring_this_week': counts['expiring_week'],
+            'renewed_this_month': counts['renewed_month'],
+            'overdue_not_renewed': counts['overdue'],
+        }
+        cache.set(cache_key, metrics, PatientSubscription.DASHBOARD_CACHE_TIMEOUT)
+        return Response(metrics)
     
     @swagger_auto_schema(
         operation_description="Get paginated list of patient subscriptions with filtering",
@@ -4190,11 +4399,15 @@ class PackagePaymentTrackerViewSet(viewsets.ViewSet):
             openapi.Parameter('status', openapi.IN_QUERY, type=openapi.TYPE_STRING,
                             description="Filter by subscription status"),
             openapi.Parameter('search', openapi.IN_QUERY, type=openapi.TYPE_STRING,
-                            description="Search by patient name or phone"),
+                            description="Search by patient name or phone (at least 3 characters; shorter searches are ignored)"),
             openapi.Parameter('page', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
                             description="Page number for pagination"),
             openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
                             description="Number of items per page"),
+            openapi.Parameter('pagination', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                            description="'cursor' for next/previous cursors instead of page numbers and counts"),
+            openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                            description="Cursor from a previous response's next/previous link"),
         ]
     )
     @action(detail=False, methods=['get'], url_path='subscriptions')
@@ -4202,33 +4415,41 @@ class PackagePaymentTrackerViewSet(viewsets.ViewSet):
         """
         Get paginated list of patient subscriptions with filtering and search
         """
-        from django.core.paginator import Paginator
-        from django.db.models import Q
-        
         # Get query parameters
-        package_type = request.query_params.get('package_type')
-        status_filter = request.query_params.get('status')
-        search_query = request.query_params.get('search')
         page = int(request.query_params.get('page', 1))
         page_size = int(request.query_params.get('page_size', 10))
         
-        # Start with base queryset
+        # Start with base queryset, selecting only the columns the tracker table shows
         queryset = PatientSubscription.objects.select_related(
-            'patient__user', 'package', 'payment'
-        ).all()
+            'patient__user', 'package'
+        ).only(
+            'start_date', 'end_date', 'status', 'consultations_used', 'created_at',
+            'patient__user__phone_number', 'package__name', 'package__consultation_limit'
+        )
         
         # Apply filters
-        if package_type:
-            queryset = queryset.filter(package__name__icontains=package_type)
+        queryset = self._filter_subscriptions(queryset, request).annotate(full_name=self.PATIENT_FULL_NAME)
         
-        if status_filter:
-            queryset = queryset.filter(status=status_filter)
-        
-        if search_query:
-            queryset = queryset.filter(
-                Q(patient__user__first_name__icontains=search_query) |
-                Q(patient__user__last_name__icontains=search_query) |
-                Q(patient__user__phone_number__icontains=search_query)
+        # Work out the tracker status label in SQL rather than parsing each row's end date
+        today = date.today()
+        queryset = queryset.annotate(status_display=Case(
+            When(status='active', start_date__lte=today, end_date__gte=today,
+                 end_date__lte=today + timedelta(days=7), then=Value('Expiring Soon')),
+            When(status='active', start_date__lte=today, end_date__gt=today + timedelta(days=7),
+                 then=Value('Active')),
+            *[When(status=value, then=Value(label)) for value, label in PatientSubscription.STATUS_CHOICES],
+            # Statuses outside the choices (e.g. 'scheduled') are title-cased like the old Python label
+            default=Concat(Upper(Left('status', 1)), Substr('status', 2)),
+            output_field=CharField(),
+        ))
+        
+        # Cursor pagination skips the COUNT(*) over the filtered list; page numbers stay the default
+        if request.query_params.get('pagination') == 'cursor':
+            paginator = CreatedAtCursorPagination()
+            subscriptions = paginator.paginate_queryset(queryset, request, view=self)
+            serializer = PatientSubscriptionTrackerSerializer(subscriptions, many=True)
+            return paginator.get_paginated_response(
+                [self._format_subscription(subscription) for subscription in serializer.data]
             )
         
         # Order by creation date (newest first)
@@ -4239,7 +4460,7 @@ class PackagePaymentTrackerViewSet(viewsets.ViewSet):
         page_obj = paginator.get_page(page)
         
         # Serialize data
-        serializer = PatientSubscriptionSerializer(page_obj.object_list, many=True)
+        serializer = PatientSubscriptionTrackerSerializer(page_obj.object_list, many=True)
         
         # Prepare response data
         response_data = {
@@ -4249,47 +4470,27 @@ class PackagePaymentTrackerViewSet(viewsets.ViewSet):
             'page_size': page_size,
             'has_next': page_obj.has_next(),
             'has_previous': page_obj.has_previous(),
-            'results': []
+            'results': [self._format_subscription(subscription) for subscription in serializer.data]
         }
         
-        # Format results to match the design
-        for subscription in serializer.data:
-            # Get patient phone from user model
-            patient_phone = None
-            if subscription.get('patient'):
-                try:
-                    patient = Patient.objects.select_related('user').get(id=subscription['patient'])
-                    patient_phone = patient.user.phone_number
-                except Patient.DoesNotExist:
-                    pass
-            
-            # Determine status display
-            status_display = subscription.get('status', '').title()
-            if subscription.get('is_active'):
-                if subscription.get('end_date'):
-                    from datetime import datetime, date
-                    end_date = datetime.strptime(subscription['end_date'], '%Y-%m-%d').date()
-                    days_until_expiry = (end_date - date.today()).days
-                    if days_until_expiry <= 7:
-                        status_display = "Expiring Soon"
-                    else:
-                        status_display = "Active"
-            
-            result_item = {
-                'id': subscription['id'],
-                'patient_name': subscription.get('patient_name', 'N/A'),
-                'phone': patient_phone or 'N/A',
-                'package': subscription.get('package_name', 'N/A'),
-                'start_date': subscription.get('start_date'),
-                'end_date': subscription.get('end_date'),
-                'status': status_display,
-                'consultations_used': subscription.get('consultations_used', 0),
-                'consultations_remaining': subscription.get('consultations_remaining', 0),
-            }
-            response_data['results'].append(result_item)
-        
         return Response(response_data)
     
+    def _format_subscription(self, subscription):
+        """
+        Format a serialized subscription to match the design
+        """
+        return {
+            'id': subscription['id'],
+            'patient_name': subscription.get('patient_name', 'N/A'),
+            'phone': subscription.get('phone_number') or 'N/A',
+            'package': subscription.get('package_name', 'N/A'),
+            'start_date': subscription.get('start_date'),
+            'end_date': subscription.get('end_date'),
+            'status': subscription.get('status_display'),
+            'consultations_used': subscription.get('consultations_used', 0),
+            'consultations_remaining': subscription.get('consultations_remaining', 0),
+        }
+    
     @swagger_auto_schema(
         operation_description="Send reminder notification to patient about subscription",
         request_body=openapi.Schema(
@@ -4345,7 +4546,8 @@ class PackagePaymentTrackerViewSet(viewsets.ViewSet):
         manual_parameters=[
             openapi.Parameter('package_type', openapi.IN_QUERY, type=openapi.TYPE_STRING),
             openapi.Parameter('status', openapi.IN_QUERY, type=openapi.TYPE_STRING),
-            openapi.Parameter('search', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter('search', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                            description="Search by patient name or phone (at least 3 characters)"),
         ]
     )
     @action(detail=False, methods=['get'], url_path='export/csv')
@@ -4353,70 +4555,45 @@ class PackagePaymentTrackerViewSet(viewsets.ViewSet):
         """
         Export subscription data to CSV file
         """
-        import csv
-        from django.http import HttpResponse
-        from io import StringIO
-        
         # Get filtered queryset using same logic as subscriptions endpoint
-        package_type = request.query_params.get('package_type')
-        status_filter = request.query_params.get('status')
-        search_query = request.query_params.get('search')
-        
-        queryset = PatientSubscription.objects.select_related(
-            'patient__user', 'package', 'payment'
-        ).all()
-        
-        if package_type:
-            queryset = queryset.filter(package__name__icontains=package_type)
-        if status_filter:
-            queryset = queryset.filter(status=status_filter)
-        if search_query:
-            queryset = queryset.filter(
-                Q(patient__user__first_name__icontains=search_query) |
-                Q(patient__user__last_name__icontains=search_query) |
-                Q(patient__user__phone_number__icontains=search_query)
-            )
+        queryset = self._filter_subscriptions(
+            PatientSubscription.objects.all(), request
+        ).order_by('-created_at')
         
-        queryset = queryset.order_by('-created_at')
-        
-        # Create CSV response
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="package_subscriptions.csv"'
-        
-        writer = csv.writer(response)
+        values = queryset.annotate(full_name=self.PATIENT_FULL_NAME).values(
+            'full_name', 'patient__user__phone_number', 'package__name', 'package__consultation_limit',
+            'status', 'start_date', 'end_date', 'consultations_used', 'payment__amount'
+        )
         
-        # Write headers
-        writer.writerow([
+        def rows():
+            # Fetch plain rows in chunks so memory stays flat however many subscriptions match
+            for row in values.iterator(chunk_size=2000):
+                amount_paid = row['payment__amount']
+                
+                yield [
+                    row['full_name'],
+                    row['patient__user__phone_number'] or 'N/A',
+                    row['package__name'],
+                    row['start_date'],
+                    row['end_date'],
+                    row['status'].title(),
+                    row['consultations_used'],
+                    max(0, row['package__consultation_limit'] - row['consultations_used']),
+                    str(amount_paid) if amount_paid is not None else 'N/A'
+                ]
+        
+        return streaming_csv_response('package_subscriptions.csv', [
             'Patient Name', 'Phone', 'Package', 'Start Date', 'End Date',
             'Status', 'Consultations Used', 'Consultations Remaining', 'Amount Paid'
-        ])
-        
-        # Write data rows
-        for subscription in queryset:
-            patient_name = subscription.patient.user.get_full_name() or subscription.patient.user.username
-            patient_phone = subscription.patient.user.phone_number or 'N/A'
-            amount_paid = str(subscription.payment.amount) if subscription.payment else 'N/A'
-            
-            writer.writerow([
-                patient_name,
-                patient_phone,
-                subscription.package.name,
-                subscription.start_date,
-                subscription.end_date,
-                subscription.status.title(),
-                subscription.consultations_used,
-                subscription.consultations_remaining,
-                amount_paid
-            ])
-        
-        return response
+        ], rows())
     
     @swagger_auto_schema(
         operation_description="Export subscription data to PDF",
         manual_parameters=[
             openapi.Parameter('package_type', openapi.IN_QUERY, type=openapi.TYPE_STRING),
             openapi.Parameter('status', openapi.IN_QUERY, type=openapi.TYPE_STRING),
-            openapi.Parameter('search', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter('search', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                            description="Search by patient name or phone (at least 3 characters)"),
         ]
     )
     @action(detail=False, methods=['get'], url_path='export/pdf')
@@ -4430,29 +4607,11 @@ class PackagePaymentTrackerViewSet(viewsets.ViewSet):
         from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
         from reportlab.lib.units import inch
         from io import BytesIO
-        from datetime import date
         
         # Get filtered queryset
-        package_type = request.query_params.get('package_type')
-        status_filter = request.query_params.get('status')
-        search_query = request.query_params.get('search')
-        
-        queryset = PatientSubscription.objects.select_related(
-            'patient__user', 'package', 'payment'
-        ).all()
-        
-        if package_type:
-            queryset = queryset.filter(package__name__icontains=package_type)
-        if status_filter:
-            queryset = queryset.filter(status=status_filter)
-        if search_query:
-            queryset = queryset.filter(
-                Q(patient__user__first_name__icontains=search_query) |
-                Q(patient__user__last_name__icontains=search_query) |
-                Q(patient__user__phone_number__icontains=search_query)
-            )
-        
-        queryset = queryset.order_by('-created_at')
+        queryset = self._filter_subscriptions(
+            PatientSubscription.objects.all(), request
+        ).order_by('-created_at')
         
         # Create PDF
         buffer = BytesIO()
@@ -4479,23 +4638,8 @@ class PackagePaymentTrackerViewSet(viewsets.ViewSet):
         elements.append(date_para)
         elements.append(Spacer(1, 12))
         
-        # Table data
-        data = [['Patient Name', 'Package', 'Status', 'Start Date', 'End Date', 'Consultations']]
-        
-        for subscription in queryset:
-            patient_name = subscription.patient.user.get_full_name() or subscription.patient.user.username
-            data.append([
-                patient_name,
-                subscription.package.name,
-                subscription.status.title(),
-                subscription.start_date.strftime('%Y-%m-%d'),
-                subscription.end_date.strftime('%Y-%m-%d'),
-                f"{subscription.consultations_used}/{subscription.package.consultation_limit}"
-            ])
-        
-        # Create table
-        table = Table(data)
-        table.setStyle(TableStyle([
+        # One style shared by every table chunk
+        table_style = TableStyle([
             ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
@@ -4504,9 +4648,28 @@ class PackagePaymentTrackerViewSet(viewsets.ViewSet):
             ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
             ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
             ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        ])
         
-        elements.append(table)
+        values = queryset.annotate(full_name=self.PATIENT_FULL_NAME).values(
+            'full_name', 'package__name', 'package__consultation_limit',
+            'status', 'start_date', 'end_date', 'consultations_used'
+        )
+        
+        def rows():
+            for row in values.iterator(chunk_size=500):
+                yield [
+                    row['full_name'],
+                    row['package__name'],
+                    row['status'].title(),
+                    row['start_date'].strftime('%Y-%m-%d'),
+                    row['end_date'].strftime('%Y-%m-%d'),
+                    f"{row['consultations_used']}/{row['package__consultation_limit']}"
+                ]
+        
+        elements.extend(pdf_table_chunks(
+            ['Patient Name', 'Package', 'Status', 'Start Date', 'End Date', 'Consultations'],
+            rows(), table_style
+        ))
         
         doc.build(elements)
         buffer.seek(0)
@@ -4523,6 +4686,26 @@ class RiskSegmentationViewSet(viewsets.ViewSet):
     """
     permission_classes = [permissions.IsAuthenticated]
     
+    # SQL version of _normalize_risk_level, so levels can be grouped in the database
+    NORMALIZED_RISK_LEVEL = Case(
+        When(Q(risk_level__iexact='critical') | Q(risk_level__iexact='severe'), then=Value('severe')),
+        When(risk_level__iexact='high', then=Value('high')),
+        default=Value('moderate'),
+        output_field=CharField()
+    )
+    
+    # Stored risk levels grouped under each normalized level, and the inverse lookup
+    RISK_LEVEL_GROUPS = {
+        'severe': ['critical', 'severe'],
+        'high': ['high'],
+        'moderate': ['medium', 'moderate', 'low'],
+    }
+    NORMALIZED_BY_RISK_LEVEL = {
+        risk_level: normalized
+        for normalized, risk_levels in RISK_LEVEL_GROUPS.items()
+        for risk_level in risk_levels
+    }
+    
     @swagger_auto_schema(
         operation_description="Get risk segmentation summary with distribution statistics",
         manual_parameters=[
@@ -4546,21 +4729,28 @@ class RiskSegmentationViewSet(viewsets.ViewSet):
         """
         Get risk segmentation summary statistics
         """
-        from django.db.models import Count, Case, When, F, Max
-        from django.db import models
-        from datetime import datetime
-        
-        # Base queryset - get latest appointments per patient
+        serializer = RiskSegmentationSummarySerializer(data=self._compute_summary(**self._filter_params(request)))
+        serializer.is_valid()
+        return Response(serializer.data)
+    
+    def _filter_params(self, request):
+        """
+        The county and date filters shared by every risk segmentation endpoint
+        """
+        return {
+            'county': request.query_params.get('county'),
+            'date_from': request.query_params.get('date_from'),
+            'date_to': request.query_params.get('date_to'),
+        }
+    
+    def _filter_appointments(self, county=None, date_from=None, date_to=None):
+        """
+        Appointments with a risk level, narrowed by the county and date filters.
+        Returns the queryset and the date range that was applied.
+        """
         appointments = Appointment.objects.filter(
             risk_level__isnull=False
-        ).exclude(risk_level='').select_related(
-            'patient__user', 'healthcare_facility'
-        )
-        
-        # Apply filters
-        county = request.query_params.get('county')
-        date_from = request.query_params.get('date_from')
-        date_to = request.query_params.get('date_to')
+        ).exclude(risk_level='')
         
         date_range = {}
         
@@ -4586,30 +4776,24 @@ class RiskSegmentationViewSet(viewsets.ViewSet):
             except ValueError:
                 pass
         
-        # Get latest appointment per patient to avoid duplicates
-        latest_appointments = appointments.values('patient_id').annotate(
-            latest_date=models.Max('appointment_date')
-        )
+        return appointments, date_range
+    
+    def _compute_summary(self, county=None, date_from=None, date_to=None):
+        """
+        Patient counts and percentages per normalized risk level
+        """
+        appointments, date_range = self._filter_appointments(county, date_from, date_to)
         
-        # Filter appointments to only include the latest per patient
-        filtered_appointments = appointments.filter(
-            models.Q(patient_id__in=[item['patient_id'] for item in latest_appointments])
+        # Count each patient's latest appointment once, grouped by normalized risk level
+        latest_appointments = self._latest_per_patient(appointments)
+        risk_counts = dict(
+            Appointment.objects.filter(pk__in=latest_appointments.values('pk'))
+            .annotate(risk_bucket=self.NORMALIZED_RISK_LEVEL)
+            .order_by()
+            .values_list('risk_bucket')
+            .annotate(patient_count=Count('pk'))
         )
-        
-        # For each patient, get their most recent appointment
-        patient_risk_data = {}
-        for appointment in filtered_appointments.order_by('patient_id', '-appointment_date'):
-            if appointment.patient_id not in patient_risk_data:
-                patient_risk_data[appointment.patient_id] = appointment.risk_level
-        
-        # Count risk levels
-        risk_counts = {}
-        total_patients = len(patient_risk_data)
-        
-        for risk_level in patient_risk_data.values():
-            # Normalize risk levels to match design (severe, high, moderate)
-            normalized_risk = self._normalize_risk_level(risk_level)
-            risk_counts[normalized_risk] = risk_counts.get(normalized_risk, 0) + 1
+        total_patients = sum(risk_counts.values())
         
         # Calculate percentages and create distribution
         distribution = []
@@ -4623,37 +4807,38 @@ class RiskSegmentationViewSet(viewsets.ViewSet):
                 'percentage': percentage
             })
         
-        # Prepare response data
-        response_data = {
+        summary_data = {
             'total_patients': total_patients,
             'distribution': distribution
         }
         
         if date_range:
-            response_data['date_range'] = date_range
+            summary_data['date_range'] = date_range
         if county:
-            response_data['county_filter'] = county
+            summary_data['county_filter'] = county
         
-        serializer = RiskSegmentationSummarySerializer(data=response_data)
-        serializer.is_valid()
-        return Response(serializer.data)
+        return summary_data
+    
+    def _latest_per_patient(self, appointments):
+        """
+        Keep only each patient's most recent appointment, selected in the database
+        """
+        if connection.features.can_distinct_on_fields:
+            # PostgreSQL: DISTINCT ON (patient_id) keeps the first row per patient
+            return appointments.order_by('patient_id', '-appointment_date', '-start_time').distinct('patient_id')
+        return appointments.annotate(
+            patient_row=Window(
+                RowNumber(),
+                partition_by=F('patient_id'),
+                order_by=[F('appointment_date').desc(), F('start_time').desc()]
+            )
+        ).filter(patient_row=1).order_by('patient_id')
     
     def _normalize_risk_level(self, risk_level):
         """
         Normalize risk levels to match the design requirements
         """
-        if not risk_level:
-            return 'moderate'
-        
-        risk_level = risk_level.lower()
-        if risk_level in ['critical', 'severe']:
-            return 'severe'
-        elif risk_level in ['high']:
-            return 'high' 
-        elif risk_level in ['medium', 'moderate', 'low']:
-            return 'moderate'
-        else:
-            return 'moderate'
+        return self.NORMALIZED_BY_RISK_LEVEL.get((risk_level or '').lower(), 'moderate')
     
     @swagger_auto_schema(
         operation_description="Get list of patients by risk level",
@@ -4684,58 +4869,23 @@ class RiskSegmentationViewSet(viewsets.ViewSet):
         """
         Get list of patients filtered by risk level
         """
-        from datetime import datetime
-        
         risk_level = request.query_params.get('risk_level')
         if not risk_level:
             return Response({
                 'error': 'risk_level parameter is required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Base queryset
-        appointments = Appointment.objects.filter(
-            risk_level__isnull=False
-        ).exclude(risk_level='').select_related(
+        appointments, _ = self._filter_appointments(**self._filter_params(request))
+        appointments = appointments.select_related(
             'patient__user', 'doctor__user', 'healthcare_facility'
         )
         
-        # Apply filters
-        county = request.query_params.get('county')
-        date_from = request.query_params.get('date_from')
-        date_to = request.query_params.get('date_to')
-        
-        if county:
-            appointments = appointments.filter(
-                Q(healthcare_facility__city__icontains=county) |
-                Q(patient__user__address__icontains=county)
-            )
-        
-        if date_from:
-            try:
-                date_from_parsed = datetime.strptime(date_from, '%Y-%m-%d').date()
-                appointments = appointments.filter(appointment_date__gte=date_from_parsed)
-            except ValueError:
-                pass
-        
-        if date_to:
-            try:
-                date_to_parsed = datetime.strptime(date_to, '%Y-%m-%d').date()
-                appointments = appointments.filter(appointment_date__lte=date_to_parsed)
-            except ValueError:
-                pass
-        
         # Filter by risk level - handle both original and normalized values
         risk_level_filters = self._get_risk_level_filters(risk_level)
         appointments = appointments.filter(risk_level__in=risk_level_filters)
         
         # Get latest appointment per patient
-        patient_latest_appointments = {}
-        for appointment in appointments.order_by('patient_id', '-appointment_date'):
-            if appointment.patient_id not in patient_latest_appointments:
-                patient_latest_appointments[appointment.patient_id] = appointment
-        
-        # Convert to list and apply pagination
-        latest_appointments = list(patient_latest_appointments.values())
+        latest_appointments = self._latest_per_patient(appointments)
         
         # Serialize and return
         serializer = PatientRiskListSerializer(latest_appointments, many=True)
@@ -4745,12 +4895,7 @@ class RiskSegmentationViewSet(viewsets.ViewSet):
         """
         Get list of original risk levels that map to the normalized level
         """
-        mapping = {
-            'severe': ['critical', 'severe'],
-            'high': ['high'],
-            'moderate': ['medium', 'moderate', 'low']
-        }
-        return mapping.get(normalized_risk_level.lower(), [])
+        return self.RISK_LEVEL_GROUPS.get(normalized_risk_level.lower(), [])
     
     @swagger_auto_schema(
         operation_description="Export risk segmentation data to PDF",
@@ -4778,12 +4923,10 @@ class RiskSegmentationViewSet(viewsets.ViewSet):
         from reportlab.lib.pagesizes import letter
         from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
         from reportlab.lib.styles import getSampleStyleSheet
-        from datetime import datetime
         import io
         
         # Get the summary data
-        summary_response = self.summary(request)
-        summary_data = summary_response.data
+        summary_data = self._compute_summary(**self._filter_params(request))
         
         # Create PDF buffer
         buffer = io.BytesIO()
@@ -4870,24 +5013,17 @@ class RiskSegmentationViewSet(viewsets.ViewSet):
         """
         Export risk segmentation detailed data to CSV
         """
-        import csv
-        from django.http import HttpResponse
-        from datetime import datetime
-        
-        # Get all patients data for each risk level
-        all_patients = []
-        for risk_level in ['severe', 'high', 'moderate']:
-            # Create a new request with the risk_level parameter
-            modified_params = request.query_params.copy()
-            modified_params['risk_level'] = risk_level
-            
-            # Temporarily modify the request to get patients for each risk level
-            request.query_params = modified_params
-            patients_response = self.patients(request)
-            
-            if patients_response.status_code == 200:
-                for patient_data in patients_response.data:
-                    all_patients.append(patient_data)
+        # Each patient's latest appointment, fetched once and grouped by risk level
+        appointments, _ = self._filter_appointments(**self._filter_params(request))
+        latest_appointments = self._latest_per_patient(appointments.select_related(
+            'patient__user', 'doctor__user', 'healthcare_facility'
+        ))
+        grouped = {'severe': [], 'high': [], 'moderate': []}
+        for appointment in latest_appointments:
+            grouped[self._normalize_risk_level(appointment.risk_level)].append(appointment)
+        all_patients = PatientRiskListSerializer(
+            grouped['severe'] + grouped['high'] + grouped['moderate'], many=True
+        ).data
         
         # Create CSV response
         response = HttpResponse(content_type='text/csv')
@@ -4942,15 +5078,15 @@ class TeleconsultationLogViewSet(viewsets.ModelViewSet):
         ).all()
         
         # Role-based filtering
-        if self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists():
+        if self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set:
             pass
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='doctor').exists():
+        elif self.request.user.is_authenticated and 'doctor' in self.request.user.role_name_set:
             try:
                 doctor = self.request.user.doctor
                 queryset = queryset.filter(appointment__doctor=doctor)
             except Doctor.DoesNotExist:
                 return Consultation.objects.none()
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='patient').exists():
+        elif self.request.user.is_authenticated and 'patient' in self.request.user.role_name_set:
             try:
                 patient = self.request.user.patient
                 queryset = queryset.filter(appointment__patient=patient)
@@ -4969,7 +5105,7 @@ class TeleconsultationLogViewSet(viewsets.ModelViewSet):
             
         clinic_name = self.request.query_params.get('clinic')
         if clinic_name:
-            queryset = queryset.filter(appointment__healthcare__name__icontains=clinic_name)
+            queryset = queryset.filter(appointment__healthcare_facility__name__icontains=clinic_name)
             
         consultation_type = self.request.query_params.get('consultation_type')
         if consultation_type:
@@ -4980,21 +5116,13 @@ class TeleconsultationLogViewSet(viewsets.ModelViewSet):
             elif consultation_type.lower() == 'missed':
                 queryset = queryset.filter(status='missed')
                 
-        date_from = self.request.query_params.get('date_from')
+        date_from = parse_date_param(self.request, 'date_from')
         if date_from:
-            try:
-                date_from = datetime.strptime(date_from, '%Y-%m-%d').date()
-                queryset = queryset.filter(appointment__appointment_date__gte=date_from)
-            except ValueError:
-                pass
+            queryset = queryset.filter(appointment__appointment_date__gte=date_from)
                 
-        date_to = self.request.query_params.get('date_to')
+        date_to = parse_date_param(self.request, 'date_to')
         if date_to:
-            try:
-                date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
-                queryset = queryset.filter(appointment__appointment_date__lte=date_to)
-            except ValueError:
-                pass
+            queryset = queryset.filter(appointment__appointment_date__lte=date_to)
                 
         return queryset.order_by('-appointment__appointment_date', '-start_time')
     
@@ -5005,13 +5133,21 @@ class TeleconsultationLogViewSet(viewsets.ModelViewSet):
         include_summary = request.query_params.get('summary', 'false').lower() == 'true'
         
         if include_summary:
-            # Calculate summary statistics
-            total_consultations = queryset.count()
-            completed_consultations = queryset.filter(status='completed').count()
-            missed_consultations = queryset.filter(status='missed').count()
-            upcoming_consultations = queryset.filter(status='scheduled').count()
-            in_progress_consultations = queryset.filter(status='in-progress').count()
-            cancelled_consultations = queryset.filter(status='cancelled').count()
+            # Calculate summary statistics in a single query
+            counts = queryset.aggregate(
+                total=Count('id'),
+                completed=Count('id', filter=Q(status='completed')),
+                missed=Count('id', filter=Q(status='missed')),
+                upcoming=Count('id', filter=Q(status='scheduled')),
+                in_progress=Count('id', filter=Q(status='in-progress')),
+                cancelled=Count('id', filter=Q(status='cancelled')),
+            )
+            total_consultations = counts['total']
+            completed_consultations = counts['completed']
+            missed_consultations = counts['missed']
+            upcoming_consultations = counts['upcoming']
+            in_progress_consultations = counts['in_progress']
+            cancelled_consultations = counts['cancelled']
             
             # Calculate rates
             completion_rate = (completed_consultations / total_consultations * 100) if total_consultations > 0 else 0
@@ -5028,8 +5164,8 @@ class TeleconsultationLogViewSet(viewsets.ModelViewSet):
                 'miss_rate': round(miss_rate, 1)
             }
             
-            # Get paginated results
-            page = self.paginate_queryset(queryset)
+            # Get paginated results, reusing the summary total instead of counting again
+            page = self.paginator.paginate_queryset(queryset, request, view=self, count=counts['total'])
             if page is not None:
                 serializer = self.get_serializer(page, many=True)
                 paginated_response = self.get_paginated_response(serializer.data)
@@ -5069,13 +5205,19 @@ class TeleconsultationLogViewSet(viewsets.ModelViewSet):
         """
         queryset = self.get_queryset()
         
-        total = queryset.count()
-        completed = queryset.filter(status='completed').count()
-        missed = queryset.filter(status='missed').count()
-        upcoming = queryset.filter(
-            status__in=['scheduled', 'in-progress'],
-            appointment__appointment_date__gte=timezone.now().date()
-        ).count()
+        counts = queryset.aggregate(
+            total=Count('id'),
+            completed=Count('id', filter=Q(status='completed')),
+            missed=Count('id', filter=Q(status='missed')),
+            upcoming=Count('id', filter=Q(
+                status__in=['scheduled', 'in-progress'],
+                appointment__appointment_date__gte=timezone.now().date()
+            )),
+        )
+        total = counts['total']
+        completed = counts['completed']
+        missed = counts['missed']
+        upcoming = counts['upcoming']
         
         completion_rate = (completed / total * 100) if total > 0 else 0
         miss_rate = (missed / total * 100) if total > 0 else 0
@@ -5104,6 +5246,14 @@ class TeleconsultationLogViewSet(viewsets.ModelViewSet):
         """
         Export teleconsultation logs to PDF
         """
+        return cached_pdf_response(
+            request, 'teleconsultation', 'teleconsultation_logs.pdf', lambda: self._build_pdf(request)
+        )
+    
+    def _build_pdf(self, request):
+        """
+        Render the teleconsultation log report for the filtered queryset
+        """
         from reportlab.lib.pagesizes import letter, A4
         from reportlab.lib import colors
         from reportlab.lib.units import inch
@@ -5130,23 +5280,8 @@ class TeleconsultationLogViewSet(viewsets.ModelViewSet):
         elements.append(Paragraph("Teleconsultation Log Report", title_style))
         elements.append(Spacer(1, 20))
         
-        # Table data
-        data = [['Date', 'Time', 'Patient', 'Doctor', 'Clinic', 'Type', 'Status']]
-        
-        for consultation in queryset:
-            appointment = consultation.appointment
-            data.append([
-                str(appointment.appointment_date),
-                str(appointment.start_time) if appointment.start_time else 'N/A',
-                f"{appointment.patient.user.first_name} {appointment.patient.user.last_name}",
-                f"Dr. {appointment.doctor.user.first_name} {appointment.doctor.user.last_name}",
-                appointment.healthcare.name,
-                appointment.appointment_type.title(),
-                consultation.status.title()
-            ])
-        
-        table = Table(data)
-        table.setStyle(TableStyle([
+        # One style shared by every table chunk
+        table_style = TableStyle([
             ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
@@ -5155,16 +5290,27 @@ class TeleconsultationLogViewSet(viewsets.ModelViewSet):
             ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
             ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
             ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        ])
         
-        elements.append(table)
+        def rows():
+            for consultation in queryset.iterator(chunk_size=1000):
+                appointment = consultation.appointment
+                yield [
+                    str(appointment.appointment_date),
+                    str(appointment.start_time) if appointment.start_time else 'N/A',
+                    f"{appointment.patient.user.first_name} {appointment.patient.user.last_name}",
+                    f"Dr. {appointment.doctor.user.first_name} {appointment.doctor.user.last_name}",
+                    appointment.healthcare_facility.name if appointment.healthcare_facility else 'N/A',
+                    appointment.appointment_type.title(),
+                    consultation.status.title()
+                ]
+        
+        elements.extend(pdf_table_chunks(
+            ['Date', 'Time', 'Patient', 'Doctor', 'Clinic', 'Type', 'Status'], rows(), table_style
+        ))
         doc.build(elements)
-        buffer.seek(0)
         
-        response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="teleconsultation_logs.pdf"'
-        
-        return response
+        return buffer.getvalue()
     
     @swagger_auto_schema(
         operation_description="Export teleconsultation logs to CSV"
@@ -5174,35 +5320,31 @@ class TeleconsultationLogViewSet(viewsets.ModelViewSet):
         """
         Export teleconsultation logs to CSV
         """
-        import csv
-        
         queryset = self.get_queryset()
         
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="teleconsultation_logs.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Date', 'Time', 'Patient', 'Doctor', 'Clinic', 'Type', 'Status', 'Duration'])
-        
-        for consultation in queryset:
-            appointment = consultation.appointment
-            duration = ""
-            if consultation.start_time and consultation.end_time:
-                duration_delta = consultation.end_time - consultation.start_time
-                duration = str(duration_delta)
-                
-            writer.writerow([
-                appointment.appointment_date,
-                appointment.start_time or 'N/A',
-                f"{appointment.patient.user.first_name} {appointment.patient.user.last_name}",
-                f"Dr. {appointment.doctor.user.first_name} {appointment.doctor.user.last_name}",
-                appointment.healthcare.name,
-                appointment.appointment_type.title(),
-                consultation.status.title(),
-                duration
-            ])
-        
-        return response
+        def rows():
+            # Fetch in chunks so memory stays flat however many consultations match
+            for consultation in queryset.iterator(chunk_size=2000):
+                appointment = consultation.appointment
+                duration = ""
+                if consultation.start_time and consultation.end_time:
+                    duration_delta = consultation.end_time - consultation.start_time
+                    duration = str(duration_delta)
+                    
+                yield [
+                    appointment.appointment_date,
+                    appointment.start_time or 'N/A',
+                    f"{appointment.patient.user.first_name} {appointment.patient.user.last_name}",
+                    f"Dr. {appointment.doctor.user.first_name} {appointment.doctor.user.last_name}",
+                    appointment.healthcare_facility.name if appointment.healthcare_facility else 'N/A',
+                    appointment.appointment_type.title(),
+                    consultation.status.title(),
+                    duration
+                ]
+        
+        return streaming_csv_response('teleconsultation_logs.csv', [
+            'Date', 'Time', 'Patient', 'Doctor', 'Clinic', 'Type', 'Status', 'Duration'
+        ], rows())
 
 
 class FollowUpComplianceViewSet(viewsets.ReadOnlyModelViewSet):
@@ -5222,15 +5364,15 @@ class FollowUpComplianceViewSet(viewsets.ReadOnlyModelViewSet):
         ).all()
         
         # Role-based filtering
-        if self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists():
+        if self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set:
             pass
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='doctor').exists():
+        elif self.request.user.is_authenticated and 'doctor' in self.request.user.role_name_set:
             try:
                 doctor = self.request.user.doctor
                 queryset = queryset.filter(doctor=doctor)
             except Doctor.DoesNotExist:
                 return Appointment.objects.none()
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='patient').exists():
+        elif self.request.user.is_authenticated and 'patient' in self.request.user.role_name_set:
             try:
                 patient = self.request.user.patient
                 queryset = queryset.filter(patient=patient)
@@ -5272,20 +5414,23 @@ class FollowUpComplianceViewSet(viewsets.ReadOnlyModelViewSet):
         include_summary = request.query_params.get('summary', 'false').lower() == 'true'
         
         if include_summary:
-            # Calculate summary statistics
-            total_appointments = queryset.count()
-            fulfilled_appointments = queryset.filter(status='fulfilled').count()
-            missed_appointments = queryset.filter(status='noshow').count()
-            pending_appointments = queryset.filter(status='scheduled').count()
+            # Calculate summary statistics in a single query
+            counts = queryset.aggregate(
+                total=Count('id'),
+                fulfilled=Count('id', filter=Q(status='fulfilled')),
+                missed=Count('id', filter=Q(status='noshow')),
+                pending=Count('id', filter=Q(status='scheduled')),
+                # Critical non-compliant patients
+                critical=Count('patient', filter=Q(risk_level__in=['high', 'severe'], status='noshow'), distinct=True),
+            )
+            total_appointments = counts['total']
+            fulfilled_appointments = counts['fulfilled']
+            missed_appointments = counts['missed']
+            pending_appointments = counts['pending']
+            critical_non_compliant = counts['critical']
             
             compliance_rate = (fulfilled_appointments / total_appointments * 100) if total_appointments > 0 else 0
             
-            # Critical non-compliant patients
-            critical_non_compliant = queryset.filter(
-                risk_level__in=['high', 'severe'],
-                status='noshow'
-            ).values('patient').distinct().count()
-            
             summary = {
                 'total_appointments': total_appointments,
                 'fulfilled_appointments': fulfilled_appointments,
@@ -5295,8 +5440,8 @@ class FollowUpComplianceViewSet(viewsets.ReadOnlyModelViewSet):
                 'critical_non_compliant_patients': critical_non_compliant
             }
             
-            # Get paginated results
-            page = self.paginate_queryset(queryset)
+            # Get paginated results, reusing the summary total instead of counting again
+            page = self.paginator.paginate_queryset(queryset, request, view=self, count=counts['total'])
             if page is not None:
                 serializer = self.get_serializer(page, many=True)
                 paginated_response = self.get_paginated_response(serializer.data)
@@ -5335,24 +5480,27 @@ class FollowUpComplianceViewSet(viewsets.ReadOnlyModelViewSet):
         """
         queryset = self.get_queryset()
         
-        total_patients = queryset.values('patient').distinct().count()
-        missed_appointments = queryset.filter(status='noshow').count()
-        
-        # Count medication-related missed follow-ups (based on notes containing medication keywords)
-        missed_med_reminders = queryset.filter(
-            Q(notes__icontains='medication') | Q(notes__icontains='prescription'),
-            status='noshow'
-        ).count()
-        
-        # Critical non-compliant (high/severe risk patients with missed appointments)
-        critical_non_compliant = queryset.filter(
-            risk_level__in=['high', 'severe'],
-            status='noshow'
-        ).values('patient').distinct().count()
+        counts = queryset.aggregate(
+            total_patients=Count('patient', distinct=True),
+            missed=Count('id', filter=Q(status='noshow')),
+            # Medication-related missed follow-ups (based on notes containing medication keywords)
+            missed_med=Count('id', filter=Q(
+                Q(notes__icontains='medication') | Q(notes__icontains='prescription'),
+                status='noshow'
+            )),
+            # Critical non-compliant (high/severe risk patients with missed appointments)
+            critical=Count('patient', filter=Q(risk_level__in=['high', 'severe'], status='noshow'), distinct=True),
+            total=Count('id'),
+            fulfilled=Count('id', filter=Q(status='fulfilled')),
+        )
+        total_patients = counts['total_patients']
+        missed_appointments = counts['missed']
+        missed_med_reminders = counts['missed_med']
+        critical_non_compliant = counts['critical']
         
         # Calculate compliance rate
-        total_appointments = queryset.count()
-        fulfilled_appointments = queryset.filter(status='fulfilled').count()
+        total_appointments = counts['total']
+        fulfilled_appointments = counts['fulfilled']
         compliance_rate = (fulfilled_appointments / total_appointments * 100) if total_appointments > 0 else 0
         
         return Response({
@@ -5379,38 +5527,28 @@ class FollowUpComplianceViewSet(viewsets.ReadOnlyModelViewSet):
         """
         queryset = self.get_queryset()
         
-        # Group by patient and calculate compliance metrics
-        patient_data = []
-        patient_appointments = {}
+        # Group by patient in SQL; the latest matching appointment supplies risk level and type
+        latest = queryset.filter(patient=OuterRef('patient')).order_by('-appointment_date', '-start_time')
+        patient_rows = queryset.order_by().values(
+            'patient', 'patient__user__first_name', 'patient__user__last_name', 'patient__user__email'
+        ).annotate(
+            missed_count=Count('id', filter=Q(status='noshow')),
+            latest_date=Max('appointment_date'),
+            latest_risk_level=Subquery(latest.values('risk_level')[:1]),
+            latest_appointment_type=Subquery(latest.values('appointment_type')[:1]),
+        ).order_by('-latest_date')
         
-        for appointment in queryset:
-            patient_id = appointment.patient.id
-            if patient_id not in patient_appointments:
-                patient_appointments[patient_id] = {
-                    'patient': appointment.patient,
-                    'appointments': [],
-                    'missed_count': 0,
-                    'total_count': 0
-                }
-            
-            patient_appointments[patient_id]['appointments'].append(appointment)
-            patient_appointments[patient_id]['total_count'] += 1
-            
-            if appointment.status == 'noshow':
-                patient_appointments[patient_id]['missed_count'] += 1
-        
-        for patient_id, data in patient_appointments.items():
-            patient = data['patient']
-            latest_appointment = max(data['appointments'], key=lambda x: x.appointment_date)
-            
-            patient_data.append({
-                'patient_name': f"{patient.user.first_name} {patient.user.last_name}",
-                'phone': patient.user.email,  # Using email as phone not available
-                'risk_level': latest_appointment.risk_level,
-                'missed_count': data['missed_count'],
-                'follow_up_type': 'Appointment' if latest_appointment.appointment_type in ['follow-up', 'routine'] else 'Medication',
-                'status': 'Missed' if data['missed_count'] > 0 else 'Compliant'
-            })
+        patient_data = [
+            {
+                'patient_name': f"{row['patient__user__first_name']} {row['patient__user__last_name']}",
+                'phone': row['patient__user__email'],  # Using email as phone not available
+                'risk_level': row['latest_risk_level'],
+                'missed_count': row['missed_count'],
+                'follow_up_type': 'Appointment' if row['latest_appointment_type'] in ['follow-up', 'routine'] else 'Medication',
+                'status': 'Missed' if row['missed_count'] > 0 else 'Compliant'
+            }
+            for row in patient_rows
+        ]
         
         return Response(patient_data)
     
@@ -5422,6 +5560,14 @@ class FollowUpComplianceViewSet(viewsets.ReadOnlyModelViewSet):
         """
         Export follow-up compliance data to PDF
         """
+        return cached_pdf_response(
+            request, 'compliance', 'compliance_report.pdf', lambda: self._build_pdf(request)
+        )
+    
+    def _build_pdf(self, request):
+        """
+        Render the follow-up compliance report for the filtered patients
+        """
         from reportlab.lib.pagesizes import A4
         from reportlab.lib import colors
         from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -5448,20 +5594,8 @@ class FollowUpComplianceViewSet(viewsets.ReadOnlyModelViewSet):
         elements.append(Paragraph("Follow-Up Compliance Report", title_style))
         elements.append(Spacer(1, 20))
         
-        data = [['Patient Name', 'Phone', 'Risk Level', 'Missed Count', 'Follow-Up Type', 'Status']]
-        
-        for patient in patients_data:
-            data.append([
-                patient['patient_name'],
-                patient['phone'],
-                patient['risk_level'].title(),
-                str(patient['missed_count']),
-                patient['follow_up_type'],
-                patient['status']
-            ])
-        
-        table = Table(data)
-        table.setStyle(TableStyle([
+        # One style shared by every table chunk
+        table_style = TableStyle([
             ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
@@ -5470,16 +5604,27 @@ class FollowUpComplianceViewSet(viewsets.ReadOnlyModelViewSet):
             ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
             ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
             ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        ])
         
-        elements.append(table)
-        doc.build(elements)
-        buffer.seek(0)
+        rows = (
+            [
+                patient['patient_name'],
+                patient['phone'],
+                patient['risk_level'].title(),
+                str(patient['missed_count']),
+                patient['follow_up_type'],
+                patient['status']
+            ]
+            for patient in patients_data
+        )
         
-        response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="compliance_report.pdf"'
+        elements.extend(pdf_table_chunks(
+            ['Patient Name', 'Phone', 'Risk Level', 'Missed Count', 'Follow-Up Type', 'Status'],
+            rows, table_style
+        ))
+        doc.build(elements)
         
-        return response
+        return buffer.getvalue()
     
     @swagger_auto_schema(
         operation_description="Export compliance data to CSV"
@@ -5489,28 +5634,24 @@ class FollowUpComplianceViewSet(viewsets.ReadOnlyModelViewSet):
         """
         Export follow-up compliance data to CSV
         """
-        import csv
-        
         patients_response = self.patients(request)
         patients_data = patients_response.data
         
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="compliance_data.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Patient Name', 'Phone', 'Risk Level', 'Missed Count', 'Follow-Up Type', 'Status'])
-        
-        for patient in patients_data:
-            writer.writerow([
+        rows = (
+            [
                 patient['patient_name'],
                 patient['phone'],
                 patient['risk_level'].title(),
                 patient['missed_count'],
                 patient['follow_up_type'],
                 patient['status']
-            ])
+            ]
+            for patient in patients_data
+        )
         
-        return response
+        return streaming_csv_response('compliance_data.csv', [
+            'Patient Name', 'Phone', 'Risk Level', 'Missed Count', 'Follow-Up Type', 'Status'
+        ], rows)
 
 
 class EnhancedAppointmentListViewSet(viewsets.ReadOnlyModelViewSet):
@@ -5530,15 +5671,15 @@ class EnhancedAppointmentListViewSet(viewsets.ReadOnlyModelViewSet):
         ).all()
         
         # Role-based filtering
-        if self.request.user.is_authenticated and self.request.user.roles.filter(name='admin').exists():
+        if self.request.user.is_authenticated and 'admin' in self.request.user.role_name_set:
             pass
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='doctor').exists():
+        elif self.request.user.is_authenticated and 'doctor' in self.request.user.role_name_set:
             try:
                 doctor = self.request.user.doctor
                 queryset = queryset.filter(doctor=doctor)
             except Doctor.DoesNotExist:
                 return Appointment.objects.none()
-        elif self.request.user.is_authenticated and self.request.user.roles.filter(name='patient').exists():
+        elif self.request.user.is_authenticated and 'patient' in self.request.user.role_name_set:
             try:
                 patient = self.request.user.patient
                 queryset = queryset.filter(patient=patient)
@@ -5574,21 +5715,13 @@ class EnhancedAppointmentListViewSet(viewsets.ReadOnlyModelViewSet):
                 patient__patientsubscription__status='active'
             )
         
-        date_from = self.request.query_params.get('date_from')
+        date_from = parse_date_param(self.request, 'date_from')
         if date_from:
-            try:
-                date_from = datetime.strptime(date_from, '%Y-%m-%d').date()
-                queryset = queryset.filter(appointment_date__gte=date_from)
-            except ValueError:
-                pass
+            queryset = queryset.filter(appointment_date__gte=date_from)
                 
-        date_to = self.request.query_params.get('date_to')
+        date_to = parse_date_param(self.request, 'date_to')
         if date_to:
-            try:
-                date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
-                queryset = queryset.filter(appointment_date__lte=date_to)
-            except ValueError:
-                pass
+            queryset = queryset.filter(appointment_date__lte=date_to)
         
         return queryset.order_by('-appointment_date', '-start_time')
     
@@ -5790,7 +5923,7 @@ class PatientJournalViewSet(viewsets.ModelViewSet):
         queryset = PatientJournal.objects.all().order_by('-created_at')
 
         # If user is a patient, only show their journals
-        if hasattr(self.request.user, 'roles') and self.request.user.roles.filter(name='patient').exists():
+        if hasattr(self.request.user, 'roles') and 'patient' in self.request.user.role_name_set:
             try:
                 patient = Patient.objects.get(user=self.request.user)
                 queryset = queryset.filter(patient=patient)
@@ -5799,7 +5932,7 @@ class PatientJournalViewSet(viewsets.ModelViewSet):
         
         # Filter by patient_id if provided (for doctors/admins)
         patient_id = self.request.query_params.get('patient_id')
-        if patient_id and hasattr(self.request.user, 'roles') and self.request.user.roles.filter(name__in=['doctor', 'admin']).exists():
+        if patient_id and hasattr(self.request.user, 'roles') and not self.request.user.role_name_set.isdisjoint({'doctor', 'admin'}):
             queryset = queryset.filter(patient_id=patient_id)
         
         # Filter by tags
@@ -5815,7 +5948,7 @@ class PatientJournalViewSet(viewsets.ModelViewSet):
         """
         Automatically set the patient when creating a journal entry
         """
-        if self.request.user.roles.filter(name='patient').exists():
+        if 'patient' in self.request.user.role_name_set:
             try:
                 patient = Patient.objects.get(user=self.request.user)
                 serializer.save(patient=patient)
@@ -5845,7 +5978,7 @@ class PatientJournalViewSet(viewsets.ModelViewSet):
         Ensure patients can only update their own journals
         """
         journal = self.get_object()
-        if (self.request.user.roles.filter(name='patient').exists() and 
+        if ('patient' in self.request.user.role_name_set and 
             journal.patient.user != self.request.user):
             raise serializers.ValidationError("You can only edit your own journal entries")
         serializer.save()
@@ -5854,7 +5987,7 @@ class PatientJournalViewSet(viewsets.ModelViewSet):
         """
         Ensure patients can only delete their own journals
         """
-        if (self.request.user.roles.filter(name='patient').exists() and 
+        if ('patient' in self.request.user.role_name_set and 
             instance.patient.user != self.request.user):
             raise serializers.ValidationError("You can only delete your own journal entries")
         instance.delete()
@@ -1,6 +1,18 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import Paginator
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
 from collections import OrderedDict
+from functools import partial
+
+
+class KnownCountPaginator(Paginator):
+    """
+    Paginator that takes the total from the caller instead of running COUNT(*)
+    """
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.count = count
 
 
 class CustomPageNumberPagination(PageNumberPagination):
@@ -21,6 +33,11 @@ class CustomPageNumberPagination(PageNumberPagination):
     max_page_size = 100
     page_query_param = 'page'
 
+    def paginate_queryset(self, queryset, request, view=None, count=None):
+        # Views that already counted the queryset (e.g. for a summary) pass the total along
+        self.django_paginator_class = partial(KnownCountPaginator, count=count)
+        return super().paginate_queryset(queryset, request, view=view)
+
     def get_paginated_response(self, data):
         return Response(OrderedDict([
             ('count', self.page.paginator.count),
@@ -30,4 +47,33 @@ class CustomPageNumberPagination(PageNumberPagination):
             ('has_next', self.page.has_next()),
             ('has_previous', self.page.has_previous()),
             ('results', data)
-        ]))
\ No newline at end of file
+        ]))
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Cursor pagination over newest-first lists. Unlike page numbers it needs no
+    COUNT(*) of the whole result set, so large filtered lists stay cheap:
+    {
+        "next": url or null,
+        "previous": url or null,
+        "page_size": number,
+        "has_next": boolean,
+        "has_previous": boolean,
+        "results": []
+    }
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-created_at'
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('page_size', self.page_size),
+            ('has_next', self.has_next),
+            ('has_previous', self.has_previous),
+            ('results', data)
+        ]))
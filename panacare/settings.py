@@ -51,6 +51,7 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',  # Required for drf-yasg
     'corsheaders',
     'drf_yasg',
+    'django_filters',
     
     # Local apps
     'users',
@@ -318,6 +319,21 @@ TWILIO_API_KEY_SECRET = os.environ.get('TWILIO_API_KEY_SECRET', '')
 # Custom User model
 AUTH_USER_MODEL = 'users.User'
 
+# Cache configuration
+# Use a shared Redis cache when REDIS_URL is set so cached data is shared by all workers
+REDIS_URL = os.environ.get('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
+# Number of article views buffered in the cache before they are written to the database.
+# 1 writes every view straight away; batching needs the shared Redis cache above.
+ARTICLE_VIEW_FLUSH_THRESHOLD = int(os.environ.get('ARTICLE_VIEW_FLUSH_THRESHOLD', 10 if REDIS_URL else 1))
+
 # Pesapal Configuration
 PESAPAL_CONSUMER_KEY = os.environ.get('PESAPAL_CONSUMER_KEY', '')
 PESAPAL_CONSUMER_SECRET = os.environ.get('PESAPAL_CONSUMER_SECRET', '')
@@ -325,6 +341,11 @@ PESAPAL_SANDBOX = os.environ.get('PESAPAL_SANDBOX', 'True') == 'True'
 PESAPAL_CALLBACK_URL = os.environ.get('PESAPAL_CALLBACK_URL', 'http://localhost:3000/payment/callback')
 PESAPAL_IPN_URL = os.environ.get('PESAPAL_IPN_URL', 'https://your-domain.com/api/payments/pesapal/ipn')
 PESAPAL_IPN_ID = os.environ.get('PESAPAL_IPN_ID', '')
+# (connect, read) timeout in seconds so a slow gateway cannot hold a worker indefinitely
+PESAPAL_TIMEOUT = (
+    float(os.environ.get('PESAPAL_CONNECT_TIMEOUT', 3.05)),
+    float(os.environ.get('PESAPAL_READ_TIMEOUT', 10)),
+)
 
 # Frontend URL for payment callbacks
 FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0015_alter_user_profile_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='subscription_expires_at',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 09:05
+
+from django.db import migrations
+
+
+# Trigram indexes let PostgreSQL answer the icontains (ILIKE '%term%') searches on
+# patient names and phone numbers without scanning the whole user table
+CREATE_TRIGRAM_INDEXES_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+    "CREATE INDEX IF NOT EXISTS users_user_first_name_trgm ON users_user USING gin (first_name gin_trgm_ops);",
+    "CREATE INDEX IF NOT EXISTS users_user_last_name_trgm ON users_user USING gin (last_name gin_trgm_ops);",
+    "CREATE INDEX IF NOT EXISTS users_user_phone_number_trgm ON users_user USING gin (phone_number gin_trgm_ops);",
+]
+
+DROP_TRIGRAM_INDEXES_SQL = [
+    "DROP INDEX IF EXISTS users_user_first_name_trgm;",
+    "DROP INDEX IF EXISTS users_user_last_name_trgm;",
+    "DROP INDEX IF EXISTS users_user_phone_number_trgm;",
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    Index user names and phone numbers for substring search (PostgreSQL only)
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for statement in CREATE_TRIGRAM_INDEXES_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    """
+    Remove the trigram indexes (reverse migration)
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for statement in DROP_TRIGRAM_INDEXES_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0016_patient_subscription_expires_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -9,6 +9,7 @@ from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
 from django.db.models.signals import m2m_changed
 from django.dispatch import receiver
+from django.utils.functional import cached_property
 import uuid
 
 class Role(models.Model):
@@ -54,6 +55,14 @@ class User(AbstractUser):
     
     def __str__(self):
         return self.email
+
+    @cached_property
+    def role_name_set(self):
+        """
+        Names of the roles assigned to this user, loaded once per instance.
+        Stored as a frozenset so membership checks are O(1).
+        """
+        return frozenset(self.roles.values_list('name', flat=True))
     
     def send_activation_email(self, domain):
         """
@@ -199,6 +208,10 @@ class Patient(models.Model):
     # CHP tracking
     created_by_chp = models.ForeignKey('CommunityHealthProvider', on_delete=models.SET_NULL, null=True, blank=True, related_name='created_patients')
     
+    # Latest end date of the patient's active subscriptions, kept in sync by
+    # the PatientSubscription signals in healthcare.models
+    subscription_expires_at = models.DateField(null=True, blank=True, db_index=True, editable=False)
+    
     # Metadata fields
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -679,6 +692,10 @@ def create_user_profile(sender, instance, action, pk_set, **kwargs):
     # Suppress unused parameter warnings - these are required by Django signal interface
     _ = sender, kwargs
 
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        # Drop the cached role names so the next check reloads them
+        instance.__dict__.pop('role_name_set', None)
+
     if action == 'post_add':
         # Check if any of the newly added roles is 'patient'
         patient_role_exists = Role.objects.filter(pk__in=pk_set, name='patient').exists()
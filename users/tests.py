@@ -1,3 +1,21 @@
 from django.test import TestCase
 
-# Create your tests here.
+from users.models import User, Role
+from users.serializers import UserSerializer
+
+
+class UserSerializerTests(TestCase):
+    def test_role_names_is_input_only(self):
+        """
+        Test that serialized users list their roles without echoing the role_names input field
+        """
+        user = User.objects.create_user(
+            username='patient',
+            email='patient@example.com',
+            password='password123'
+        )
+        user.roles.add(Role.objects.get_or_create(name='patient')[0])
+
+        data = UserSerializer(user).data
+        self.assertNotIn('role_names', data)
+        self.assertEqual([role['name'] for role in data['roles']], ['patient'])
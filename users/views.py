@@ -133,7 +133,7 @@ class IsAdminUser(permissions.BasePermission):
             return False
         
         # Check if user has admin role
-        return request.user.roles.filter(name='admin').exists()
+        return 'admin' in request.user.role_name_set
         
 class IsAdminOrDoctor(permissions.BasePermission):
     """
@@ -145,7 +145,7 @@ class IsAdminOrDoctor(permissions.BasePermission):
             return False
 
         # Check if user has admin or doctor role
-        return request.user.roles.filter(name__in=['admin', 'doctor']).exists()
+        return not request.user.role_name_set.isdisjoint({'admin', 'doctor'})
 
 class IsClinicianUser(permissions.BasePermission):
     """
@@ -157,7 +157,7 @@ class IsClinicianUser(permissions.BasePermission):
             return False
 
         # Check if user has clinician role and has a clinician profile
-        return request.user.roles.filter(name='clinician').exists() and hasattr(request.user, 'clinician')
+        return 'clinician' in request.user.role_name_set and hasattr(request.user, 'clinician')
 
 class IsClinicianOrDoctor(permissions.BasePermission):
     """
@@ -169,7 +169,7 @@ class IsClinicianOrDoctor(permissions.BasePermission):
             return False
 
         # Check if user has clinician or doctor role
-        return request.user.roles.filter(name__in=['clinician', 'doctor']).exists()
+        return not request.user.role_name_set.isdisjoint({'clinician', 'doctor'})
 
 class IsHealthcareProvider(permissions.BasePermission):
     """
@@ -181,7 +181,7 @@ class IsHealthcareProvider(permissions.BasePermission):
             return False
 
         # Check if user has doctor, clinician, or community_health_provider role
-        return request.user.roles.filter(name__in=['doctor', 'clinician', 'community_health_provider']).exists()
+        return not request.user.role_name_set.isdisjoint({'doctor', 'clinician', 'community_health_provider'})
 
 class IsAdminOrAuthenticated(permissions.BasePermission):
     """
@@ -194,7 +194,7 @@ class IsAdminOrAuthenticated(permissions.BasePermission):
             return False
         
         # Admin users can do anything
-        if request.user.roles.filter(name='admin').exists():
+        if 'admin' in request.user.role_name_set:
             return True
             
         # For safe methods (GET, HEAD, OPTIONS), any authenticated user can access
@@ -207,7 +207,7 @@ class IsAdminOrAuthenticated(permissions.BasePermission):
         
     def has_object_permission(self, request, view, obj):
         # Admin users can do anything
-        if request.user.roles.filter(name='admin').exists():
+        if 'admin' in request.user.role_name_set:
             return True
             
         # Allow users to manage their own data
@@ -226,7 +226,7 @@ class RoleListAPIView(APIView):
     
     def post(self, request):
         # Ensure only admin users can create roles
-        if not request.user.is_authenticated or not request.user.roles.filter(name='admin').exists():
+        if not request.user.is_authenticated or 'admin' not in request.user.role_name_set:
             return Response({"error": "Only administrators can create roles"}, status=status.HTTP_403_FORBIDDEN)
     
     def get(self, request):
@@ -384,7 +384,7 @@ class UserRegisterAPIView(APIView):
         if serializer.is_valid():
             user = serializer.save()
             
-            if user.roles.filter(name='patient').exists():
+            if 'patient' in user.role_name_set:
                 try:
                     patient = Patient.objects.get(user=user)
                     fhir_patient, fhir_json = create_fhir_patient(patient)
@@ -547,7 +547,7 @@ class UserLoginAPIView(APIView):
         role_specific_data = {}
         
         # If user is a patient, include patient profile data
-        if user.roles.filter(name='patient').exists():
+        if 'patient' in user.role_name_set:
             try:
                 # Get or create patient profile
                 patient, created = Patient.objects.get_or_create(user=user)
@@ -567,7 +567,7 @@ class UserLoginAPIView(APIView):
                 role_specific_data['patient'] = None
         
         # If user is a doctor, include doctor profile data
-        if user.roles.filter(name='doctor').exists():
+        if 'doctor' in user.role_name_set:
             try:
                 doctor = Doctor.objects.get(user=user)
                 doctor_serializer = DoctorSerializer(doctor)
@@ -576,7 +576,7 @@ class UserLoginAPIView(APIView):
                 role_specific_data['doctor'] = None
         
         # If user is a community health provider, include CHP profile data
-        if user.roles.filter(name='community_health_provider').exists():
+        if 'community_health_provider' in user.role_name_set:
             try:
                 # Get or create CHP profile
                 chp, created = CommunityHealthProvider.objects.get_or_create(user=user)
@@ -877,7 +877,7 @@ class PatientProfileAPIView(APIView):
     
     def get(self, request):
         # Check if user has patient role
-        if not request.user.roles.filter(name='patient').exists():
+        if 'patient' not in request.user.role_name_set:
             return Response({
                 'error': 'Only patients can access this endpoint'
             }, status=status.HTTP_403_FORBIDDEN)
@@ -910,7 +910,7 @@ class PatientProfileAPIView(APIView):
     
     def put(self, request):
         # Check if user has patient role
-        if not request.user.roles.filter(name='patient').exists():
+        if 'patient' not in request.user.role_name_set:
             return Response({
                 'error': 'Only patients can access this endpoint'
             }, status=status.HTTP_403_FORBIDDEN)
@@ -940,7 +940,7 @@ class PatientProfileAPIView(APIView):
     
     def patch(self, request):
         # Check if user has patient role
-        if not request.user.roles.filter(name='patient').exists():
+        if 'patient' not in request.user.role_name_set:
             return Response({
                 'error': 'Only patients can access this endpoint'
             }, status=status.HTTP_403_FORBIDDEN)
@@ -987,7 +987,7 @@ class UserProfileAPIView(APIView):
         }
         
         # Add role-specific profile data if available
-        if user.roles.filter(name='patient').exists():
+        if 'patient' in user.role_name_set:
             try:
                 # Get or create patient profile
                 patient, created = Patient.objects.get_or_create(user=user)
@@ -1006,7 +1006,7 @@ class UserProfileAPIView(APIView):
                 logger.error(f"Error accessing patient profile: {str(e)}")
                 response_data['patient_profile'] = None
         
-        if user.roles.filter(name='doctor').exists():
+        if 'doctor' in user.role_name_set:
             try:
                 doctor = Doctor.objects.get(user=user)
                 doctor_serializer = DoctorSerializer(doctor, context={'request': request})
@@ -3187,7 +3187,7 @@ class AdminCHPAssignmentAPIView(APIView):
 
     def post(self, request):
         # Check if user is admin
-        if not request.user.roles.filter(name='admin').exists():
+        if 'admin' not in request.user.role_name_set:
             return Response({
                 'error': 'Admin access required'
             }, status=status.HTTP_403_FORBIDDEN)
@@ -3272,8 +3272,8 @@ class CHPPatientMessageAPIView(APIView):
             chp_id = request.query_params.get('chp_id')
 
             # Check if user is CHP or patient
-            is_chp = user.roles.filter(name__in=['chp', 'community_health_provider']).exists()
-            is_patient = user.roles.filter(name='patient').exists()
+            is_chp = not user.role_name_set.isdisjoint({'chp', 'community_health_provider'})
+            is_patient = 'patient' in user.role_name_set
 
             if not (is_chp or is_patient):
                 return Response({
@@ -3326,8 +3326,8 @@ class CHPPatientMessageAPIView(APIView):
             data = request.data.copy()
 
             # Validate sender is either CHP or patient
-            is_chp = user.roles.filter(name__in=['chp', 'community_health_provider']).exists()
-            is_patient = user.roles.filter(name='patient').exists()
+            is_chp = not user.role_name_set.isdisjoint({'chp', 'community_health_provider'})
+            is_patient = 'patient' in user.role_name_set
 
             if not (is_chp or is_patient):
                 return Response({